@@ -6,7 +6,6 @@
 
 import os
 from dataclasses import dataclass
-from typing import Optional
 
 
 @dataclass
@@ -41,6 +40,11 @@ class APIConfigs:
     CHROMA_HOST = os.getenv("CHROMA_HOST", "chromadb")
     CHROMA_PORT = int(os.getenv("CHROMA_PORT", "8000"))
 
+    # ==================== 向量库 ====================
+    # chroma: 访问 chromadb 容器；local: 进程内向量库 (app/core/vector_store.py)
+    VECTOR_STORE_PROVIDER = os.getenv("VECTOR_STORE_PROVIDER", "chroma")
+    LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "data/vector_store")
+
     @classmethod
     def validate(cls) -> None:
         """验证所有必需的API配置是否存在"""
@@ -77,14 +81,24 @@ class APIConfigs:
         获取Mem0配置
         注意：Mem0的embedder使用OpenAI兼容接口，需要显式传入配置
         """
+        if cls.VECTOR_STORE_PROVIDER == "local":
+            # Mem0 不支持注册自定义向量库，先用嵌入式 Chroma (本地目录，不连服务端) 完成初始化，
+            # 再在 config.py 里替换成 LocalVectorStore
+            chroma_config = {
+                "collection_name": "family_memories",
+                "path": os.path.join(cls.LOCAL_VECTOR_STORE_PATH, "chroma_bootstrap"),
+            }
+        else:
+            chroma_config = {
+                "collection_name": "family_memories",
+                "host": cls.CHROMA_HOST,
+                "port": cls.CHROMA_PORT,
+            }
+
         return {
             "vector_store": {
                 "provider": "chroma",
-                "config": {
-                    "collection_name": "family_memories",
-                    "host": cls.CHROMA_HOST,
-                    "port": cls.CHROMA_PORT,
-                },
+                "config": chroma_config,
             },
             "embedder": {
                 "provider": "openai",
@@ -114,4 +128,7 @@ APIConfigs.validate()
 # 打印配置信息（调试用）
 print(f"✅ DeepSeek API: {APIConfigs.DEEPSEEK.base_url}")
 print(f"✅ 千问 Embedding: {APIConfigs.QWEN.base_url}")
-print(f"✅ ChromaDB: {APIConfigs.CHROMA_HOST}:{APIConfigs.CHROMA_PORT}")
+if APIConfigs.VECTOR_STORE_PROVIDER == "local":
+    print(f"✅ 本地向量库: {APIConfigs.LOCAL_VECTOR_STORE_PATH}")
+else:
+    print(f"✅ ChromaDB: {APIConfigs.CHROMA_HOST}:{APIConfigs.CHROMA_PORT}")
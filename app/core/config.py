@@ -6,12 +6,32 @@
 
 from mem0 import Memory
 from .api_config import APIConfigs
+from .embedding_cache import CachedEmbedder
 
 # 获取Mem0配置（通过统一配置模块）
 config = APIConfigs.get_mem0_config()
 
 print("正在初始化 Mem0 (DeepSeek LLM + 千问 Embedding + Chroma)...")
 m = Memory.from_config(config)
+
+# 进程内向量库：检索不再经过 chromadb 容器的网络往返
+if APIConfigs.VECTOR_STORE_PROVIDER == "local":
+    from .vector_store import LocalVectorStore
+
+    m.vector_store = LocalVectorStore(
+        collection_name=config["vector_store"]["config"]["collection_name"],
+        path=APIConfigs.LOCAL_VECTOR_STORE_PATH,
+        embedding_model_dims=config["embedder"]["config"]["embedding_dims"],
+    )
+    print(f"使用本地向量库: {m.vector_store.col_info()}")
+
+# Embedding 缓存：同样的文本不再重复请求千问
+embedder_config = config["embedder"]["config"]
+m.embedding_model = CachedEmbedder(
+    m.embedding_model,
+    model=embedder_config["model"],
+    dims=embedder_config["embedding_dims"],
+)
 print("Mem0 初始化完成！")
 
 # ==================== System Prompt ====================
@@ -0,0 +1,219 @@
+# app/core/embedding_cache.py
+"""
+Embedding 缓存
+包在 Mem0 的 embedder 外面，同样的文本不再重复请求千问 text-embedding-v3
+
+两级缓存：
+- 内存 LRU：进程内，最快
+- 磁盘 (SQLite 文件)：重启不丢，按 模型 + 维度 区分，换模型/维度自动不命中
+"""
+
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+from array import array
+from collections import OrderedDict
+from typing import List, Optional
+
+from app.core.metrics import metrics
+
+EMBEDDING_CACHE_PATH = os.getenv("EMBEDDING_CACHE_PATH", "data/embedding_cache.sqlite3")
+EMBEDDING_CACHE_MEMORY_ENTRIES = int(os.getenv("EMBEDDING_CACHE_MEMORY_ENTRIES", "4096"))
+# 批量 Embedding 每次请求的条数 (千问 text-embedding-v3 单次最多 10 条)
+EMBEDDING_BATCH_SIZE = int(os.getenv("EMBEDDING_BATCH_SIZE", "10"))
+
+
+class DiskEmbeddingStore:
+    """SQLite 文件存储，向量以 float32 二进制保存"""
+
+    def __init__(self, path: str):
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute(
+                """
+                CREATE TABLE IF NOT EXISTS embeddings (
+                    model TEXT NOT NULL,
+                    dims INTEGER NOT NULL,
+                    text_hash TEXT NOT NULL,
+                    vector BLOB NOT NULL,
+                    created_at REAL NOT NULL,
+                    PRIMARY KEY (model, dims, text_hash)
+                )
+                """
+            )
+            self._conn.commit()
+
+    def get(self, model: str, dims: int, text_hash: str) -> Optional[List[float]]:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT vector FROM embeddings WHERE model = ? AND dims = ? AND text_hash = ?",
+                (model, dims, text_hash),
+            ).fetchone()
+        if row is None:
+            return None
+        vector = array("f")
+        vector.frombytes(row[0])
+        return vector.tolist()
+
+    def set(self, model: str, dims: int, text_hash: str, vector: List[float]):
+        blob = array("f", vector).tobytes()
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?, ?, ?)",
+                (model, dims, text_hash, blob, time.time()),
+            )
+            self._conn.commit()
+
+
+class CachedEmbedder:
+    """
+    替换 Memory.embedding_model 使用，接口与 Mem0 的 embedder 一致 (embed)
+    其它属性全部透传给原 embedder
+    """
+
+    def __init__(
+        self,
+        inner,
+        model: str,
+        dims: int,
+        path: str = EMBEDDING_CACHE_PATH,
+        memory_entries: int = EMBEDDING_CACHE_MEMORY_ENTRIES,
+    ):
+        self.inner = inner
+        self.model = model
+        self.dims = dims
+        self.memory_entries = memory_entries
+        self._memory: "OrderedDict[str, List[float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        try:
+            self._disk: Optional[DiskEmbeddingStore] = DiskEmbeddingStore(path)
+        except Exception as e:
+            print(f"⚠️ Embedding 磁盘缓存不可用，只使用内存缓存: {e}")
+            self._disk = None
+
+    def __getattr__(self, name):
+        return getattr(self.inner, name)
+
+    @staticmethod
+    def text_hash(text: str) -> str:
+        return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+    def _remember(self, key: str, vector: List[float]):
+        with self._lock:
+            self._memory[key] = vector
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_entries:
+                self._memory.popitem(last=False)
+
+    def _lookup(self, key: str) -> Optional[List[float]]:
+        """查两级缓存，命中时记录节省的时间"""
+        with self._lock:
+            vector = self._memory.get(key)
+            if vector is not None:
+                self._memory.move_to_end(key)
+        if vector is not None:
+            metrics.inc("embedding_cache.hit_memory")
+        elif self._disk is not None:
+            try:
+                vector = self._disk.get(self.model, self.dims, key)
+            except Exception as e:
+                print(f"⚠️ 读取 Embedding 磁盘缓存失败: {e}")
+            if vector is not None:
+                metrics.inc("embedding_cache.hit_disk")
+                self._remember(key, vector)
+
+        if vector is not None:
+            # 按远程调用的平均耗时估算省下的时间
+            avg = self._avg_remote_latency()
+            if avg:
+                metrics.inc("embedding_cache.saved_seconds", avg)
+        return vector
+
+    def _store(self, key: str, vector: List[float]):
+        self._remember(key, vector)
+        if self._disk is not None:
+            try:
+                self._disk.set(self.model, self.dims, key, vector)
+            except Exception as e:
+                print(f"⚠️ 写入 Embedding 磁盘缓存失败: {e}")
+
+    def embed(self, text, memory_action: Optional[str] = None):
+        key = self.text_hash(text)
+        vector = self._lookup(key)
+        if vector is not None:
+            return vector
+
+        metrics.inc("embedding_cache.miss")
+        start = time.perf_counter()
+        if memory_action is None:
+            vector = self.inner.embed(text)
+        else:
+            vector = self.inner.embed(text, memory_action)
+        metrics.observe("embedding.remote", time.perf_counter() - start)
+
+        self._store(key, list(vector))
+        return vector
+
+    def embed_batch(self, texts: List[str], memory_action: Optional[str] = None) -> List[List[float]]:
+        """
+        批量 Embedding：先查缓存，未命中的按 EMBEDDING_BATCH_SIZE 合并成一次远程请求
+        返回顺序与 texts 一致
+        """
+        keys = [self.text_hash(text) for text in texts]
+        vectors = [self._lookup(key) for key in keys]
+        missing = [i for i, vector in enumerate(vectors) if vector is None]
+
+        for start in range(0, len(missing), EMBEDDING_BATCH_SIZE):
+            chunk = missing[start : start + EMBEDDING_BATCH_SIZE]
+            metrics.inc("embedding_cache.miss", len(chunk))
+            begin = time.perf_counter()
+            fresh = self._remote_batch([texts[i] for i in chunk], memory_action)
+            # 单独记批量请求的耗时，不影响单条的平均耗时 (用于估算缓存省下的时间)
+            metrics.observe("embedding.remote_batch", time.perf_counter() - begin)
+            for i, vector in zip(chunk, fresh):
+                vector = list(vector)
+                self._store(keys[i], vector)
+                vectors[i] = vector
+        return vectors
+
+    def _remote_batch(self, texts: List[str], memory_action: Optional[str]) -> List[List[float]]:
+        """OpenAI 兼容接口一次请求多条；拿不到 client 时退回逐条调用"""
+        client = getattr(self.inner, "client", None)
+        if client is None or not hasattr(client, "embeddings"):
+            if memory_action is None:
+                return [self.inner.embed(text) for text in texts]
+            return [self.inner.embed(text, memory_action) for text in texts]
+
+        response = client.embeddings.create(
+            input=[text.replace("\n", " ") for text in texts],
+            model=self.model,
+            dimensions=self.dims,
+        )
+        return [item.embedding for item in sorted(response.data, key=lambda item: item.index)]
+
+    @staticmethod
+    def _avg_remote_latency() -> float:
+        return metrics.average("embedding.remote")
+
+    def stats(self) -> dict:
+        hit_memory = metrics.get("embedding_cache.hit_memory")
+        hit_disk = metrics.get("embedding_cache.hit_disk")
+        miss = metrics.get("embedding_cache.miss")
+        total = hit_memory + hit_disk + miss
+        return {
+            "model": self.model,
+            "dims": self.dims,
+            "memory_entries": len(self._memory),
+            "hit_memory": hit_memory,
+            "hit_disk": hit_disk,
+            "miss": miss,
+            "hit_rate": (hit_memory + hit_disk) / total if total else 0.0,
+            "avg_remote_latency": self._avg_remote_latency(),
+            "saved_seconds": metrics.get("embedding_cache.saved_seconds"),
+        }
@@ -0,0 +1,85 @@
+# app/core/metrics.py
+"""
+进程内指标统计
+简单的计数器 + 耗时统计，通过 /debug/metrics 查看
+多 worker 部署时每个进程各自统计
+"""
+
+import threading
+from collections import defaultdict, deque
+from typing import Dict, Optional
+
+# 每个耗时指标保留最近多少个样本用于计算分位数
+TIMING_WINDOW = 500
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters: Dict[str, float] = defaultdict(float)
+        self._timings: Dict[str, dict] = {}
+
+    def inc(self, name: str, value: float = 1):
+        """计数器 +value"""
+        with self._lock:
+            self._counters[name] += value
+
+    def get(self, name: str) -> float:
+        """读取计数器当前值"""
+        with self._lock:
+            return self._counters.get(name, 0)
+
+    def observe(self, name: str, seconds: float):
+        """记录一次耗时 (秒)"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if timing is None:
+                timing = {
+                    "count": 0,
+                    "sum": 0.0,
+                    "max": 0.0,
+                    "recent": deque(maxlen=TIMING_WINDOW),
+                }
+                self._timings[name] = timing
+            timing["count"] += 1
+            timing["sum"] += seconds
+            timing["max"] = max(timing["max"], seconds)
+            timing["recent"].append(seconds)
+
+    def average(self, name: str) -> float:
+        """耗时平均值，没有样本时返回 0"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if not timing or not timing["count"]:
+                return 0.0
+            return timing["sum"] / timing["count"]
+
+    def percentile(self, name: str, q: float, min_samples: int = 1) -> Optional[float]:
+        """最近样本的分位数 (q 取 0~1)，样本数不足 min_samples 时返回 None"""
+        with self._lock:
+            timing = self._timings.get(name)
+            if not timing or len(timing["recent"]) < max(min_samples, 1):
+                return None
+            samples = sorted(timing["recent"])
+        index = min(len(samples) - 1, int(q * len(samples)))
+        return samples[index]
+
+    def snapshot(self) -> dict:
+        """导出所有指标 (给 /debug/metrics 用)"""
+        with self._lock:
+            counters = dict(self._counters)
+            timings = {
+                name: {
+                    "count": t["count"],
+                    "avg": t["sum"] / t["count"] if t["count"] else 0.0,
+                    "max": t["max"],
+                }
+                for name, t in self._timings.items()
+            }
+        for name in timings:
+            timings[name]["p95"] = self.percentile(name, 0.95)
+        return {"counters": counters, "timings": timings}
+
+
+# 全局单例
+metrics = Metrics()
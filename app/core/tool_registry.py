@@ -1,22 +1,47 @@
 # app/core/tool_registry.py
+import os
 import json
+import asyncio
+import inspect
 import functools
-from typing import Callable, Dict, List, Any
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Any, Optional, Union
+
+# 同步工具的执行线程池大小 (限制同时在跑的工具数量，避免打爆数据库连接池和 LLM 配额)
+TOOL_MAX_WORKERS = int(os.getenv("TOOL_MAX_WORKERS", "8"))
 
 
 class ToolRegistry:
     def __init__(self):
         self._tools: Dict[str, Callable] = {}
         self._schemas: List[Dict[str, Any]] = []
+        self._frozen_schemas: List[Dict[str, Any]] = None
+        self._templates: Dict[str, Union[str, Callable]] = {}
+        self._executor = ThreadPoolExecutor(
+            max_workers=TOOL_MAX_WORKERS, thread_name_prefix="tool"
+        )
 
-    def register(self, name: str, description: str, parameters: dict):
+    def register(
+        self,
+        name: str,
+        description: str,
+        parameters: dict,
+        response_template: Union[str, Callable, None] = None,
+    ):
         """
         装饰器：用于注册工具
+
+        response_template: 可选的回复模板，工具执行成功时直接用它生成给用户的回复，
+        不再让 LLM 二次组织语言。可以是
+        - 格式化字符串：用 {参数名} / {结果字段} 占位，例如 "好的，{message}"
+        - 函数 (result, args) -> str：返回 None 表示这次交给 LLM
         """
 
         def decorator(func: Callable):
             # 1. 注册函数本身
             self._tools[name] = func
+            if response_template is not None:
+                self._templates[name] = response_template
 
             # 2. 注册给 LLM 看的 Schema
             schema = {
@@ -28,6 +53,7 @@ class ToolRegistry:
                 },
             }
             self._schemas.append(schema)
+            self._frozen_schemas = None
 
             @functools.wraps(func)
             def wrapper(*args, **kwargs):
@@ -38,13 +64,41 @@ class ToolRegistry:
         return decorator
 
     def get_schemas(self):
-        """获取所有工具的 Schema 给 LLM"""
-        return self._schemas
+        """
+        获取所有工具的 Schema 给 LLM
+        按工具名排序、key 规范化后冻结：不受模块 import 顺序影响，
+        每次请求序列化出的字节完全一致，便于命中 LLM 的前缀缓存
+        (返回的是共享对象，调用方不要修改)
+        """
+        if self._frozen_schemas is None:
+            ordered = sorted(self._schemas, key=lambda s: s["function"]["name"])
+            canonical = json.dumps(ordered, ensure_ascii=False, sort_keys=True)
+            self._frozen_schemas = json.loads(canonical)
+        return self._frozen_schemas
 
     def get_tool(self, name: str):
         """获取工具函数"""
         return self._tools.get(name)
 
+    def render_response(self, name: str, args: dict, result: Any) -> Optional[str]:
+        """
+        用回复模板渲染工具结果
+        没有模板、工具没成功、或模板渲染不了时返回 None (交给 LLM 组织回复)
+        """
+        template = self._templates.get(name)
+        if template is None or not isinstance(result, dict):
+            return None
+        if "error" in result or result.get("status", "success") != "success":
+            return None
+
+        try:
+            if callable(template):
+                return template(result, args)
+            return template.format(**{**args, **result})
+        except (KeyError, IndexError, TypeError, ValueError) as e:
+            print(f"⚠️ 回复模板渲染失败: {name} -> {e}")
+            return None
+
     def execute(self, name: str, args: dict, context: dict = None):
         """
         执行工具
@@ -61,6 +115,27 @@ class ToolRegistry:
         except Exception as e:
             return f"Error executing tool '{name}': {str(e)}"
 
+    async def aexecute(self, name: str, args: dict, context: dict = None):
+        """
+        执行工具 (异步版本)
+        - async def 定义的工具直接 await
+        - 普通同步工具 (查库、调 Mem0) 放到专用线程池执行，避免阻塞事件循环
+        """
+        func = self.get_tool(name)
+        if not func:
+            return f"Error: Tool '{name}' not found."
+
+        try:
+            kwargs = {**args, **(context or {})}
+            if inspect.iscoroutinefunction(func):
+                return await func(**kwargs)
+            loop = asyncio.get_running_loop()
+            return await loop.run_in_executor(
+                self._executor, functools.partial(func, **kwargs)
+            )
+        except Exception as e:
+            return f"Error executing tool '{name}': {str(e)}"
+
 
 # 全局单例
 registry = ToolRegistry()
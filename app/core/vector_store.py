@@ -0,0 +1,543 @@
+# app/core/vector_store.py
+"""
+进程内向量库 (替代 Chroma 服务端)
+家庭规模的记忆量不大，m.search 的耗时主要花在访问 chromadb 容器的网络往返上，
+这里直接把向量放在本进程里算。
+
+存储 (目录 LOCAL_VECTOR_STORE_PATH 下)：
+- vectors.f32:    NumPy memmap，每行一个已归一化的 float32 向量，容量按 2 倍扩展
+- payloads.jsonl: 追加写的操作日志 (put / del)，启动时回放；向量先落盘，日志行是提交点
+- store.lock:     多进程互斥 (API 的多个 worker、outbox / reindex / compaction 等命令行进程共用一个目录)
+
+多进程：
+- 写操作持有排它文件锁 (fcntl.flock)，读操作持有共享锁
+- 每次拿到锁先和磁盘同步：日志变长了就回放新增的行，日志被替换 (压缩 / 清空) 了就整体重新加载，
+  所以新行号按同步后的行数分配，不会和其它进程撞行；其它进程写入的记忆也能马上搜到
+- 没有 fcntl 的平台 (Windows) 不加锁，只能单进程使用
+
+检索：
+- 默认精确检索：余弦相似度 = 归一化向量点积，argpartition 取 top-k
+- 向量数超过 LOCAL_VECTOR_IVF_MIN 后可调用 build_ivf() 建倒排聚类 (IVF)，
+  只在最近的 nprobe 个簇里找，属于近似检索
+- user_id / type / item_id 建了倒排索引，过滤先缩小候选集再算分
+
+实现 Mem0 VectorStoreBase 的接口 (search / insert / get / list / update / delete ...)，
+在 config.py 里替换 m.vector_store 使用
+"""
+
+import json
+import os
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+import numpy as np
+
+try:
+    import fcntl
+except ImportError:  # Windows：不支持多进程共用
+    fcntl = None
+
+LOCAL_VECTOR_STORE_PATH = os.getenv("LOCAL_VECTOR_STORE_PATH", "data/vector_store")
+LOCAL_VECTOR_IVF_MIN = int(os.getenv("LOCAL_VECTOR_IVF_MIN", "50000"))
+LOCAL_VECTOR_NPROBE = int(os.getenv("LOCAL_VECTOR_NPROBE", "8"))
+
+# 建倒排索引的 payload 字段
+INDEXED_FIELDS = ("user_id", "type", "item_id")
+
+_INITIAL_CAPACITY = 1024
+# 墓碑比例超过它时，启动时自动压缩
+_COMPACT_RATIO = 0.3
+
+
+@dataclass
+class OutputData:
+    """与 Mem0 各向量库返回的结构一致"""
+
+    id: Optional[str]
+    score: Optional[float]
+    payload: Optional[Dict]
+
+
+def _match(payload: dict, filters: Optional[dict]) -> bool:
+    """
+    检查 payload 是否满足过滤条件
+    支持等值、{"$eq"}、{"$ne"}、{"$in"}、{"$nin"}，以及 Mem0 的 AND / OR / $and / $or
+    """
+    if not filters:
+        return True
+    for key, cond in filters.items():
+        if key in ("AND", "$and"):
+            if not all(_match(payload, sub) for sub in cond):
+                return False
+        elif key in ("OR", "$or"):
+            if not any(_match(payload, sub) for sub in cond):
+                return False
+        elif isinstance(cond, dict):
+            value = payload.get(key)
+            for op, expected in cond.items():
+                if op == "$eq" and value != expected:
+                    return False
+                if op == "$ne" and value == expected:
+                    return False
+                if op == "$in" and value not in expected:
+                    return False
+                if op == "$nin" and value in expected:
+                    return False
+        elif cond == "*":
+            if key not in payload:
+                return False
+        elif payload.get(key) != cond:
+            return False
+    return True
+
+
+def _normalize(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return (vectors / norms).astype(np.float32)
+
+
+class LocalVectorStore:
+    def __init__(
+        self,
+        collection_name: str = "family_memories",
+        path: str = LOCAL_VECTOR_STORE_PATH,
+        embedding_model_dims: int = 1024,
+    ):
+        self.collection_name = collection_name
+        self.dims = embedding_model_dims
+        self.dir = os.path.join(path, collection_name)
+        self._lock = threading.RLock()
+        self._lock_depth = 0
+        self._lock_file = None
+        self._loaded = False
+        self.create_col(collection_name)
+
+    # --- 存储 ---
+
+    @property
+    def _vector_file(self) -> str:
+        return os.path.join(self.dir, "vectors.f32")
+
+    @property
+    def _log_file(self) -> str:
+        return os.path.join(self.dir, "payloads.jsonl")
+
+    @contextmanager
+    def _locked(self, exclusive: bool = True):
+        """
+        线程锁 + 文件锁 (可重入，只有最外层加文件锁)，加锁后先和磁盘同步
+        exclusive=False 用于只读操作 (多个进程可以同时检索)
+        """
+        with self._lock:
+            outer = self._lock_depth == 0
+            if outer and self._lock_file is not None:
+                fcntl.flock(self._lock_file, fcntl.LOCK_EX if exclusive else fcntl.LOCK_SH)
+            self._lock_depth += 1
+            try:
+                if outer:
+                    self._sync()
+                yield
+            finally:
+                self._lock_depth -= 1
+                if outer and self._lock_file is not None:
+                    fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+
+    def _open_lock_file(self):
+        if fcntl is None or self._lock_file is not None:
+            return
+        os.makedirs(self.dir, exist_ok=True)
+        self._lock_file = open(os.path.join(self.dir, "store.lock"), "a+")
+
+    def _log_stat(self):
+        try:
+            return os.stat(self._log_file)
+        except FileNotFoundError:
+            return None
+
+    def _sync(self):
+        """其它进程改过磁盘上的数据：日志被替换 / 删除就整体重新加载，变长了就回放新增部分"""
+        stat = self._log_stat()
+        inode = stat.st_ino if stat else None
+        if not self._loaded or inode != self._log_inode or (stat and stat.st_size < self._log_offset):
+            self._load()
+        elif stat and stat.st_size > self._log_offset:
+            self._replay()
+
+    def _reset_state(self):
+        self._ids: List[Optional[str]] = []
+        self._payloads: List[Optional[dict]] = []
+        self._alive = np.zeros(0, dtype=bool)
+        self._rows: Dict[str, int] = {}
+        self._index: Dict[str, Dict[object, set]] = {f: {} for f in INDEXED_FIELDS}
+        # IVF (近似检索)，未建立时为 None
+        self._centroids: Optional[np.ndarray] = None
+        self._assign: Optional[np.ndarray] = None
+        # 已回放到的日志位置 (字节) 和日志文件的 inode，用来发现其它进程的写入
+        self._log_offset = 0
+        self._log_inode = None
+
+    def _open_vectors(self, capacity: int):
+        size = capacity * self.dims * 4
+        mode = "r+" if os.path.exists(self._vector_file) else "w+"
+        if mode == "r+" and os.path.getsize(self._vector_file) < size:
+            with open(self._vector_file, "r+b") as f:
+                f.truncate(size)
+        self._vectors = np.memmap(
+            self._vector_file, dtype=np.float32, mode=mode, shape=(capacity, self.dims)
+        )
+        self._capacity = capacity
+
+    def _ensure_capacity(self, needed: int):
+        if needed <= self._capacity:
+            return
+        capacity = self._capacity
+        while capacity < needed:
+            capacity *= 2
+        self._vectors.flush()
+        del self._vectors
+        self._open_vectors(capacity)
+        alive = np.zeros(capacity, dtype=bool)
+        alive[: len(self._alive)] = self._alive
+        self._alive = alive
+
+    def _append_log(self, records: List[dict]):
+        data = "".join(json.dumps(record, ensure_ascii=False) + "\n" for record in records)
+        with open(self._log_file, "ab") as f:
+            f.write(data.encode("utf-8"))
+            # 这些记录已经在内存里生效，同步位置跳到文件末尾
+            self._log_offset = f.tell()
+        self._log_inode = os.stat(self._log_file).st_ino
+
+    def _load(self):
+        """回放操作日志"""
+        self._reset_state()
+        existing = 0
+        if os.path.exists(self._vector_file):
+            existing = os.path.getsize(self._vector_file) // (self.dims * 4)
+        if hasattr(self, "_vectors"):
+            del self._vectors
+        self._open_vectors(max(existing, _INITIAL_CAPACITY))
+        self._alive = np.zeros(self._capacity, dtype=bool)
+        self._loaded = True
+        stat = self._log_stat()
+        if stat is not None:
+            self._log_inode = stat.st_ino
+            self._replay()
+
+    def _replay(self):
+        """从 _log_offset 开始回放日志 (只处理完整的行)"""
+        with open(self._log_file, "rb") as f:
+            f.seek(self._log_offset)
+            data = f.read()
+        end = data.rfind(b"\n") + 1
+        for line in data[:end].splitlines():
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # 写了一半的行 (进程崩溃)，忽略
+                continue
+            if record["op"] == "put":
+                # 其它进程可能已经把向量文件扩容
+                self._ensure_capacity(record["row"] + 1)
+                self._set_row(record["row"], record["id"], record["payload"])
+                self._assign_row(record["row"])
+            elif record["op"] == "del":
+                self._clear_row(record["row"])
+        self._log_offset += end
+
+    # --- 行与倒排索引 ---
+
+    def _set_row(self, row: int, vector_id: str, payload: dict):
+        while len(self._ids) <= row:
+            self._ids.append(None)
+            self._payloads.append(None)
+        if self._alive[row]:
+            self._unindex(row)
+        self._ids[row] = vector_id
+        self._payloads[row] = payload
+        self._alive[row] = True
+        self._rows[vector_id] = row
+        for field in INDEXED_FIELDS:
+            if field in payload:
+                self._index[field].setdefault(payload[field], set()).add(row)
+
+    def _unindex(self, row: int):
+        payload = self._payloads[row] or {}
+        for field in INDEXED_FIELDS:
+            if field in payload:
+                rows = self._index[field].get(payload[field])
+                if rows is not None:
+                    rows.discard(row)
+                    if not rows:
+                        del self._index[field][payload[field]]
+
+    def _clear_row(self, row: int):
+        if row >= len(self._ids) or not self._alive[row]:
+            return
+        self._unindex(row)
+        self._rows.pop(self._ids[row], None)
+        self._alive[row] = False
+        self._ids[row] = None
+        self._payloads[row] = None
+
+    def _candidates(self, filters: Optional[dict]) -> np.ndarray:
+        """用倒排索引缩小候选行 (只处理顶层等值条件，其余条件检索后再校验)"""
+        rows: Optional[set] = None
+        for field in INDEXED_FIELDS:
+            if not filters or field not in filters:
+                continue
+            cond = filters[field]
+            if isinstance(cond, dict) and "$eq" in cond:
+                cond = cond["$eq"]
+            if isinstance(cond, dict) and "$in" in cond:
+                matched = set()
+                for value in cond["$in"]:
+                    matched |= self._index[field].get(value, set())
+            elif isinstance(cond, (dict, list)) or cond == "*":
+                continue
+            else:
+                matched = self._index[field].get(cond, set())
+            rows = matched if rows is None else rows & matched
+        if rows is None:
+            return np.flatnonzero(self._alive[: len(self._ids)])
+        return np.fromiter(rows, dtype=np.int64, count=len(rows))
+
+    # --- Mem0 VectorStoreBase 接口 ---
+
+    def create_col(self, name, vector_size=None, distance=None):
+        with self._lock:
+            self.collection_name = name
+            os.makedirs(self.dir, exist_ok=True)
+            self._open_lock_file()
+            self._loaded = False
+        with self._locked():
+            # 加锁后的同步会做一次完整加载
+            dead = len(self._ids) - int(self._alive.sum())
+            if len(self._ids) and dead / len(self._ids) > _COMPACT_RATIO:
+                self.compact()
+
+    def insert(self, vectors, payloads=None, ids=None):
+        vectors = _normalize(np.asarray(vectors, dtype=np.float32).reshape(-1, self.dims))
+        payloads = payloads or [{} for _ in range(len(vectors))]
+        if ids is None:
+            raise ValueError("LocalVectorStore.insert 需要显式传入 ids")
+
+        with self._locked():
+            records = []
+            for vector, payload, vector_id in zip(vectors, payloads, ids):
+                row = self._rows.get(vector_id)
+                if row is None:
+                    row = len(self._ids)
+                    self._ensure_capacity(row + 1)
+                self._vectors[row] = vector
+                self._set_row(row, vector_id, payload)
+                self._assign_row(row)
+                records.append({"op": "put", "row": row, "id": vector_id, "payload": payload})
+            # 向量先落盘，日志行写成功才算插入完成
+            self._vectors.flush()
+            self._append_log(records)
+
+    def search(self, query, vectors, top_k=5, filters=None, limit=None):
+        k = limit if limit is not None else top_k
+        q = _normalize(np.asarray(vectors, dtype=np.float32).reshape(self.dims))
+
+        with self._locked(exclusive=False):
+            rows = self._candidates(filters)
+            if self._centroids is not None and len(rows) > LOCAL_VECTOR_IVF_MIN:
+                rows = self._probe(q, rows)
+            if len(rows) == 0:
+                return []
+
+            total = len(self._ids)
+            if len(rows) > total // 4:
+                # 候选行占大多数时直接算连续区间 (避免花式索引复制整块向量)，再取出候选行的分数
+                scores = (self._vectors[:total] @ q)[rows]
+            else:
+                scores = self._vectors[rows] @ q
+            # 过滤条件全由倒排索引覆盖时直接取 top-k，否则按分数依次校验
+            exact_filter = self._covered_by_index(filters)
+            if exact_filter and len(rows) > k:
+                top = np.argpartition(-scores, k - 1)[:k]
+                order = top[np.argsort(-scores[top])]
+            else:
+                order = np.argsort(-scores)
+
+            results = []
+            for i in order:
+                row = int(rows[i])
+                payload = self._payloads[row]
+                if not exact_filter and not _match(payload, filters):
+                    continue
+                results.append(
+                    OutputData(id=self._ids[row], score=float(scores[i]), payload=payload)
+                )
+                if len(results) >= k:
+                    break
+            return results
+
+    def delete(self, vector_id):
+        with self._locked():
+            row = self._rows.get(vector_id)
+            if row is None:
+                return
+            self._clear_row(row)
+            self._append_log([{"op": "del", "row": row}])
+
+    def update(self, vector_id, vector=None, payload=None):
+        with self._locked():
+            row = self._rows.get(vector_id)
+            if row is None:
+                return
+            if vector is not None:
+                self._vectors[row] = _normalize(np.asarray(vector, dtype=np.float32))
+                self._vectors.flush()
+                self._assign_row(row)
+            if payload is None:
+                payload = self._payloads[row]
+            self._set_row(row, vector_id, payload)
+            self._append_log([{"op": "put", "row": row, "id": vector_id, "payload": payload}])
+
+    def get(self, vector_id):
+        with self._locked(exclusive=False):
+            row = self._rows.get(vector_id)
+            if row is None:
+                return None
+            return OutputData(id=vector_id, score=None, payload=self._payloads[row])
+
+    def list_cols(self):
+        if not os.path.isdir(os.path.dirname(self.dir)):
+            return []
+        return sorted(os.listdir(os.path.dirname(self.dir)))
+
+    def delete_col(self):
+        with self._locked():
+            if hasattr(self, "_vectors"):
+                del self._vectors
+            for file in (self._vector_file, self._log_file):
+                if os.path.exists(file):
+                    os.remove(file)
+            self._reset_state()
+            self._open_vectors(_INITIAL_CAPACITY)
+            self._alive = np.zeros(self._capacity, dtype=bool)
+
+    def col_info(self):
+        with self._locked(exclusive=False):
+            return {
+                "name": self.collection_name,
+                "count": len(self._rows),
+                "rows": len(self._ids),
+                "capacity": self._capacity,
+                "dims": self.dims,
+                "ivf_lists": 0 if self._centroids is None else len(self._centroids),
+            }
+
+    def list(self, filters=None, top_k=None, limit=None):
+        k = limit if limit is not None else top_k
+        with self._locked(exclusive=False):
+            results = []
+            for row in self._candidates(filters):
+                row = int(row)
+                payload = self._payloads[row]
+                if not _match(payload, filters):
+                    continue
+                results.append(OutputData(id=self._ids[row], score=None, payload=payload))
+                if k and len(results) >= k:
+                    break
+        # 与 Chroma 的返回结构一致：外面多包一层列表
+        return [results]
+
+    def reset(self):
+        self.delete_col()
+
+    # --- 过滤与 IVF ---
+
+    @staticmethod
+    def _covered_by_index(filters: Optional[dict]) -> bool:
+        """过滤条件是否全部是索引字段上的等值 / $in 条件"""
+        if not filters:
+            return True
+        for key, cond in filters.items():
+            if key not in INDEXED_FIELDS:
+                return False
+            if isinstance(cond, dict) and not set(cond) <= {"$eq", "$in"}:
+                return False
+            if isinstance(cond, list) or cond == "*":
+                return False
+        return True
+
+    def build_ivf(self, nlist: Optional[int] = None, iterations: int = 10, sample: int = 100000):
+        """
+        建 IVF 聚类索引 (近似检索)：k-means 聚成 nlist 个簇，检索时只看最近的 nprobe 个簇
+        向量数不到 LOCAL_VECTOR_IVF_MIN 时不用建，精确检索已经足够快
+        """
+        with self._locked(exclusive=False):
+            alive_rows = np.flatnonzero(self._alive[: len(self._ids)])
+            if len(alive_rows) == 0:
+                return
+            nlist = nlist or max(1, int(np.sqrt(len(alive_rows))))
+            rng = np.random.default_rng(0)
+            train_rows = rng.choice(alive_rows, size=min(sample, len(alive_rows)), replace=False)
+            train = np.asarray(self._vectors[np.sort(train_rows)])
+            centroids = train[rng.choice(len(train), size=min(nlist, len(train)), replace=False)]
+
+            for _ in range(iterations):
+                assign = np.argmax(train @ centroids.T, axis=1)
+                for c in range(len(centroids)):
+                    members = train[assign == c]
+                    if len(members):
+                        centroids[c] = members.mean(axis=0)
+                centroids = _normalize(centroids)
+
+            self._centroids = centroids
+            self._assign = np.full(self._capacity, -1, dtype=np.int32)
+            # 分块分配，避免一次性把全部向量读进内存
+            for start in range(0, len(alive_rows), 65536):
+                chunk = alive_rows[start : start + 65536]
+                self._assign[chunk] = np.argmax(self._vectors[chunk] @ centroids.T, axis=1)
+
+    def _assign_row(self, row: int):
+        if self._centroids is None:
+            return
+        if len(self._assign) < self._capacity:
+            assign = np.full(self._capacity, -1, dtype=np.int32)
+            assign[: len(self._assign)] = self._assign
+            self._assign = assign
+        self._assign[row] = int(np.argmax(self._centroids @ self._vectors[row]))
+
+    def _probe(self, q: np.ndarray, rows: np.ndarray) -> np.ndarray:
+        nprobe = min(LOCAL_VECTOR_NPROBE, len(self._centroids))
+        nearest = np.argpartition(-(self._centroids @ q), nprobe - 1)[:nprobe]
+        return rows[np.isin(self._assign[rows], nearest)]
+
+    def compact(self):
+        """去掉墓碑行，重写向量文件和日志 (其它进程发现日志被替换后会重新加载)"""
+        with self._locked():
+            alive_rows = np.flatnonzero(self._alive[: len(self._ids)])
+            ids = [self._ids[r] for r in alive_rows]
+            payloads = [self._payloads[r] for r in alive_rows]
+            capacity = max(_INITIAL_CAPACITY, len(alive_rows))
+
+            tmp_vectors = self._vector_file + ".tmp"
+            packed = np.memmap(tmp_vectors, dtype=np.float32, mode="w+", shape=(capacity, self.dims))
+            for start in range(0, len(alive_rows), 65536):
+                chunk = alive_rows[start : start + 65536]
+                packed[start : start + len(chunk)] = self._vectors[chunk]
+            packed.flush()
+            del packed
+
+            tmp_log = self._log_file + ".tmp"
+            with open(tmp_log, "w", encoding="utf-8") as f:
+                for row, (vector_id, payload) in enumerate(zip(ids, payloads)):
+                    record = {"op": "put", "row": row, "id": vector_id, "payload": payload}
+                    f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+            del self._vectors
+            os.replace(tmp_vectors, self._vector_file)
+            os.replace(tmp_log, self._log_file)
+            self._load()
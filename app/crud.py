@@ -1,4 +1,8 @@
-from sqlalchemy.orm import Session
+from sqlalchemy import String, and_, func, literal, text, update
+from sqlalchemy.dialects.mysql import insert as mysql_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased
 from . import models, schemas
 from decimal import Decimal
 
@@ -14,67 +18,303 @@ def get_locations(db: Session, user_id: int = 1, skip: int = 0, limit: int = 100
     )
 
 
+def _child_path(parent_path, location_id: int) -> str:
+    """物化路径：根位置 "/1"，它下面的位置 "/1/5" (祖先 ID 链，最后一段是自己)"""
+    return f"{parent_path or ''}/{location_id}"
+
+
+def in_subtree(path_column, path):
+    """
+    path_column 在 path 这棵子树里 (含 path 自己)，写成一个区间以便走 (user_id, path) 索引：
+    路径里只有数字和 "/"，"/" 排在 "0" 前面，所以 [path, path + "0") 恰好是 path 和 path/...，
+    "/1/5" 的区间不会包含 "/1/50"。path 可以是字符串，也可以是另一张表的列 (联表时)
+    """
+    return and_(path_column >= path, path_column < path + "0")
+
+
+def _get_parent(db: Session, parent_id, user_id: int):
+    if parent_id is None:
+        return None
+    parent = (
+        db.query(models.Location)
+        .filter(models.Location.id == parent_id, models.Location.user_id == user_id)
+        .first()
+    )
+    if parent is None:
+        raise ValueError(f"父位置 {parent_id} 不存在")
+    return parent
+
+
 def create_location(db: Session, location: schemas.LocationCreate, user_id: int = 1):
+    """
+    新建位置；位置名在同一用户的整棵位置树里唯一 (对话里只靠名字指代位置)，
+    重名时回滚并抛出 IntegrityError
+    """
+    parent = _get_parent(db, location.parent_id, user_id)
     db_location = models.Location(**location.dict(), user_id=user_id)
     db.add(db_location)
+    try:
+        db.flush()  # 拿到 ID 才能拼路径
+    except IntegrityError:
+        db.rollback()
+        raise
+    db_location.path = _child_path(parent.path if parent else None, db_location.id)
     db.commit()
     db.refresh(db_location)
     return db_location
 
 
+def move_location(db: Session, location_id: int, parent_id=None, user_id: int = 1):
+    """
+    把位置挂到另一个位置下面 (parent_id=None 变成根位置)
+    整棵子树的路径用一条 UPDATE 改写：新前缀 + 去掉旧前缀后的部分
+    """
+    location = (
+        db.query(models.Location)
+        .filter(models.Location.id == location_id, models.Location.user_id == user_id)
+        .with_for_update()
+        .first()
+    )
+    if location is None:
+        raise ValueError(f"位置 {location_id} 不存在")
+    parent = _get_parent(db, parent_id, user_id)
+    old_path = location.path
+    if parent is not None and (
+        parent.path == old_path or parent.path.startswith(old_path + "/")
+    ):
+        raise ValueError("不能把位置移到它自己或它的子位置下面")
+
+    new_path = _child_path(parent.path if parent else None, location.id)
+    if new_path != old_path:
+        db.query(models.Location).filter(
+            models.Location.user_id == user_id, in_subtree(models.Location.path, old_path)
+        ).update(
+            {
+                models.Location.path: literal(new_path, String)
+                + func.substr(models.Location.path, len(old_path) + 1, type_=String)
+            },
+            synchronize_session=False,
+        )
+    location.parent_id = parent_id
+    db.commit()
+    db.refresh(location)
+    return location
+
+
 # --- Item & Inventory 操作 (核心) ---
+
+
+def touch_items(db: Session, item_ids):
+    """
+    物品的库存变了：revision +1 (用 SQL 表达式自增，多个 worker 并发也不会丢)，同时刷新 updated_at
+    搜索缓存 (search_cache.py) 通过比对 revision 判断结果是否过期，
+    重建索引任务 (reindex.py) 按 updated_at 找出需要重新写向量的物品；不提交
+    """
+    item_ids = set(item_ids)
+    if not item_ids:
+        return
+    db.query(models.Item).filter(models.Item.id.in_(item_ids)).update(
+        {models.Item.revision: models.Item.revision + 1, models.Item.updated_at: func.now()},
+        synchronize_session=False,
+    )
+
+
+def _upsert(db: Session, table, values: dict, keys: list, set_) -> int:
+    """
+    一条 INSERT ... 冲突时 UPDATE，返回这一行的 id (新插入或已存在的)
+    - MySQL: INSERT ... ON DUPLICATE KEY UPDATE，id = LAST_INSERT_ID(id) 让已存在的行也能拿到 id
+    - 其它 (SQLite): INSERT ... ON CONFLICT (keys) DO UPDATE ... RETURNING id
+    set_(new) 返回冲突时要更新的列，new.列名 引用本次要插入的值
+    """
+    if _is_mysql(db):
+        stmt = mysql_insert(table).values(**values)
+        stmt = stmt.on_duplicate_key_update(id=func.last_insert_id(table.c.id), **set_(stmt.inserted))
+        return db.execute(stmt).lastrowid
+
+    stmt = sqlite_insert(table).values(**values)
+    # DO UPDATE 至少要更新一列，RETURNING 才会返回已存在的行
+    updates = set_(stmt.excluded) or {keys[0]: stmt.excluded[keys[0]]}
+    stmt = stmt.on_conflict_do_update(index_elements=keys, set_=updates).returning(table.c.id)
+    return db.execute(stmt).scalar_one()
+
+
+def upsert_location(db: Session, name: str, user_id: int = 1) -> int:
+    """
+    按名字取位置 ID，没有就新建为根位置 (依赖 (user_id, name) 唯一约束)；不提交
+    插入前拿不到 ID，新位置的路径用第二条 UPDATE 补上 (已有位置 path 不为空，不会被改)
+    """
+    location_id = _upsert(
+        db,
+        models.Location.__table__,
+        {"user_id": user_id, "name": name},
+        ["user_id", "name"],
+        lambda new: {},
+    )
+    db.execute(
+        update(models.Location)
+        .where(models.Location.id == location_id, models.Location.path.is_(None))
+        .values(path=_child_path(None, location_id))
+    )
+    return location_id
+
+
 def create_item_with_inventory(
-    db: Session, item_in: schemas.ItemCreate, user_id: int = 1
+    db: Session, item_in: schemas.ItemCreate, user_id: int = 1, commit: bool = True
 ):
-    # 1. 检查物品是否已存在 (根据名称)
-    db_item = (
-        db.query(models.Item)
-        .filter(models.Item.name == item_in.name, models.Item.user_id == user_id)
-        .first()
-    )
+    """
+    录入物品：物品不存在就新建，库存记录已存在就累加数量
+    commit=False 时只 flush 不提交，调用方可以把其它写入 (例如 Mem0 outbox) 放进同一个事务
 
-    # 2. 如果不存在，创建新物品
-    if not db_item:
-        db_item = models.Item(
-            name=item_in.name,
-            category=item_in.category,
-            image_url=item_in.image_url,
-            user_id=user_id,
+    物品、库存各用一条 upsert 完成 (不再先查后插，并发录入同名物品也不会撞唯一约束)：
+    - 物品已存在时顺带 revision +1、刷新 updated_at (相当于 touch_items)
+    - 库存已存在时 quantity = quantity + 本次数量，单位以最新的为准
+    """
+    Item, Inventory = models.Item.__table__, models.Inventory.__table__
+
+    # 1. 物品 upsert
+    item_id = _upsert(
+        db,
+        Item,
+        {
+            "user_id": user_id,
+            "name": item_in.name,
+            "category": item_in.category,
+            "image_url": item_in.image_url,
+        },
+        ["user_id", "name"],
+        lambda new: {"revision": Item.c.revision + 1, "updated_at": func.now()},
+    )
+    if not _is_mysql(db) and db.query(models.ItemNgram.item_id).filter_by(item_id=item_id).first() is None:
+        # 新物品：补 n-gram (MySQL 用 FULLTEXT 索引，不需要)
+        index_item_ngrams(
+            db, models.Item(id=item_id, name=item_in.name, category=item_in.category)
         )
-        db.add(db_item)
-        db.commit()
-        db.refresh(db_item)
 
-    # 3. 创建或更新库存记录
-    # 检查该物品在指定位置是否已有库存
-    db_inventory = (
-        db.query(models.Inventory)
-        .filter(
-            models.Inventory.item_id == db_item.id,
-            models.Inventory.location_id == item_in.location_id,
-        )
-        .first()
+    # 2. 库存 upsert
+    inventory_id = _upsert(
+        db,
+        Inventory,
+        {
+            "item_id": item_id,
+            "location_id": item_in.location_id,
+            "quantity": Decimal(str(item_in.quantity)),
+            "unit": item_in.unit,
+        },
+        ["item_id", "location_id"],
+        lambda new: {
+            "quantity": Inventory.c.quantity + new.quantity,
+            "unit": func.coalesce(new.unit, Inventory.c.unit),
+        },
     )
 
-    if db_inventory:
-        # 如果有，增加数量
-        db_inventory.quantity += Decimal(str(item_in.quantity))
-        # 更新单位（以最新的为准，可选）
-        if item_in.unit:
-            db_inventory.unit = item_in.unit
+    if commit:
+        db.commit()
     else:
-        # 如果没有，创建新库存记录
-        db_inventory = models.Inventory(
-            item_id=db_item.id,
-            location_id=item_in.location_id,
-            quantity=item_in.quantity,
-            unit=item_in.unit,
-        )
-        db.add(db_inventory)
+        db.flush()
+    # 读回最终数量 (populate_existing：会话里可能有这条库存的旧值)
+    return db.get(models.Inventory, inventory_id, populate_existing=True)
 
-    db.commit()
-    db.refresh(db_inventory)
-    return db_inventory
+
+def bulk_upsert_inventory(
+    db: Session, entries: list, user_id: int = 1, commit: bool = True
+):
+    """
+    [批量录入] 一个事务内完成多条 物品 + 位置 + 库存 的写入
+    entries: [{"name", "category", "quantity", "unit", "location"}, ...]
+    commit=False 时只 flush，由调用方提交 (出错时也由调用方回滚)
+
+    位置、物品、库存都用 upsert 写入 (与 create_item_with_inventory 一致)，并发批次、
+    并发的单条录入不会撞唯一约束，库存累加也是 quantity = quantity + 本次数量，不会丢更新；
+    按名字排序后依次写入，多个事务加锁顺序一致，避免互相死锁
+    返回与 entries 顺序一致的结果字典列表 (同一库存在批内出现多次时取最终数量)
+    """
+    if not entries:
+        return []
+
+    Item, Inventory = models.Item.__table__, models.Inventory.__table__
+    try:
+        # 1. 位置
+        loc_of = [e.get("location") or "未分类区域" for e in entries]
+        locations = {name: upsert_location(db, name, user_id) for name in sorted(set(loc_of))}
+
+        # 2. 物品 (已存在的物品 revision +1、刷新 updated_at，相当于 touch_items)
+        categories = {}
+        for e in entries:
+            categories.setdefault(e["name"], e.get("category"))
+        items = {
+            name: _upsert(
+                db,
+                Item,
+                {"user_id": user_id, "name": name, "category": categories[name]},
+                ["user_id", "name"],
+                lambda new: {"revision": Item.c.revision + 1, "updated_at": func.now()},
+            )
+            for name in sorted(categories)
+        }
+        if not _is_mysql(db):
+            # 新物品补 n-gram (MySQL 用 FULLTEXT 索引，不需要)
+            indexed = {
+                item_id
+                for (item_id,) in db.query(models.ItemNgram.item_id)
+                .filter(models.ItemNgram.item_id.in_(items.values()))
+                .distinct()
+            }
+            for name, item_id in items.items():
+                if item_id not in indexed:
+                    index_item_ngrams(
+                        db, models.Item(id=item_id, name=name, category=categories[name])
+                    )
+
+        # 3. 库存：批内同一 (物品, 位置) 先合并，再每个一条 upsert
+        merged = {}
+        for e, loc_name in zip(entries, loc_of):
+            key = (items[e["name"]], locations[loc_name])
+            quantity, _ = merged.get(key, (Decimal("0"), None))
+            merged[key] = (quantity + Decimal(str(e.get("quantity") or 1)), e.get("unit") or "个")
+        inventory_ids = {
+            key: _upsert(
+                db,
+                Inventory,
+                {"item_id": key[0], "location_id": key[1], "quantity": quantity, "unit": unit},
+                ["item_id", "location_id"],
+                lambda new: {"quantity": Inventory.c.quantity + new.quantity, "unit": new.unit},
+            )
+            for key, (quantity, unit) in sorted(merged.items())
+        }
+        final = {
+            row.id: row
+            for row in db.query(Inventory.c.id, Inventory.c.quantity, Inventory.c.unit).filter(
+                Inventory.c.id.in_(inventory_ids.values())
+            )
+        }
+
+        results = []
+        for e, loc_name in zip(entries, loc_of):
+            key = (items[e["name"]], locations[loc_name])
+            inv = final[inventory_ids[key]]
+            results.append(
+                {
+                    "item_id": key[0],
+                    "item": e["name"],
+                    "location_id": key[1],
+                    "location": loc_name,
+                    "quantity": float(inv.quantity),
+                    "unit": inv.unit,
+                }
+            )
+
+        # 4. 一次提交
+        if commit:
+            db.commit()
+        else:
+            db.flush()
+        return results
+
+    except Exception:
+        # commit=False 时事务属于调用方 (里面可能还有别的写入)，由调用方决定回滚
+        if commit:
+            db.rollback()
+        raise
 
 
 # app/crud.py (追加)
@@ -82,35 +322,29 @@ def create_item_with_inventory(
 
 def get_or_create_location_by_name(db: Session, name: str, user_id: int = 1):
     """
-    根据名字找位置 ID，找不到就自动新建
+    根据名字找位置，找不到就自动新建 (upsert，并发时不会建出同名位置)
     """
-    # 1. 尝试查找
-    loc = (
-        db.query(models.Location)
-        .filter(models.Location.name == name, models.Location.user_id == user_id)
-        .first()
-    )
-
-    # 2. 找到直接返回
-    if loc:
-        return loc
-
-    # 3. 没找到，自动创建
-    new_loc = models.Location(name=name, user_id=user_id)
-    db.add(new_loc)
+    location_id = upsert_location(db, name, user_id)
     db.commit()
-    db.refresh(new_loc)
-    return new_loc
+    return db.get(models.Location, location_id)
 
 
 # app/crud.py (追加)
 
 
-def get_location_tree(db: Session, user_id: int = 1):
-    # 1. 取出该用户所有位置
-    all_locs = (
-        db.query(models.Location).filter(models.Location.user_id == user_id).all()
-    )
+def get_location_tree(db: Session, user_id: int = 1, root_id: int = None):
+    # 1. 取出该用户所有位置 (指定 root_id 时只取这棵子树，按路径前缀一次查出)
+    query = db.query(models.Location).filter(models.Location.user_id == user_id)
+    if root_id is not None:
+        root = (
+            db.query(models.Location.id, models.Location.path)
+            .filter(models.Location.id == root_id, models.Location.user_id == user_id)
+            .first()
+        )
+        if root is None:
+            return []
+        query = query.filter(in_subtree(models.Location.path, root.path))
+    all_locs = query.all()
 
     # 2. 构建 ID 到 Node 的映射字典
     # 我们用 schemas.LocationNode 来包装数据，方便最后返回
@@ -122,8 +356,8 @@ def get_location_tree(db: Session, user_id: int = 1):
     roots = []
     for loc in all_locs:
         node = nodes[loc.id]
-        if loc.parent_id is None:
-            # 没有父级，说明是根节点
+        if loc.parent_id is None or loc.id == root_id:
+            # 没有父级 (或者就是指定的子树根)，说明是根节点
             roots.append(node)
         else:
             # 有父级，把自己挂到父级的 children 里
@@ -134,6 +368,54 @@ def get_location_tree(db: Session, user_id: int = 1):
     return roots
 
 
+def get_subtree_inventory(
+    db: Session, location_id: int = None, location_name: str = None, user_id: int = 1
+):
+    """
+    某个位置及其所有子位置 (柜子、抽屉...) 里的全部库存，一条 SQL：
+    按 ID 或名字找到子树根 (唯一键)，子树里的位置按路径前缀区间走 (user_id, path) 索引，
+    再按 location_id 取库存
+    返回：None 表示位置不存在，否则按位置路径、物品名排序的列表
+    [{"item_id", "item", "quantity", "unit", "location_id", "location", "path"}, ...]
+    """
+    Item, Inventory, Location = models.Item, models.Inventory, models.Location
+    root = aliased(Location, name="root")
+    anchor = root.id == location_id if location_id is not None else root.name == location_name
+
+    rows = (
+        db.query(
+            Item.id.label("item_id"),
+            Item.name.label("item_name"),
+            Inventory.quantity,
+            Inventory.unit,
+            Location.id.label("location_id"),
+            Location.name.label("location_name"),
+            Location.path,
+        )
+        .select_from(root)
+        .join(Location, and_(Location.user_id == root.user_id, in_subtree(Location.path, root.path)))
+        .join(Inventory, Inventory.location_id == Location.id)
+        .join(Item, Item.id == Inventory.item_id)
+        .filter(root.user_id == user_id, anchor, Inventory.quantity > 0)
+        .order_by(Location.path, Item.name)
+        .all()
+    )
+    if not rows and db.query(root.id).filter(root.user_id == user_id, anchor).first() is None:
+        return None
+    return [
+        {
+            "item_id": row.item_id,
+            "item": row.item_name,
+            "quantity": float(row.quantity),
+            "unit": row.unit,
+            "location_id": row.location_id,
+            "location": row.location_name,
+            "path": row.path,
+        }
+        for row in rows
+    ]
+
+
 def get_item_details(db: Session, item_id: int):
     """
     联表查询：获取物品详情 + 库存 + 位置名称
@@ -178,6 +460,53 @@ def get_item_all_inventories(db: Session, item_id: int):
     return results
 
 
+def get_items_inventories(db: Session, item_ids):
+    """
+    批量查询多个物品的库存分布 (搜索结果组装用，避免逐个物品查询)
+    一条 SQL：物品 LEFT JOIN 库存 LEFT JOIN 位置，每个物品的总量用窗口函数在 SQL 里算好
+    返回：{item_id: {"item_id", "item_name", "revision", "total_quantity", "locations": [...]}}
+    """
+    item_ids = set(item_ids)
+    if not item_ids:
+        return {}
+
+    Item, Inventory, Location = models.Item, models.Inventory, models.Location
+    rows = (
+        db.query(
+            Item.id,
+            Item.name,
+            Item.revision,
+            Inventory.quantity,
+            Inventory.unit,
+            Location.name.label("location_name"),
+            func.coalesce(func.sum(Inventory.quantity).over(partition_by=Item.id), 0).label("total"),
+        )
+        .outerjoin(Inventory, Inventory.item_id == Item.id)
+        .outerjoin(Location, Inventory.location_id == Location.id)
+        .filter(Item.id.in_(item_ids))
+        .order_by(Item.id, Inventory.id)
+        .all()
+    )
+
+    results = {}
+    for row in rows:
+        entry = results.get(row.id)
+        if entry is None:
+            entry = results[row.id] = {
+                "item_id": row.id,
+                "item_name": row.name,
+                "revision": row.revision,
+                "total_quantity": float(row.total),
+                "locations": [],
+            }
+        # 没有库存记录的物品只有一行，库存列为 NULL
+        if row.location_name is not None:
+            entry["locations"].append(
+                {"location": row.location_name, "quantity": float(row.quantity), "unit": row.unit}
+            )
+    return results
+
+
 def get_all_inventory_details(db: Session):
     """
     [报表] 获取所有库存明细
@@ -213,52 +542,78 @@ def get_all_inventory_details(db: Session):
 
 
 # 减少库存
-def reduce_inventory(db: Session, item_name: str, quantity: float, user_id: int = 1):
+# 条件扣减被并发抢先时最多重新读取几次 (只有没有行锁的数据库会发生)
+REDUCE_MAX_ATTEMPTS = 5
+
+
+def reduce_inventory(
+    db: Session, item_name: str, quantity: float, user_id: int = 1, commit: bool = True
+):
     """
     [核心逻辑] 消耗物品
     策略：自动查找该物品的所有库存，优先扣减数量多的位置 (避免产生大量碎片库存)
-    """
-    # 1. 查找该物品的所有库存记录
-    # 联表查询：Inventory + Item
-    records = (
-        db.query(models.Inventory)
-        .join(models.Item, models.Inventory.item_id == models.Item.id)
-        .filter(models.Item.name == item_name, models.Item.user_id == user_id)
-        .order_by(models.Inventory.quantity.desc())  # 降序排列，先用多的
-        .all()
-    )
-
-    if not records:
-        return {"status": "error", "message": f"家里找不到'{item_name}'，无法消耗。"}
+    commit=False 时只 flush，由调用方提交
 
-    # 准备计算
+    并发安全 (两个人同时消耗同一个物品，扣减不会丢)：
+    - SELECT ... FOR UPDATE 按 id 顺序锁住这个物品的库存行，只锁这一个物品，固定顺序不会死锁
+    - 每个位置用条件 UPDATE 扣减：quantity = quantity - :n WHERE quantity >= :n，在 SQL 里算
+    - 没有行锁的数据库 (SQLite) 上条件可能不满足 (被别人先扣了)，重新读取后继续扣剩下的
+    """
     needed = Decimal(str(quantity))
     total_deducted = Decimal("0")
     logs = []
-
-    # 2. 开始循环扣减
-    for inv in records:
-        if needed <= 0:
+    records = []
+
+    for _ in range(REDUCE_MAX_ATTEMPTS):
+        # 1. 锁住并读取该物品的所有库存记录 (populate_existing：重试时拿到最新数量)
+        records = (
+            db.query(models.Inventory)
+            .join(models.Item, models.Inventory.item_id == models.Item.id)
+            .filter(models.Item.name == item_name, models.Item.user_id == user_id)
+            .order_by(models.Inventory.id)
+            .with_for_update(of=models.Inventory)
+            .populate_existing()
+            .all()
+        )
+        if not records:
+            return {"status": "error", "message": f"家里找不到'{item_name}'，无法消耗。"}
+
+        # 2. 先用多的 (降序)，逐个位置条件扣减
+        conflict = False
+        for inv in sorted(records, key=lambda r: r.quantity, reverse=True):
+            if needed <= 0:
+                break
+            take = min(inv.quantity, needed)
+            if take <= 0:
+                continue
+
+            updated = db.execute(
+                update(models.Inventory)
+                .where(models.Inventory.id == inv.id, models.Inventory.quantity >= take)
+                .values(quantity=models.Inventory.quantity - take)
+                .execution_options(synchronize_session=False)
+            ).rowcount
+            if not updated:
+                conflict = True
+                break
+
+            total_deducted += take
+            needed -= take
+            if take == inv.quantity:
+                logs.append(f"位置(ID:{inv.location_id}) 已用光({take})")
+            else:
+                logs.append(f"从位置(ID:{inv.location_id}) 扣除 {take}")
+
+        if not conflict:
             break
 
-        current_qty = inv.quantity
-
-        if current_qty >= needed:
-            # A. 当前位置够扣
-            inv.quantity -= needed
-            total_deducted += needed
-            logs.append(f"从位置(ID:{inv.location_id}) 扣除 {needed}")
-            needed = Decimal("0")  # 扣完了
-        else:
-            # B. 当前位置不够，全部扣光，继续下一个
-            deducted = current_qty
-            inv.quantity = Decimal("0")
-            total_deducted += deducted
-            needed -= deducted
-            logs.append(f"位置(ID:{inv.location_id}) 已用光({deducted})")
+    touch_items(db, [inv.item_id for inv in records])
 
     # 3. 提交事务
-    db.commit()
+    if commit:
+        db.commit()
+    else:
+        db.flush()
 
     # 4. 生成返回消息
     if needed > 0:
@@ -266,12 +621,16 @@ def reduce_inventory(db: Session, item_name: str, quantity: float, user_id: int
             "status": "warning",
             "message": f"库存不足！只扣减了 {total_deducted}，还缺 {needed}。",
             "details": logs,
+            "deducted": float(total_deducted),
+            "unit": records[0].unit,
         }
     else:
         return {
             "status": "success",
             "message": f"成功消耗 {total_deducted} 个 {item_name}。",
             "details": logs,
+            "deducted": float(total_deducted),
+            "unit": records[0].unit,
         }
 
 
@@ -301,6 +660,7 @@ def update_recent_item_location(
     # 3. 更新位置
     old_loc_id = inventory.location_id
     inventory.location_id = new_loc.id
+    touch_items(db, [inventory.item_id])
 
     # (可选优化) 如果新位置已经有该物品了，应该合并数量？
     # V1 简单起见，直接改位置 ID。
@@ -337,3 +697,168 @@ def get_session_history(db: Session, session_id: str):
         .order_by(models.ChatMessage.id.asc())
         .all()
     )
+
+
+# --- 关键词检索 (搜索时先于向量检索) ---
+
+# 物品名 / 分类的 n-gram 长度，与 MySQL ngram_token_size 默认值一致
+NGRAM_SIZE = 2
+
+
+def _is_mysql(db: Session) -> bool:
+    return db.get_bind().dialect.name == "mysql"
+
+
+def make_ngrams(value: str, n: int = NGRAM_SIZE) -> set:
+    """切 n-gram："可口可乐" -> {"可口", "口可", "可乐"}，不足 n 个字时整体作为一个 gram"""
+    value = "".join((value or "").lower().split())
+    if len(value) <= n:
+        return {value} if value else set()
+    return {value[i : i + n] for i in range(len(value) - n + 1)}
+
+
+def index_item_ngrams(db: Session, item: models.Item):
+    """
+    维护 item_ngrams 表 (只在非 MySQL 下使用，MySQL 用 FULLTEXT 索引)
+    需要 item.id 已经 flush 出来；不提交
+    """
+    if _is_mysql(db):
+        return
+    db.query(models.ItemNgram).filter(models.ItemNgram.item_id == item.id).delete(
+        synchronize_session=False
+    )
+    grams = make_ngrams(item.name) | make_ngrams(item.category or "")
+    db.add_all(models.ItemNgram(gram=gram, item_id=item.id) for gram in grams)
+
+
+def rebuild_item_ngrams(db: Session) -> int:
+    """全量重建 item_ngrams (SQLite 首次启用或数据不一致时)，返回处理的物品数"""
+    if _is_mysql(db):
+        return 0
+    db.query(models.ItemNgram).delete(synchronize_session=False)
+    items = db.query(models.Item).all()
+    for item in items:
+        index_item_ngrams(db, item)
+    db.commit()
+    return len(items)
+
+
+def _escape_like(value: str) -> str:
+    return value.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+
+
+def search_items_lexical(db: Session, query: str, user_id: int = 1, limit: int = 5):
+    """
+    关键词检索物品：精确名 > 名称前缀 > 全文 (名称 / 分类 / 库存备注)
+    返回 [{"item_id", "name", "score", "match"}]，match 为 exact / prefix / fulltext，按 score 降序
+
+    - exact / prefix 走 (user_id, name) 唯一索引
+    - fulltext: MySQL 用 ngram FULLTEXT 索引；其它数据库用 item_ngrams 表按命中 gram 比例打分，
+      库存备注退化为 LIKE
+    """
+    query = (query or "").strip()
+    if not query:
+        return []
+
+    hits = {}
+
+    def add(item_id, name, score, match):
+        if item_id not in hits or hits[item_id]["score"] < score:
+            hits[item_id] = {"item_id": item_id, "name": name, "score": score, "match": match}
+
+    # 1. 精确匹配
+    exact = (
+        db.query(models.Item.id, models.Item.name)
+        .filter(models.Item.user_id == user_id, models.Item.name == query)
+        .first()
+    )
+    if exact:
+        add(exact.id, exact.name, 1.0, "exact")
+
+    # 2. 前缀匹配：名字越接近查询词分数越高
+    prefix_rows = (
+        db.query(models.Item.id, models.Item.name)
+        .filter(
+            models.Item.user_id == user_id,
+            models.Item.name.like(_escape_like(query) + "%", escape="\\"),
+        )
+        .order_by(func.length(models.Item.name))
+        .limit(limit)
+        .all()
+    )
+    for row in prefix_rows:
+        add(row.id, row.name, 0.8 + 0.15 * len(query) / len(row.name), "prefix")
+
+    # 3. 全文匹配
+    if len(hits) < limit:
+        if _is_mysql(db):
+            rows = _fulltext_mysql(db, query, user_id, limit)
+        else:
+            rows = _fulltext_ngrams(db, query, user_id, limit)
+        for item_id, name, score in rows:
+            add(item_id, name, score, "fulltext")
+
+    return sorted(hits.values(), key=lambda h: -h["score"])[:limit]
+
+
+def _fulltext_mysql(db: Session, query: str, user_id: int, limit: int):
+    """MySQL ngram FULLTEXT：相关度按本次结果的最大值归一化到 (0, 0.75]"""
+    rows = db.execute(
+        text(
+            """
+            SELECT id, name, MAX(relevance) AS relevance FROM (
+                SELECT i.id, i.name, MATCH(i.name, i.category) AGAINST (:q) AS relevance
+                FROM items i
+                WHERE i.user_id = :uid AND MATCH(i.name, i.category) AGAINST (:q)
+                UNION ALL
+                SELECT i.id, i.name, MATCH(inv.notes) AGAINST (:q) AS relevance
+                FROM inventory inv JOIN items i ON i.id = inv.item_id
+                WHERE i.user_id = :uid AND MATCH(inv.notes) AGAINST (:q)
+            ) hits
+            GROUP BY id, name
+            ORDER BY relevance DESC
+            LIMIT :limit
+            """
+        ),
+        {"q": query, "uid": user_id, "limit": limit},
+    ).all()
+    if not rows:
+        return []
+    top = max(float(r.relevance) for r in rows) or 1.0
+    return [(r.id, r.name, 0.75 * float(r.relevance) / top) for r in rows]
+
+
+def _fulltext_ngrams(db: Session, query: str, user_id: int, limit: int):
+    """item_ngrams 表：分数 = 命中的 gram 数 / 查询的 gram 数 * 0.75"""
+    grams = make_ngrams(query)
+    results = {}
+    if grams:
+        matched = func.count(models.ItemNgram.gram).label("matched")
+        rows = (
+            db.query(models.Item.id, models.Item.name, matched)
+            .join(models.ItemNgram, models.ItemNgram.item_id == models.Item.id)
+            .filter(models.Item.user_id == user_id, models.ItemNgram.gram.in_(grams))
+            .group_by(models.Item.id, models.Item.name)
+            .order_by(matched.desc())
+            .limit(limit)
+            .all()
+        )
+        for row in rows:
+            results[row.id] = (row.id, row.name, 0.75 * row.matched / len(grams))
+
+    # 库存备注没有 n-gram 表，直接 LIKE
+    note_rows = (
+        db.query(models.Item.id, models.Item.name)
+        .join(models.Inventory, models.Inventory.item_id == models.Item.id)
+        .filter(
+            models.Item.user_id == user_id,
+            models.Inventory.notes.like("%" + _escape_like(query) + "%", escape="\\"),
+        )
+        .distinct()
+        .limit(limit)
+        .all()
+    )
+    for row in note_rows:
+        results.setdefault(row.id, (row.id, row.name, 0.6))
+
+    return sorted(results.values(), key=lambda r: -r[2])[:limit]
@@ -1,18 +1,38 @@
 # app/main.py
 from fastapi import FastAPI, Depends, HTTPException
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
-from typing import List
+from typing import List, Optional
 from . import models, database, schemas, crud
-from datetime import datetime
 import app.tools
+from app.services import memory_outbox
+from app import migrations
 
 # app/main.py
 from fastapi.middleware.cors import CORSMiddleware
 
-models.Base.metadata.create_all(bind=database.engine)
-
+# 表结构由迁移管理 (python -m app.migrations upgrade，docker-compose 启动前执行)，应用启动时不再建表
 app = FastAPI(title="AI Family Butler")
 
+
+@app.on_event("startup")
+def start_background_workers():
+    try:
+        todo = migrations.pending()
+        if todo:
+            print(f"⚠️ 还有未执行的数据库迁移: {todo}，请先运行 python -m app.migrations upgrade")
+    except Exception as e:
+        print(f"⚠️ 检查数据库迁移失败: {e}")
+
+    # Mem0 写入由后台 worker 从 outbox 表异步处理
+    memory_outbox.start_workers()
+
+
+@app.on_event("shutdown")
+def stop_background_workers():
+    memory_outbox.stop_workers()
+
+
 # 👇 新增：允许所有来源访问 (开发环境方便)
 app.add_middleware(
     CORSMiddleware,
@@ -33,7 +53,13 @@ def read_root():
 def create_location(
     location: schemas.LocationCreate, db: Session = Depends(database.get_db)
 ):
-    return crud.create_location(db=db, location=location)
+    try:
+        return crud.create_location(db=db, location=location)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except IntegrityError:
+        # 位置名在整棵位置树里唯一 (不同房间的抽屉请起不同的名字，例如 "卧室抽屉")
+        raise HTTPException(status_code=409, detail=f"位置「{location.name}」已存在")
 
 
 @app.get("/locations/", response_model=List[schemas.Location])
@@ -45,11 +71,36 @@ def read_locations(
 
 
 @app.get("/locations/tree", response_model=List[schemas.LocationNode])
-def get_locations_tree(db: Session = Depends(database.get_db)):
+def get_locations_tree(root_id: Optional[int] = None, db: Session = Depends(database.get_db)):
     """
     获取树状的位置结构，适合前端级联选择器使用
+    指定 root_id 时只返回这个位置下面的子树
     """
-    return crud.get_location_tree(db)
+    return crud.get_location_tree(db, root_id=root_id)
+
+
+@app.put("/locations/{location_id}/parent", response_model=schemas.Location)
+def move_location(
+    location_id: int, move: schemas.LocationMove, db: Session = Depends(database.get_db)
+):
+    """
+    把位置 (连同它下面的所有子位置) 挂到另一个位置下面
+    """
+    try:
+        return crud.move_location(db, location_id, move.parent_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+@app.get("/locations/{location_id}/inventory")
+def get_location_inventory(location_id: int, db: Session = Depends(database.get_db)):
+    """
+    这个位置及其所有子位置里的库存 ("厨房里有什么"，包括橱柜、抽屉里的)
+    """
+    records = crud.get_subtree_inventory(db, location_id=location_id)
+    if records is None:
+        raise HTTPException(status_code=404, detail="位置不存在")
+    return {"location_id": location_id, "records": records}
 
 
 # --- Item APIs (录入) ---
@@ -64,6 +115,7 @@ from typing import Optional
 
 # 引入我们刚刚写好的 Mem0 实例
 from app.core.config import m
+from app.services import memory_compaction, memory_writer
 
 
 # 定义输入数据格式
@@ -78,25 +130,27 @@ def add_memory(input: MemoryInput):
     接收自然语言，将其存入向量数据库 (联想大脑)
     """
     # user_id 暂时写死，未来可以从登录信息获取
-    m.add(input.text, user_id="user_1")
+    m.add(input.text, user_id="user_1", metadata={"type": memory_writer.TYPE_NOTE})
     return {"status": "success", "message": "Memory stored successfully"}
 
 
 # --- 新增接口 2: 语义搜索 ---
 @app.get("/memories/search")
-def search_memory(query: str):
+def search_memory(query: str, type: Optional[str] = None):
     """
     语义搜索：输入 "喝的"，能找到 "牛奶"
+    type 可选 item / note / consumption，只搜这一类记忆
     """
+    if type is not None and type not in memory_writer.MEMORY_TYPES:
+        raise HTTPException(status_code=400, detail=f"type 应为 {memory_writer.MEMORY_TYPES} 之一")
     # limit=3 表示返回最相关的3条
-    memories = m.search(query, user_id="user_1", limit=3)
-    return {"results": memories}
+    return {"results": business.search_memories(query, type, limit=3)}
 
 
 # app/main.py
 
 # 引入新写的服务
-from app.services import llm_service
+from app.services import llm_service, business
 
 
 class OnlyTextInput(BaseModel):
@@ -110,147 +164,29 @@ def auto_add_memory(input: OnlyTextInput, db: Session = Depends(database.get_db)
     - 如果能识别物品 -> 存库存 (MySQL) + 存记忆 (Mem0)
     - 如果不能识别 -> 只存记忆 (Mem0)
     """
-    print(f"收到录入请求: {input.text}")
+    return business.logic_add_item(input.text, db)
 
-    # 1. 尝试让 LLM 提取信息
-    extracted_json = llm_service.extract_item_info(input.text)
-    print(f"LLM 提取结果: {extracted_json}")
 
-    # 准备 Mem0 需要的 Metadata
-    metadata = {"pure_text": input.text, "timestamp": str(datetime.now())}
+class BatchTextInput(BaseModel):
+    text: str  # 多行文本，一行一样东西 (例如粘贴的购物小票)
 
-    # 返回给前端的信息
-    response_data = {
-        "status": "success",
-        "mode": "memory_only",  # 默认为纯记忆模式
-        "ai_extraction": extracted_json,
-    }
-
-    # --- 分支判断 ---
-
-    # 判断标准：LLM 提取出了 JSON，并且里面有有效的 'name'
-    if extracted_json and extracted_json.get("name"):
-        # === 进入 [库存模式] ===
-        response_data["mode"] = "inventory_mode"
-
-        # A1. 处理位置
-        loc_name = extracted_json.get("location") or "未分类区域"
-        location_obj = crud.get_or_create_location_by_name(db, loc_name)
-
-        # A2. 写入 MySQL
-        # (注意：如果您还没做 Decimal 修复，这里要小心 float)
-        try:
-            item_data = schemas.ItemCreate(
-                name=extracted_json["name"],
-                category=extracted_json.get("category"),
-                quantity=extracted_json.get("quantity", 1),
-                unit=extracted_json.get("unit", "个"),
-                location_id=location_obj.id,
-                image_url=None,  # 未来这里可以接图片URL
-            )
-            inventory_rec = crud.create_item_with_inventory(db, item_data)
 
-            # A3. 关键步骤：把生成的 item_id 放进 Metadata
-            metadata["item_id"] = inventory_rec.item_id
-
-            response_data["db_record"] = {
-                "item": inventory_rec.item.name,
-                "location": location_obj.name,
-                "quantity": inventory_rec.quantity,
-            }
-        except Exception as e:
-            print(f"⚠️ 写入库存失败，降级为纯记忆存储: {e}")
-            # 如果数据库写入失败，不应该报错给用户，而是降级存入 Mem0
-            response_data["warning"] = f"库存写入失败: {str(e)}"
-
-    else:
-        # === 进入 [纯记忆模式] ===
-        print("未识别出具体物品，仅作为笔记存储")
-        metadata["type"] = "note"  # 标记为笔记类型
-
-    # --- 统一写入 Mem0 ---
-    # 无论是否提取出物品，这句话本身都是有价值的记忆
-    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-    memory_text = f"[{current_time}] {input.text}"
-
-    m.add(memory_text, user_id="user_1", metadata=metadata)
-
-    return response_data
-
-
-# app/main.py -> search_smart_memory
+@app.post("/memories/auto_add_batch")
+def auto_add_memory_batch(
+    input: BatchTextInput, db: Session = Depends(database.get_db)
+):
+    """
+    批量智能录入：一次提交多行，合并 LLM 调用、单事务写库存、批量写记忆
+    """
+    return business.logic_add_items_batch(input.text, db)
 
 
 @app.get("/memories/search_smart")
 def search_smart_memory(query: str, db: Session = Depends(database.get_db)):
-    # 1. 问 Mem0
-    memories = m.search(query, user_id="user_1", limit=5)
-
-    # 调试输出
-    print(f"🔍 DEBUG - Mem0 search {query} 返回类型: {type(memories)}")
-    print(f"🔍 DEBUG - Mem0 search {query} 返回内容: {memories}")
-
-    # 2. 提取所有相关的 item_id，并去重
-    # 我们只关心搜到了哪些"物品"，不关心具体是哪条"记忆"触发的
-    found_item_ids = set()
-
-    # 检查 memories 的结构
-    if isinstance(memories, dict):
-        # 如果返回的是字典，检查是否有 results 键
-        if "results" in memories:
-            memory_list = memories["results"]
-        else:
-            memory_list = [memories]
-    elif isinstance(memories, list):
-        memory_list = memories
-    else:
-        memory_list = []
-
-    for mem in memory_list:
-        print(f"🔍 DEBUG - 处理记忆项: {mem}")
-        if isinstance(mem, dict):
-            meta = mem.get("metadata", {})
-            print(f"🔍 DEBUG - 元数据: {meta}")
-            if meta and "item_id" in meta:
-                found_item_ids.add(meta["item_id"])
-                print(f"🔍 DEBUG - 找到 item_id: {meta['item_id']}")
-
-    print(f"🔍 搜索 '{query}' 关联到的物品IDs: {found_item_ids}")
-
-    final_results = []
-
-    # 3. 遍历每个找到的物品，查它的全量库存
-    for item_id in found_item_ids:
-        # 先查物品基本信息 (名字)
-        item_obj = db.query(models.Item).filter(models.Item.id == item_id).first()
-        if not item_obj:
-            continue
-
-        # 再查它在所有位置的分布
-        inv_list = crud.get_item_all_inventories(db, item_id)
-
-        # 构造聚合后的结果
-        # 格式： 苹果 -> [冰箱: 5个, 厨房: 3个]
-        locations_detail = []
-        total_qty = 0
-
-        for inv in inv_list:
-            qty = float(inv.quantity)
-            total_qty += qty
-            locations_detail.append(
-                {"location": inv.location_name, "quantity": qty, "unit": inv.unit}
-            )
-
-        final_results.append(
-            {
-                "item_name": item_obj.name,
-                "total_quantity": total_qty,
-                "locations": locations_detail,  # 这是一个列表
-                "match_score": 0.9,  # 这里可以简化，或者取 Mem0 的最高分
-            }
-        )
-
-    return {"results": final_results}
+    """
+    智能搜索：物品名关键词命中直接返回，否则走 Mem0 语义搜索
+    """
+    return business.logic_search_item(query, db)
 
 
 # --- 🛠️ 调试工具接口 ---
@@ -320,6 +256,53 @@ def dump_relationships(db: Session = Depends(database.get_db)):
     return {"total_records": len(report), "inventory_report": report}
 
 
+@app.get("/debug/metrics")
+def dump_metrics():
+    """
+    进程内指标：缓存命中率、耗时等
+    """
+    from app.core.metrics import metrics
+    from app.services.llm_cache import llm_cache
+    from app.services.search_cache import search_cache
+
+    return {
+        "llm_circuit": llm_service.resilient.breaker.state,
+        "prompt_cache": llm_service.prompt_cache_stats(),
+        "embedding_cache": m.embedding_model.stats(),
+        "memory_outbox": memory_outbox.stats(),
+        "search_cache": search_cache.stats(),
+        "memory_compaction": memory_compaction.stats(),
+        "memory_writes": {
+            "llm_calls_saved": metrics.get("memory.llm_calls_saved"),
+            "raw_avg_seconds": metrics.average("memory.write.raw"),
+            "infer_avg_seconds": metrics.average("memory.write.infer"),
+        },
+        "llm_cache": {
+            "extract_item_info": llm_cache.stats("extract_item_info"),
+            "classify_intent": llm_cache.stats("classify_intent"),
+        },
+        **metrics.snapshot(),
+    }
+
+
+@app.post("/debug/memories/compact")
+def compact_memories(days: int = memory_compaction.CONSUMPTION_RETENTION_DAYS):
+    """
+    把 days 天之前的消耗流水按 物品 + 月份 汇总成一条记忆，删除原始流水
+    返回压缩前后的集合大小
+    """
+    return memory_compaction.compact(days=days, user_id="user_1")
+
+
+@app.post("/debug/memories/backfill_types")
+def backfill_memory_types():
+    """
+    给分区之前写入的旧记忆补上 type (带 item_id 的算 item，其余算 note)
+    上线分区检索后跑一次，否则这些旧记忆在按类型过滤时搜不到
+    """
+    return {"updated": memory_writer.backfill_memory_types(user_id="user_1")}
+
+
 # app/main.py (替换 dump_memories 函数)
 
 
@@ -406,17 +389,19 @@ def dump_memories():
 
 
 from app.core.tool_registry import registry
-from app.services.llm_service import chat as llm_engine
+from app.services.llm_service import achat as llm_engine
+from app.services.llm_service import achat_stream as llm_stream
 import json
 from app.core.config import SYSTEM_PROMPT
 from app.services.chat_service import ChatService
+from app.services import agent_service
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import StreamingResponse
+from fastapi import BackgroundTasks
+from starlette.background import BackgroundTask
 import uuid
 
 
-# ... (前面的 imports 保持不变) ...
-from app.services.chat_service import ChatService  # 确保引入了新服务
-
-
 class ChatInput(BaseModel):
     message: str
     # 👇 新增：允许前端传 session_id
@@ -425,12 +410,16 @@ class ChatInput(BaseModel):
 
 
 @app.post("/chat")
-def chat_agent(chat: ChatInput, db: Session = Depends(database.get_db)):
-
-    current_session_id = chat.session_id or str(uuid.uuid4())
+async def chat_agent(
+    chat: ChatInput,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(database.get_db),
+):
     """
     [Agent 模式] 真正的智能中枢 (带短期记忆 + 工具调用)
+    异步实现：等待 LLM 时不占用线程，数据库操作丢到线程池
     """
+    current_session_id = chat.session_id or str(uuid.uuid4())
     user_msg = chat.message
     print(f"👤 用户: {user_msg}")
 
@@ -438,31 +427,28 @@ def chat_agent(chat: ChatInput, db: Session = Depends(database.get_db)):
     # 假设单用户系统，user_id=1。多用户时从 Token 解析
     chat_service = ChatService(db, user_id=1)
 
-    # 获取当前会话 (Session)
-    session = chat_service.ensure_session(current_session_id)
-    if session.title == "新对话":
-        # 取用户消息的前 20 个字
-        new_title = user_msg
-        chat_service.update_session_title(session.id, new_title)
-
-    # 📝 记入用户消息 (Long-term DB Log)
-    chat_service.add_message(session.id, "user", user_msg)
-
     # --- 2. 构建上下文 (Context Window) ---
-    # 从数据库拉取最近 10 条历史，并加上 System Prompt
-    messages = chat_service.get_context_messages(session.id, limit=10)
+    session, messages = await run_in_threadpool(
+        agent_service.prepare_chat_turn, chat_service, current_session_id, user_msg
+    )
 
     # 获取可用工具
     available_tools = registry.get_schemas()
 
-    # 构造执行上下文 (传给工具函数用)
-    tool_context = {"db": db, "user_id": 1}
+    # 构造执行上下文 (传给工具函数用，数据库会话由 run_tool_calls 为每个工具单独创建)
+    tool_context = {"user_id": 1}
 
     # --- 3. 第一轮调用 (Think) ---
-    ai_msg = llm_engine(messages=messages, tools=available_tools)
+    # 固定句式由本地解析器直接给出工具调用，否则问 LLM
+    ai_msg = agent_service.plan_fast_path(user_msg)
+    if ai_msg is None:
+        ai_msg = await llm_engine(
+            messages=messages, tools=available_tools, endpoint="chat.think"
+        )
+        ai_msg = ai_msg.model_dump(exclude_none=True)
 
     # --- 4. 判断是否命中工具 ---
-    if ai_msg.tool_calls:
+    if ai_msg.get("tool_calls"):
         # 📝 记入 AI 的思考/调用过程
         # (可选) 为了节省数据库空间，且 tool_calls 结构复杂，
         # 我们可以选择只在内存里保留这一步，或者将其序列化存入 content
@@ -470,54 +456,148 @@ def chat_agent(chat: ChatInput, db: Session = Depends(database.get_db)):
         # 如果需要严格审计，需修改 add_message 支持存 tool_calls 字段。
         messages.append(ai_msg)
 
-        for tool_call in ai_msg.tool_calls:
-            func_name = tool_call.function.name
-            args = json.loads(tool_call.function.arguments)
-            tool_call_id = tool_call.id
-
-            print(f"🤖 Agent 决定调用: {func_name} | 参数: {args}")
-
-            # --- 5. 动态执行工具 (Act) ---
-            try:
-                tool_result = registry.execute(func_name, args, tool_context)
-                print(f"✅ 工具执行成功: {func_name} -> {tool_result}")
-            except Exception as e:
-                tool_result = {"error": str(e)}
-                print(f"❌ 工具执行失败: {func_name} -> {str(e)}")
-
-            # 序列化结果
-            tool_result_str = json.dumps(tool_result, ensure_ascii=False, default=str)
-            print(f"🔧 工具返回给LLM的JSON: {tool_result_str}")
-
-            # 📝 记入工具执行结果 (DB Log - 可选)
-            # 如果希望历史记录里包含工具结果，可以存。这里为了简洁，建议只存最终回复。
-            # chat_service.add_message(session.id, "tool", tool_result_str, tool_call_id=tool_call_id)
-
-            # 追加到当前上下文 (给 LLM 看)
-            messages.append(
-                {
-                    "role": "tool",
-                    "tool_call_id": tool_call_id,
-                    "content": tool_result_str,
-                }
-            )
+        # --- 5. 动态执行工具 (Act) ---
+        # 多个工具调用并发执行 (例如一句话录入三样东西)
+        # 工具结果只追加到当前上下文 (给 LLM 看)，不存数据库
+        tool_messages, replies = await agent_service.run_tool_calls(
+            ai_msg["tool_calls"], tool_context
+        )
+        messages.extend(tool_messages)
 
         # --- 6. 第二轮调用 (Speak) ---
-        # LLM 看到工具结果后，生成最终回答
-        final_msg = llm_engine(messages=messages)
-        final_reply = final_msg.content
+        # 结果简单 (都有回复模板且都成功) 时本地直接生成回复，否则让 LLM 看到工具结果后生成
+        final_reply = agent_service.template_reply(replies)
+        if final_reply is None:
+            final_msg = await llm_engine(messages=messages, endpoint="chat.speak")
+            final_reply = final_msg.content
 
     else:
         # 没有调用工具，直接闲聊
-        final_reply = ai_msg.content
+        final_reply = ai_msg.get("content")
 
     # 📝 记入 AI 最终回复 (Long-term DB Log)
     # 这才是最重要的，下次加载历史时，用户看到的就是这句话
-    chat_service.add_message(session.id, "assistant", final_reply)
+    await run_in_threadpool(
+        chat_service.add_message, session.id, "assistant", final_reply
+    )
+
+    # 响应返回后再检查是否需要滚动摘要
+    background_tasks.add_task(agent_service.summarize_session_job, session.id)
 
     return {"reply": final_reply, "session_id": current_session_id}
 
 
+def _sse(event: str, data: dict) -> str:
+    """格式化一条 Server-Sent Event"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False, default=str)}\n\n"
+
+
+@app.post("/chat/stream")
+async def chat_agent_stream(chat: ChatInput):
+    """
+    [Agent 模式 - 流式版] 逻辑与 /chat 相同，但通过 SSE 边生成边推送
+
+    事件类型:
+    - session:     会话 ID (第一时间返回，保证首字节尽快到达)
+    - token:       回复文本片段
+    - tool_call:   Agent 决定调用的工具
+    - tool_result: 工具执行完毕
+    - done:        完整回复 (已存库)
+    - error:       出错
+    """
+    current_session_id = chat.session_id or str(uuid.uuid4())
+    user_msg = chat.message
+    print(f"👤 用户(流式): {user_msg}")
+
+    async def event_stream():
+        yield _sse("session", {"session_id": current_session_id})
+
+        # 流式响应的生命周期比依赖注入长，这里自己管理数据库会话
+        db = database.SessionLocal()
+        try:
+            chat_service = ChatService(db, user_id=1)
+            session, messages = await run_in_threadpool(
+                agent_service.prepare_chat_turn,
+                chat_service,
+                current_session_id,
+                user_msg,
+            )
+            tool_context = {"user_id": 1}
+
+            # --- 第一轮 (Think)：闲聊时这一轮的 token 就是最终回复 ---
+            # 固定句式由本地解析器直接给出工具调用，跳过这一轮
+            ai_msg = agent_service.plan_fast_path(user_msg)
+            if ai_msg is None:
+                async for kind, payload in llm_stream(
+                    messages=messages,
+                    tools=registry.get_schemas(),
+                    endpoint="chat_stream.think",
+                ):
+                    if kind == "token":
+                        yield _sse("token", {"text": payload})
+                    else:
+                        ai_msg = payload
+
+            final_reply = ai_msg.get("content") or ""
+
+            # --- 命中工具：执行后进入第二轮 (Speak) ---
+            if ai_msg.get("tool_calls"):
+                messages.append(ai_msg)
+                for tool_call in ai_msg["tool_calls"]:
+                    yield _sse(
+                        "tool_call",
+                        {
+                            "id": tool_call["id"],
+                            "name": tool_call["function"]["name"],
+                        },
+                    )
+
+                tool_messages, replies = await agent_service.run_tool_calls(
+                    ai_msg["tool_calls"], tool_context
+                )
+                messages.extend(tool_messages)
+                for tool_msg in tool_messages:
+                    yield _sse("tool_result", {"id": tool_msg["tool_call_id"]})
+
+                final_reply = agent_service.template_reply(replies)
+                if final_reply is not None:
+                    # 模板回复一次性推送
+                    yield _sse("token", {"text": final_reply})
+                else:
+                    final_parts = []
+                    async for kind, payload in llm_stream(
+                        messages=messages, endpoint="chat_stream.speak"
+                    ):
+                        if kind == "token":
+                            final_parts.append(payload)
+                            yield _sse("token", {"text": payload})
+                    final_reply = "".join(final_parts)
+
+            # 📝 完整回复落库
+            await run_in_threadpool(
+                chat_service.add_message, session.id, "assistant", final_reply
+            )
+            yield _sse(
+                "done", {"reply": final_reply, "session_id": current_session_id}
+            )
+
+        except Exception as e:
+            print(f"❌ 流式对话失败: {str(e)}")
+            yield _sse("error", {"message": str(e)})
+        finally:
+            db.close()
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        # 流结束后再检查是否需要滚动摘要
+        background=BackgroundTask(
+            agent_service.summarize_session_job, current_session_id
+        ),
+    )
+
+
 # 1. 获取会话列表
 @app.get("/sessions")
 def list_user_sessions(db: Session = Depends(database.get_db)):
@@ -0,0 +1,144 @@
+# app/migrations/__init__.py
+"""
+数据库结构迁移 (取代启动时的 create_all)
+
+- 每个迁移是本目录下的 vNNN_说明.py 模块，提供 upgrade(conn)
+- 已执行的版本记在 schema_migrations 表里，按版本号顺序执行，每个只执行一次
+- 老库是历次 create_all 建出来的，结构不一定齐全，所以迁移都先检查列 / 索引是否存在，可以重复执行
+
+用法:
+    python -m app.migrations upgrade   # 执行所有未执行的迁移
+    python -m app.migrations status    # 查看迁移状态
+"""
+
+import importlib
+import pkgutil
+import re
+from datetime import datetime
+from typing import List
+
+from sqlalchemy import (
+    Column,
+    DateTime,
+    MetaData,
+    String,
+    Table,
+    inspect,
+    text,
+)
+from sqlalchemy.engine import Connection, Engine
+from sqlalchemy.schema import CreateColumn
+
+from app import database
+
+_VERSION_PATTERN = re.compile(r"^v(\d{3})_\w+$")
+
+_meta = MetaData()
+schema_migrations = Table(
+    "schema_migrations",
+    _meta,
+    Column("version", String(10), primary_key=True),
+    Column("name", String(100), nullable=False),
+    Column("applied_at", DateTime, nullable=False),
+)
+
+
+def discover() -> List[tuple]:
+    """本目录下的迁移模块，按版本号排序: [(version, module_name)]"""
+    found = []
+    for info in pkgutil.iter_modules(__path__):
+        match = _VERSION_PATTERN.match(info.name)
+        if match:
+            found.append((match.group(1), info.name))
+    return sorted(found)
+
+
+def applied_versions(conn: Connection) -> set:
+    schema_migrations.create(conn, checkfirst=True)
+    return {row.version for row in conn.execute(schema_migrations.select())}
+
+
+def pending(engine: Engine = None) -> List[str]:
+    """还没执行的迁移模块名"""
+    with (engine or database.engine).begin() as conn:
+        done = applied_versions(conn)
+    return [name for version, name in discover() if version not in done]
+
+
+def upgrade(engine: Engine = None) -> List[str]:
+    """按顺序执行所有未执行的迁移，每个迁移一个事务，返回本次执行的模块名"""
+    engine = engine or database.engine
+    applied = []
+    for version, name in discover():
+        with engine.begin() as conn:
+            if version in applied_versions(conn):
+                continue
+            print(f"🛠️ 执行迁移 {name}")
+            module = importlib.import_module(f"{__name__}.{name}")
+            module.upgrade(conn)
+            conn.execute(
+                schema_migrations.insert().values(
+                    version=version, name=name, applied_at=datetime.now()
+                )
+            )
+        applied.append(name)
+    print(f"✅ 数据库结构已是最新 (本次执行 {len(applied)} 个迁移)")
+    return applied
+
+
+# --- 迁移里用到的工具函数 (都可以重复执行) ---
+
+
+def has_column(conn: Connection, table: str, column: str) -> bool:
+    return column in {c["name"] for c in inspect(conn).get_columns(table)}
+
+
+def has_index(conn: Connection, table: str, name: str) -> bool:
+    """普通索引或唯一约束 (SQLite 的唯一约束不出现在 get_indexes 里)"""
+    inspector = inspect(conn)
+    names = {i["name"] for i in inspector.get_indexes(table)}
+    names |= {c["name"] for c in inspector.get_unique_constraints(table)}
+    return name in names
+
+
+def add_column(conn: Connection, table: str, column: Column):
+    """列不存在时 ALTER TABLE ADD COLUMN (列定义按当前方言编译)"""
+    if has_column(conn, table, column.name):
+        return
+    ddl = CreateColumn(column).compile(dialect=conn.dialect)
+    conn.execute(text(f"ALTER TABLE {table} ADD COLUMN {ddl}"))
+
+
+def create_index(
+    conn: Connection,
+    table: str,
+    name: str,
+    columns: List[str],
+    unique: bool = False,
+    fulltext: bool = False,
+    mysql_length: dict = None,
+):
+    """
+    建索引，已存在则跳过
+    索引定义写在迁移里 (不引用 models 里的 Index)，models 以后改了也不影响旧迁移
+    fulltext=True 只用于 MySQL (ngram 分词)
+    mysql_length={列名: 长度}：MySQL 下只索引前缀 (长字符串列超出索引长度上限时用)
+    """
+    if has_index(conn, table, name):
+        return
+    kind = "UNIQUE INDEX" if unique else "FULLTEXT INDEX" if fulltext else "INDEX"
+    if mysql_length and conn.dialect.name == "mysql":
+        columns = [f"{c}({mysql_length[c]})" if c in mysql_length else c for c in columns]
+    ddl = f"CREATE {kind} {name} ON {table} ({', '.join(columns)})"
+    if fulltext:
+        ddl += " WITH PARSER ngram"
+    conn.execute(text(ddl))
+
+
+def drop_index(conn: Connection, table: str, name: str):
+    if not has_index(conn, table, name):
+        return
+    if conn.dialect.name == "mysql":
+        conn.execute(text(f"DROP INDEX {name} ON {table}"))
+    else:
+        conn.execute(text(f"DROP INDEX {name}"))
@@ -0,0 +1,15 @@
+# app/migrations/__main__.py
+import argparse
+
+from app import migrations
+
+parser = argparse.ArgumentParser(description="数据库结构迁移")
+parser.add_argument("command", choices=["upgrade", "status"])
+args = parser.parse_args()
+
+if args.command == "upgrade":
+    migrations.upgrade()
+else:
+    todo = migrations.pending()
+    for version, name in migrations.discover():
+        print(f"{'⏳' if name in todo else '✅'} {name}")
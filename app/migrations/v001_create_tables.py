@@ -0,0 +1,9 @@
+"""
+建出缺少的表 (新库一次建全；老库只补后来新增的表，已有的表不动)
+"""
+
+from app import models
+
+
+def upgrade(conn):
+    models.Base.metadata.create_all(conn, checkfirst=True)
@@ -0,0 +1,30 @@
+"""
+老库补列：这些列是在表建好之后加进 models 的，create_all 不会给已有的表加列
+- items.revision / items.updated_at：搜索缓存校验、增量重建向量索引
+- sessions.summary_until_id：滚动摘要水位线
+- memory_outbox.mode：infer / raw 两种写入路径
+"""
+
+from sqlalchemy import Column, DateTime, Integer, String, func, text
+
+from app.migrations import add_column, create_index
+
+
+def upgrade(conn):
+    add_column(conn, "items", Column("revision", Integer, nullable=False, server_default="0"))
+
+    if conn.dialect.name == "sqlite":
+        # SQLite 加列时不能用 CURRENT_TIMESTAMP 这种非常量默认值，先加列再补值
+        add_column(conn, "items", Column("updated_at", DateTime))
+        conn.execute(text("UPDATE items SET updated_at = CURRENT_TIMESTAMP WHERE updated_at IS NULL"))
+    else:
+        # 已有的行取加列时的时间，第一次增量重建会把它们全部处理一遍
+        add_column(conn, "items", Column("updated_at", DateTime, server_default=func.now()))
+    create_index(conn, "items", "ix_items_updated_at", ["updated_at"])
+
+    add_column(conn, "sessions", Column("summary_until_id", Integer, server_default="0"))
+    add_column(
+        conn,
+        "memory_outbox",
+        Column("mode", String(10), nullable=False, server_default="infer"),
+    )
@@ -0,0 +1,13 @@
+"""
+MySQL ngram 全文索引 (crud.search_items_lexical 使用)
+SQLite 没有 ngram 分词，用 item_ngrams 表代替，见 v005
+"""
+
+from app.migrations import create_index
+
+
+def upgrade(conn):
+    if conn.dialect.name != "mysql":
+        return
+    create_index(conn, "items", "ft_items_name_category", ["name", "category"], fulltext=True)
+    create_index(conn, "inventory", "ft_inventory_notes", ["notes"], fulltext=True)
@@ -0,0 +1,23 @@
+"""
+热点查询的联合索引 (scripts/check_query_plans.py 检查这些查询都不做全表扫描)
+- chat_messages (session_id, id)：按会话往回翻历史、摘要水位线之后的消息
+- sessions (user_id, is_active, updated_at)：当前活跃会话、会话列表
+- inventory (item_id, quantity)：消耗时按数量从多到少扣减
+- inventory (item_id, last_updated)：移动物品时找最近一条库存
+- locations (user_id, name)：按名字找位置
+"""
+
+from app.migrations import create_index
+
+HOT_PATH_INDEXES = [
+    ("chat_messages", "ix_chat_messages_session_id_id", ["session_id", "id"]),
+    ("sessions", "ix_sessions_user_active_updated", ["user_id", "is_active", "updated_at"]),
+    ("inventory", "ix_inventory_item_quantity", ["item_id", "quantity"]),
+    ("inventory", "ix_inventory_item_last_updated", ["item_id", "last_updated"]),
+    ("locations", "ix_locations_user_name", ["user_id", "name"]),
+]
+
+
+def upgrade(conn):
+    for table, name, columns in HOT_PATH_INDEXES:
+        create_index(conn, table, name, columns)
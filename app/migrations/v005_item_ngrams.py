@@ -0,0 +1,17 @@
+"""
+SQLite 下为已有物品补建 n-gram 倒排表 (原来在应用启动时做)
+MySQL 用 ngram 全文索引，不写这张表
+"""
+
+from sqlalchemy.orm import Session
+
+from app import crud, models
+
+
+def upgrade(conn):
+    if conn.dialect.name == "mysql":
+        return
+    db = Session(bind=conn)
+    if db.query(models.ItemNgram).first() is None and db.query(models.Item).first():
+        print(f"补建物品 n-gram 索引: {crud.rebuild_item_ngrams(db)} 个物品")
+    db.close()
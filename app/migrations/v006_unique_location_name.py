@@ -0,0 +1,60 @@
+"""
+locations (user_id, name) 改为唯一约束，录入时位置可以直接 upsert (crud.upsert_location)
+范围是整棵位置树 (不是同一父位置下)：对话里只靠名字指代位置，名字必须无歧义
+
+以前 get_or_create_location_by_name 先查后插，并发时可能建出同名位置，加约束前先合并：
+同名位置保留 id 最小的一个，其余位置上的库存挪过去 (同一物品已有库存则数量相加)，子位置改挂过去
+"""
+
+from sqlalchemy import text
+
+from app.migrations import create_index, drop_index
+
+
+def _merge_location(conn, keep_id: int, other_id: int):
+    rows = conn.execute(
+        text("SELECT id, item_id, quantity FROM inventory WHERE location_id = :other"),
+        {"other": other_id},
+    ).all()
+    for row in rows:
+        existing = conn.execute(
+            text("SELECT id FROM inventory WHERE item_id = :item AND location_id = :keep"),
+            {"item": row.item_id, "keep": keep_id},
+        ).scalar()
+        if existing:
+            conn.execute(
+                text("UPDATE inventory SET quantity = quantity + :q WHERE id = :id"),
+                {"q": row.quantity, "id": existing},
+            )
+            conn.execute(text("DELETE FROM inventory WHERE id = :id"), {"id": row.id})
+        else:
+            conn.execute(
+                text("UPDATE inventory SET location_id = :keep WHERE id = :id"),
+                {"keep": keep_id, "id": row.id},
+            )
+    conn.execute(
+        text("UPDATE locations SET parent_id = :keep WHERE parent_id = :other"),
+        {"keep": keep_id, "other": other_id},
+    )
+    conn.execute(text("DELETE FROM locations WHERE id = :other"), {"other": other_id})
+
+
+def upgrade(conn):
+    groups = conn.execute(
+        text(
+            "SELECT user_id, name, MIN(id) AS keep_id FROM locations "
+            "GROUP BY user_id, name HAVING COUNT(*) > 1"
+        )
+    ).all()
+    for group in groups:
+        others = conn.execute(
+            text("SELECT id FROM locations WHERE user_id = :uid AND name = :name AND id <> :keep"),
+            {"uid": group.user_id, "name": group.name, "keep": group.keep_id},
+        ).scalars()
+        for other_id in list(others):
+            _merge_location(conn, group.keep_id, other_id)
+        print(f"合并同名位置 '{group.name}' -> #{group.keep_id}")
+
+    create_index(conn, "locations", "uix_user_location_name", ["user_id", "name"], unique=True)
+    # 唯一索引已经覆盖 (user_id, name) 查询
+    drop_index(conn, "locations", "ix_locations_user_name")
@@ -0,0 +1,56 @@
+"""
+补齐 locations.path (物化路径 "/1/5")，并加上子树查询用的索引
+
+以前 path 从来没有写过，这里按 parent_id 从根往下算一遍，和现有值不同的才更新；
+parent_id 成环或指向不存在位置的，当作根位置处理
+- locations (user_id, path)：子树按路径前缀区间扫描 (MySQL 只索引前 255 个字符)
+- inventory (location_id)：按位置取库存 (MySQL 建外键时已自带以 location_id 开头的索引，就不重复建)
+"""
+
+from sqlalchemy import inspect, text
+
+from app.migrations import create_index
+
+
+def compute_paths(rows) -> dict:
+    """rows: [(id, parent_id)] -> {id: path}"""
+    parents = {row_id: parent_id for row_id, parent_id in rows}
+    paths = {}
+
+    def path_of(location_id, seen=()):
+        if location_id in paths:
+            return paths[location_id]
+        parent_id = parents[location_id]
+        if parent_id not in parents or parent_id in seen or parent_id == location_id:
+            if parent_id is not None:
+                print(f"⚠️ 位置 #{location_id} 的父位置 #{parent_id} 无效，按根位置处理")
+            path = f"/{location_id}"
+        else:
+            path = f"{path_of(parent_id, seen + (location_id,))}/{location_id}"
+        paths[location_id] = path
+        return path
+
+    for location_id in parents:
+        path_of(location_id)
+    return paths
+
+
+def upgrade(conn):
+    rows = conn.execute(text("SELECT id, parent_id, path FROM locations")).all()
+    current = {row.id: row.path for row in rows}
+    changed = 0
+    for location_id, path in compute_paths([(row.id, row.parent_id) for row in rows]).items():
+        if current[location_id] != path:
+            conn.execute(
+                text("UPDATE locations SET path = :path WHERE id = :id"),
+                {"path": path, "id": location_id},
+            )
+            changed += 1
+    print(f"补齐位置路径: {changed} / {len(rows)} 个位置")
+
+    create_index(
+        conn, "locations", "ix_locations_user_path", ["user_id", "path"], mysql_length={"path": 255}
+    )
+    leading = {i["column_names"][0] for i in inspect(conn).get_indexes("inventory") if i["column_names"]}
+    if "location_id" not in leading:
+        create_index(conn, "inventory", "ix_inventory_location_id", ["location_id"])
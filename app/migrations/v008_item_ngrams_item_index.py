@@ -0,0 +1,15 @@
+"""
+item_ngrams (item_id) 索引：录入时按 item_id 判断物品是否已建 n-gram (crud.create_item_with_inventory /
+bulk_upsert_inventory)，主键 (gram, item_id) 以 gram 开头，按 item_id 查会全表扫描
+MySQL 建外键时已自带以 item_id 开头的索引，就不重复建
+"""
+
+from sqlalchemy import inspect
+
+from app.migrations import create_index
+
+
+def upgrade(conn):
+    leading = {i["column_names"][0] for i in inspect(conn).get_indexes("item_ngrams") if i["column_names"]}
+    if "item_id" not in leading:
+        create_index(conn, "item_ngrams", "ix_item_ngrams_item_id", ["item_id"])
@@ -8,11 +8,21 @@ from sqlalchemy import (
     DECIMAL,
     DateTime,
     func,
+    Index,
     UniqueConstraint,
 )
 from sqlalchemy.orm import relationship
+from sqlalchemy.dialects import sqlite
+from datetime import datetime
 from .database import Base
 
+# 精确到秒的时间 (与 CURRENT_TIMESTAMP 一致)：SQLite 按字符串比较时间，
+# 默认格式带微秒，和服务端默认值 "YYYY-MM-DD HH:MM:SS" 比较会出错
+SecondsDateTime = DateTime().with_variant(
+    sqlite.DATETIME(storage_format="%(year)04d-%(month)02d-%(day)02d %(hour)02d:%(minute)02d:%(second)02d"),
+    "sqlite",
+)
+
 
 class Item(Base):
     __tablename__ = "items"
@@ -22,13 +32,26 @@ class Item(Base):
     name = Column(String(255), nullable=False)
     category = Column(String(100))
     image_url = Column(String(500))
+    revision = Column(Integer, nullable=False, default=0, server_default="0")  # 库存每变动一次 +1，搜索缓存据此判断是否过期
     created_at = Column(DateTime, server_default=func.now())
+    # 物品或其库存最后变动时间，重建索引任务 (reindex.py) 按它增量扫描
+    updated_at = Column(SecondsDateTime, server_default=func.now(), onupdate=func.now(), index=True)
 
     # 关系：一个物品可以有多个库存记录
     inventory_records = relationship("Inventory", back_populates="item")
 
     # 约束：同一个用户下物品名唯一
-    __table_args__ = (UniqueConstraint("user_id", "name", name="uix_user_item_name"),)
+    # 全文索引 (MySQL ngram 分词，支持中文)：crud.search_items_lexical 使用，SQLite 下用 item_ngrams 表代替
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uix_user_item_name"),
+        Index(
+            "ft_items_name_category",
+            "name",
+            "category",
+            mysql_prefix="FULLTEXT",
+            mysql_with_parser="ngram",
+        ),
+    )
 
 
 class Location(Base):
@@ -38,13 +61,21 @@ class Location(Base):
     user_id = Column(Integer, nullable=False, default=1)
     name = Column(String(255), nullable=False)
     parent_id = Column(Integer, ForeignKey("locations.id"), nullable=True)
-    path = Column(String(1000))  # 例如 "/1/5"
+    path = Column(String(1000))  # 物化路径，祖先 ID 链，例如 "/1/5" (crud 在新建 / 移动位置时维护)
     created_at = Column(DateTime, server_default=func.now())
 
     # 关系：自关联 (子位置)
     children = relationship("Location", backref="parent", remote_side=[id])
     inventory_records = relationship("Inventory", back_populates="location")
 
+    # 约束：同一个用户下位置名在整棵位置树里唯一 (不是同一父位置下唯一)：
+    # 对话和工具只靠名字指代位置 (录入时按名字 upsert，"厨房里有什么" 按名字找子树)，名字必须无歧义
+    # 子树查询按路径前缀区间扫描 (crud.in_subtree)；MySQL utf8mb4 下索引长度有上限，只索引前 255 个字符
+    __table_args__ = (
+        UniqueConstraint("user_id", "name", name="uix_user_location_name"),
+        Index("ix_locations_user_path", "user_id", "path", mysql_length={"path": 255}),
+    )
+
 
 class Inventory(Base):
     __tablename__ = "inventory"
@@ -64,6 +95,11 @@ class Inventory(Base):
 
     __table_args__ = (
         UniqueConstraint("item_id", "location_id", name="uix_item_location"),
+        Index("ft_inventory_notes", "notes", mysql_prefix="FULLTEXT", mysql_with_parser="ngram"),
+        # 消耗时按数量从多到少扣减 / 移动物品时找最近一条库存 / 按位置列出库存
+        Index("ix_inventory_item_quantity", "item_id", "quantity"),
+        Index("ix_inventory_item_last_updated", "item_id", "last_updated"),
+        Index("ix_inventory_location_id", "location_id"),
     )
 
 
@@ -81,6 +117,7 @@ class Session(Base):
     user_id = Column(Integer, nullable=False, default=1)
     title = Column(String(100), nullable=True)
     summary = Column(Text, nullable=True)  # 长期记忆的压缩摘要
+    summary_until_id = Column(Integer, default=0)  # 摘要已覆盖到的最后一条消息 ID (水位线)
     created_at = Column(DateTime, server_default=func.now())
     updated_at = Column(DateTime, server_default=func.now(), onupdate=func.now())
     is_active = Column(Integer, default=1)  # 1=活跃, 0=归档
@@ -90,6 +127,11 @@ class Session(Base):
         "ChatMessage", back_populates="session", order_by="ChatMessage.created_at"
     )
 
+    # 当前活跃会话 / 会话列表
+    __table_args__ = (
+        Index("ix_sessions_user_active_updated", "user_id", "is_active", "updated_at"),
+    )
+
 
 class ChatMessage(Base):
     __tablename__ = "chat_messages"
@@ -98,10 +140,82 @@ class ChatMessage(Base):
     session_id = Column(String(36), ForeignKey("sessions.id"), nullable=False)
     role = Column(String(20), nullable=False)  # user, assistant, system, tool
     content = Column(
-        LONGTEXT, nullable=True
-    )  # 内容可能很长，如果是工具调用可能包含 JSON
+        Text().with_variant(LONGTEXT, "mysql"), nullable=True
+    )  # 内容可能很长，如果是工具调用可能包含 JSON (MySQL 下为 LONGTEXT)
     tool_call_id = Column(String(100), nullable=True)  # 专门存 OpenAI 的 tool_call_id
-    token_count = Column(Integer, default=0)  # 预留，未来做精细化控制
+    token_count = Column(Integer, default=0)  # 估算的 token 数，用于按预算裁剪上下文
     created_at = Column(DateTime, server_default=func.now())
 
     session = relationship("Session", back_populates="messages")
+
+    # 按会话往回翻历史 (按 id 排序)
+    __table_args__ = (Index("ix_chat_messages_session_id_id", "session_id", "id"),)
+
+
+class ItemNgram(Base):
+    """
+    物品名 / 分类的 2-gram 倒排表
+    SQLite 没有 ngram FULLTEXT 索引，用这张表代替 (MySQL 下不写这张表)
+    """
+
+    __tablename__ = "item_ngrams"
+
+    gram = Column(String(8), primary_key=True)
+    item_id = Column(Integer, ForeignKey("items.id"), primary_key=True)
+
+    # 按物品查 (录入时判断是不是新物品、重建某个物品的 n-gram)，主键是 gram 开头用不上
+    __table_args__ = (Index("ix_item_ngrams_item_id", "item_id"),)
+
+
+class LLMCacheEntry(Base):
+    """LLM 结果缓存 (llm_cache.SQLCacheBackend 使用)"""
+
+    __tablename__ = "llm_cache"
+
+    cache_key = Column(String(64), primary_key=True)  # sha256(归一化文本 + Prompt 版本 + 模型)
+    namespace = Column(String(50), nullable=False)  # extract_item_info / classify_intent
+    value = Column(Text, nullable=False)  # JSON
+    created_at = Column(DateTime, server_default=func.now())
+    expires_at = Column(DateTime, nullable=False, index=True)
+
+
+class MemoryOutbox(Base):
+    """
+    Mem0 写入发件箱 (memory_outbox.py 使用)
+    与库存变更在同一个事务里写入，由后台 worker 异步写进 Mem0
+    """
+
+    __tablename__ = "memory_outbox"
+
+    id = Column(Integer, primary_key=True, index=True)
+    user_id = Column(String(50), nullable=False, default="user_1")  # Mem0 的 user_id
+    text = Column(Text, nullable=False)  # 要写入 Mem0 的记忆文本
+    metadata_json = Column(Text, nullable=True)  # Mem0 metadata (JSON)
+    mode = Column(String(10), nullable=False, default="infer", server_default="infer")  # infer: m.add / raw: 直接写向量
+    status = Column(String(20), nullable=False, default="pending")  # pending / processing / done / failed
+    attempts = Column(Integer, nullable=False, default=0)
+    last_error = Column(Text, nullable=True)
+    available_at = Column(DateTime, nullable=False, default=datetime.now)  # 重试退避：到这个时间之后才能再领取
+    locked_by = Column(String(64), nullable=True)  # 领取该行的 worker
+    locked_until = Column(DateTime, nullable=True)  # 租约到期时间，worker 挂掉后由其它 worker 接手
+    created_at = Column(DateTime, nullable=False, default=datetime.now)
+    processed_at = Column(DateTime, nullable=True)
+
+    __table_args__ = (
+        Index("ix_memory_outbox_status_available", "status", "available_at"),
+    )
+
+
+class ReindexCheckpoint(Base):
+    """
+    重建向量索引的断点 (reindex.py 使用)
+    按 (items.updated_at, items.id) 键集分页，记下最后处理完的一行，中断后从这里继续
+    """
+
+    __tablename__ = "reindex_checkpoints"
+
+    job = Column(String(64), primary_key=True)
+    last_updated_at = Column(SecondsDateTime, nullable=True)
+    last_item_id = Column(Integer, nullable=False, default=0)
+    rows_done = Column(Integer, nullable=False, default=0)  # 累计处理的物品数
+    finished_at = Column(DateTime, nullable=True)  # 最近一次完整跑完的时间
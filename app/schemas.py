@@ -14,6 +14,10 @@ class LocationCreate(LocationBase):
     pass
 
 
+class LocationMove(BaseModel):
+    parent_id: Optional[int] = None  # None 表示移到最顶层
+
+
 class Location(LocationBase):
     id: int
     user_id: int
@@ -0,0 +1,191 @@
+# app/services/agent_service.py
+"""
+Agent 对话编排
+/chat 和 /chat/stream 共用的步骤：准备上下文、执行工具调用
+"""
+
+import os
+import json
+import uuid
+import asyncio
+import threading
+from typing import Any, Dict, List, Optional, Tuple
+
+from app import database
+from app.core.metrics import metrics
+from app.core.tool_registry import registry
+from app.services import fast_parser
+from app.services.chat_service import ChatService
+
+# 工具结果都能用模板渲染时，跳过第二轮 (Speak) LLM 调用
+SKIP_SPEAK_ENABLED = os.getenv("SKIP_SPEAK_ENABLED", "1") == "1"
+
+
+def prepare_chat_turn(chat_service: ChatService, session_id: str, user_msg: str):
+    """
+    一轮对话开始前的数据库操作 (建会话、记用户消息、拉上下文)
+    全部是同步查库，调用方合并成一次放进线程池执行
+    """
+    # 获取当前会话 (Session)
+    session = chat_service.ensure_session(session_id)
+    if session.title == "新对话":
+        # 取用户消息的前 20 个字
+        new_title = user_msg
+        chat_service.update_session_title(session.id, new_title)
+
+    # 📝 记入用户消息 (Long-term DB Log)
+    chat_service.add_message(session.id, "user", user_msg)
+
+    # 按 token 预算从数据库拉取最近的历史，并加上 System Prompt
+    messages = chat_service.get_context_messages(session.id)
+    return session, messages
+
+
+def plan_fast_path(user_msg: str) -> Optional[Dict[str, Any]]:
+    """
+    固定句式 (例如 "喝了1瓶可乐") 由本地解析器直接决定调用哪个工具，省掉第一轮 LLM 调用
+    返回与 LLM 格式相同的 assistant 消息 (dict)；没把握时返回 None，交给 LLM
+    """
+    parsed = fast_parser.parse(user_msg)
+    if not parsed or not parsed.confident:
+        return None
+
+    if parsed.intent == fast_parser.INTENT_ADD:
+        # 录入工具内部也会先走本地解析，不会再调 LLM
+        func_name, args = "record_new_item", {"user_text": user_msg}
+    elif parsed.intent == fast_parser.INTENT_USE:
+        func_name, args = "consume_item", {
+            "item_name": parsed.name,
+            "quantity": parsed.quantity,
+        }
+    elif parsed.intent == fast_parser.INTENT_QUERY:
+        func_name, args = "search_item", {"query": parsed.name}
+    else:
+        return None
+
+    metrics.inc("chat.fast_parse")
+    print(f"⚡ 本地解析命中: {func_name} | 参数: {args}")
+    return {
+        "role": "assistant",
+        "content": None,
+        "tool_calls": [
+            {
+                "id": f"call_fast_{uuid.uuid4().hex[:16]}",
+                "type": "function",
+                "function": {
+                    "name": func_name,
+                    "arguments": json.dumps(args, ensure_ascii=False),
+                },
+            }
+        ],
+    }
+
+
+def parse_tool_call(tool_call: Any) -> Tuple[str, str, dict]:
+    """
+    拆出 (tool_call_id, 函数名, 参数)
+    兼容 SDK 返回的对象和流式接口拼出来的 dict
+    """
+    if isinstance(tool_call, dict):
+        function = tool_call["function"]
+        return tool_call["id"], function["name"], json.loads(function["arguments"] or "{}")
+
+    return (
+        tool_call.id,
+        tool_call.function.name,
+        json.loads(tool_call.function.arguments or "{}"),
+    )
+
+
+async def execute_tool_call(
+    tool_call: Any, tool_context: dict
+) -> Tuple[Dict[str, Any], Optional[str]]:
+    """
+    执行单个工具调用
+    返回 (追加到上下文里的 tool 消息, 模板渲染的回复 或 None)
+    """
+    tool_call_id, func_name, args = parse_tool_call(tool_call)
+    print(f"🤖 Agent 决定调用: {func_name} | 参数: {args}")
+
+    # --- 动态执行工具 (Act) ---
+    try:
+        tool_result = await registry.aexecute(func_name, args, tool_context)
+        print(f"✅ 工具执行成功: {func_name} -> {tool_result}")
+    except Exception as e:
+        tool_result = {"error": str(e)}
+        print(f"❌ 工具执行失败: {func_name} -> {str(e)}")
+
+    # 序列化结果
+    tool_result_str = json.dumps(tool_result, ensure_ascii=False, default=str)
+    print(f"🔧 工具返回给LLM的JSON: {tool_result_str}")
+
+    tool_message = {
+        "role": "tool",
+        "tool_call_id": tool_call_id,
+        "content": tool_result_str,
+    }
+    return tool_message, registry.render_response(func_name, args, tool_result)
+
+
+async def run_tool_calls(
+    tool_calls: List[Any], tool_context: dict
+) -> Tuple[List[dict], List[Optional[str]]]:
+    """
+    并发执行本轮所有工具调用
+    返回 (tool 消息列表, 模板回复列表)，都与 tool_calls 顺序一致
+
+    - 每个工具调用使用独立的数据库会话 (Session 不能跨线程共享)
+    - 同时执行的数量受 ToolRegistry 线程池大小限制
+    """
+
+    async def _run_one(tool_call):
+        db = database.SessionLocal()
+        try:
+            return await execute_tool_call(tool_call, {**tool_context, "db": db})
+        finally:
+            db.close()
+
+    # gather 按传入顺序返回结果，保证 tool 消息顺序与 tool_call_id 对应
+    results = await asyncio.gather(*(_run_one(tc) for tc in tool_calls))
+    return [msg for msg, _ in results], [reply for _, reply in results]
+
+
+def template_reply(replies: List[Optional[str]]) -> Optional[str]:
+    """
+    本轮所有工具都成功且都有模板时，直接拼出最终回复 (跳过第二轮 LLM)
+    否则返回 None
+    """
+    metrics.inc("chat.tool_turns")
+    if not SKIP_SPEAK_ENABLED or not replies or any(r is None for r in replies):
+        return None
+
+    metrics.inc("chat.speak_skipped")
+    return "\n".join(replies)
+
+
+# 正在做摘要的会话，避免同一进程里重复排队
+_summarizing = set()
+_summarizing_lock = threading.Lock()
+
+
+def summarize_session_job(session_id: str):
+    """
+    后台任务：对话结束后检查是否需要滚动摘要 (不占用请求时间)
+    使用独立的数据库会话；跨进程的并发由 update_summary 的水位线保证
+    """
+    with _summarizing_lock:
+        if session_id in _summarizing:
+            return
+        _summarizing.add(session_id)
+
+    db = database.SessionLocal()
+    try:
+        chat_service = ChatService(db, user_id=1)
+        if chat_service.needs_summary(session_id):
+            chat_service.update_summary(session_id)
+    except Exception as e:
+        print(f"⚠️ 会话摘要失败: {session_id} -> {e}")
+    finally:
+        db.close()
+        with _summarizing_lock:
+            _summarizing.discard(session_id)
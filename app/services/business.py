@@ -1,7 +1,17 @@
 from sqlalchemy.orm import Session
-from app import crud, schemas, models
+from app import crud, schemas
 from app.core.config import m
-from app.services import llm_service
+from app.core.metrics import metrics
+from app.services import llm_service, fast_parser, memory_outbox
+from app.services.search_cache import search_cache
+from app.services.memory_writer import (
+    MODE_INFER,
+    MODE_RAW,
+    TYPE_CONSUMPTION,
+    TYPE_ITEM,
+    TYPE_NOTE,
+    to_similarity,
+)
 from datetime import datetime
 import uuid
 
@@ -11,15 +21,21 @@ def logic_add_item(text: str, db: Session):
     智能录入逻辑：
     - 如果能识别物品 -> 存库存 (MySQL) + 存记忆 (Mem0)
     - 如果不能识别 -> 只存记忆 (Mem0)
+    Mem0 写入先登记到 outbox，与库存在同一个事务提交，由后台 worker 异步写入
     """
     print(f"收到录入请求: {text}")
 
-    # 1. 尝试让 LLM 提取信息
-    extracted_json = llm_service.extract_item_info(text)
-    print(f"LLM 提取结果: {extracted_json}")
+    # 1. 固定句式先走本地解析，解析不了 (或没把握) 再让 LLM 提取信息
+    parsed = fast_parser.parse(text)
+    if parsed and parsed.intent == fast_parser.INTENT_ADD and parsed.confident:
+        extracted_json = parsed.to_item_info()
+        print(f"本地解析结果: {extracted_json}")
+    else:
+        extracted_json = llm_service.extract_item_info(text)
+        print(f"LLM 提取结果: {extracted_json}")
 
     # 准备 Mem0 需要的 Metadata
-    metadata = {"pure_text": text, "timestamp": str(datetime.now())}
+    metadata = {"pure_text": text, "timestamp": str(datetime.now()), "type": TYPE_ITEM}
 
     # 返回结果
     response_data = {
@@ -33,122 +49,242 @@ def logic_add_item(text: str, db: Session):
         # 进入库存模式
         response_data["mode"] = "inventory_mode"
 
-        # A1. 处理位置
+        # A1 + A2. 位置、物品、库存都是 upsert，和 Mem0 outbox 在同一个事务里提交
         loc_name = extracted_json.get("location") or "未分类区域"
-        location_obj = crud.get_or_create_location_by_name(db, loc_name)
-
-        # A2. 写入 MySQL
         try:
             item_data = schemas.ItemCreate(
                 name=extracted_json["name"],
                 category=extracted_json.get("category"),
                 quantity=extracted_json.get("quantity", 1),
                 unit=extracted_json.get("unit", "个"),
-                location_id=location_obj.id,
+                location_id=crud.upsert_location(db, loc_name),
                 image_url=None,
             )
-            inventory_rec = crud.create_item_with_inventory(db, item_data)
+            inventory_rec = crud.create_item_with_inventory(db, item_data, commit=False)
 
             # A3. 关键步骤：把生成的 item_id 放进 Metadata
             metadata["item_id"] = inventory_rec.item_id
 
             response_data["db_record"] = {
-                "item": inventory_rec.item.name,
-                "location": location_obj.name,
+                "item": item_data.name,
+                "location": loc_name,
                 "quantity": inventory_rec.quantity,
+                "unit": inventory_rec.unit,
             }
         except Exception as e:
             print(f"⚠️ 写入库存失败，降级为纯记忆存储: {e}")
             # 如果数据库写入失败，不应该报错给用户，而是降级存入 Mem0
+            db.rollback()
             response_data["warning"] = f"库存写入失败: {str(e)}"
+            metadata["type"] = TYPE_NOTE
 
     else:
         # 进入纯记忆模式
         print("未识别出具体物品，仅作为笔记存储")
-        metadata["type"] = "note"  # 标记为笔记类型
+        metadata["type"] = TYPE_NOTE  # 标记为笔记类型
 
     # 统一写入 Mem0
     # 无论是否提取出物品，这句话本身都是有价值的记忆
     current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
     memory_text = f"[{current_time}] {text}"
 
-    m.add(memory_text, user_id="user_1", metadata=metadata)
+    # 已入库的物品记录是确定的事实，直接写向量；识别不出物品的自由文本才让 Mem0 做 LLM 提取
+    mode = MODE_RAW if "item_id" in metadata else MODE_INFER
+    memory_outbox.enqueue(db, memory_text, metadata, mode=mode)
+    db.commit()
 
     return response_data
 
 
-def logic_search_item(query: str, db: Session):
+def logic_add_items_batch(text: str, db: Session):
     """
-    智能搜索逻辑：
-    1. 先在 Mem0 中语义搜索
-    2. 提取所有相关的 item_id
-    3. 查 MySQL 获取库存详情
+    批量智能录入 (例如粘贴一整张购物小票，一行一样东西)
+    - 固定句式的行本地解析，其余行合并成少数几次 LLM 调用批量提取
+    - 所有库存和 Mem0 outbox 记录在一个事务里写入 MySQL，Mem0 由后台 worker 异步写入
     """
-    # 1. 问 Mem0
-    memories = m.search(query, user_id="user_1", limit=5)
+    lines = [line.strip() for line in text.splitlines() if line.strip()]
+    print(f"收到批量录入请求: {len(lines)} 行")
 
-    # 调试输出
-    print(f"🔍 DEBUG - Mem0 search {query} 返回类型: {type(memories)}")
-    print(f"🔍 DEBUG - Mem0 search {query} 返回内容: {memories}")
+    # 1. 先本地解析，剩下的行交给 LLM 批量提取
+    extracted = [None] * len(lines)
+    pending = []
+    for i, line in enumerate(lines):
+        parsed = fast_parser.parse(line)
+        if parsed and parsed.intent == fast_parser.INTENT_ADD and parsed.confident:
+            extracted[i] = parsed.to_item_info()
+        else:
+            pending.append(i)
+
+    if pending:
+        llm_results = llm_service.extract_items_batch([lines[i] for i in pending])
+        for i, info in zip(pending, llm_results):
+            extracted[i] = info
+    print(f"批量提取完成: 本地解析 {len(lines) - len(pending)} 行, LLM 提取 {len(pending)} 行")
+
+    # 2. 一个事务写入全部库存
+    item_rows = [i for i, info in enumerate(extracted) if info and info.get("name")]
+    entries = [extracted[i] for i in item_rows]
+
+    response_data = {"status": "success", "total": len(lines), "items": [], "notes": []}
+    item_ids = {}
+    try:
+        records = crud.bulk_upsert_inventory(db, entries, commit=False)
+        for i, rec in zip(item_rows, records):
+            item_ids[i] = rec["item_id"]
+            response_data["items"].append(
+                {
+                    "text": lines[i],
+                    "item": rec["item"],
+                    "location": rec["location"],
+                    "quantity": rec["quantity"],
+                }
+            )
+    except Exception as e:
+        # 整张小票要么全部入库，要么全部不写：不把所有行悄悄降级成普通记忆
+        db.rollback()
+        print(f"❌ 批量写入库存失败，已回滚: {e}")
+        return {"status": "error", "total": len(lines), "message": f"库存写入失败: {str(e)}"}
+
+    # 3. 每行一条记忆，登记到 outbox 后和库存一起提交
+    current_time = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
+    for i, line in enumerate(lines):
+        metadata = {"pure_text": line, "timestamp": str(datetime.now())}
+        if i in item_ids:
+            metadata["item_id"] = item_ids[i]
+            metadata["type"] = TYPE_ITEM
+            mode = MODE_RAW
+        else:
+            metadata["type"] = TYPE_NOTE
+            response_data["notes"].append(line)
+            mode = MODE_INFER
+        memory_outbox.enqueue(db, f"[{current_time}] {line}", metadata, mode=mode)
+    db.commit()
 
-    # 2. 提取所有相关的 item_id，并去重
-    # 我们只关心搜到了哪些"物品"，不关心具体是哪条"记忆"触发的
-    found_item_ids = set()
+    return response_data
+
+
+def search_memories(query: str, memory_type: str = None, limit: int = 5, user_id: str = "user_1"):
+    """
+    Mem0 语义搜索，可以只搜某一类记忆 (item / note / consumption)
+    返回记忆字典列表 (统一 Mem0 不同版本的返回结构)
+    """
+    filters = {"type": memory_type} if memory_type else None
+    memories = m.search(query, user_id=user_id, limit=limit, filters=filters)
+
+    # 调试输出
+    print(f"🔍 DEBUG - Mem0 search {query} (type={memory_type}) 返回内容: {memories}")
 
     # 检查 memories 的结构
     if isinstance(memories, dict):
         # 如果返回的是字典，检查是否有 results 键
         if "results" in memories:
-            memory_list = memories["results"]
-        else:
-            memory_list = [memories]
-    elif isinstance(memories, list):
-        memory_list = memories
-    else:
-        memory_list = []
+            return memories["results"]
+        return [memories]
+    if isinstance(memories, list):
+        return memories
+    return []
+
+
+def logic_consumption_history(query: str, limit: int = 10):
+    """
+    查消耗记录 ("上次喝可乐是什么时候")：只搜消耗流水分区，按时间倒序
+    """
+    memories = search_memories(query, TYPE_CONSUMPTION, limit=limit)
+    records = [
+        {"text": mem.get("memory"), "time": mem.get("created_at"), "score": mem.get("score")}
+        for mem in memories
+        if isinstance(mem, dict)
+    ]
+    records.sort(key=lambda r: r["time"] or "", reverse=True)
+    return {"records": records}
+
 
+def _search_keyword(query: str) -> str:
+    """
+    从搜索语句里取出物品名："可乐在哪" -> "可乐"，取不出来就用原文
+    """
+    parsed = fast_parser.parse(query)
+    if parsed and parsed.intent == fast_parser.INTENT_QUERY:
+        return parsed.name
+    return query.strip()
+
+
+def logic_search_item(query: str, db: Session):
+    """
+    智能搜索逻辑：
+    1. 先按物品名关键词检索 (精确 / 前缀命中直接返回，不调用 Embedding)
+    2. 没有把握时再在 Mem0 中语义搜索，提取相关的 item_id
+    3. 查 MySQL 获取库存详情
+    结果按 (用户, 归一化的查询) 缓存，库存变动后自动作废 (见 search_cache.py)
+    """
+    results = search_cache.get_or_compute(
+        db, 1, query, lambda revisions: _search_item(query, db, revisions)
+    )
+    return {"results": results}
+
+
+def _search_item(query: str, db: Session, revisions: dict):
+    keyword = _search_keyword(query)
+
+    # 1. 关键词检索
+    lexical_hits = crud.search_items_lexical(db, keyword)
+    item_scores = {}
+    for hit in lexical_hits:
+        item_scores[hit["item_id"]] = hit["score"]
+
+    confident = [h for h in lexical_hits if h["match"] in ("exact", "prefix")]
+    if confident:
+        metrics.inc("search.lexical_hit")
+        print(f"🔍 关键词命中 '{keyword}': {[h['name'] for h in confident]}，跳过向量检索")
+        return _inventory_results(
+            db, {h["item_id"]: h["score"] for h in confident}, revisions
+        )
+
+    metrics.inc("search.vector")
+
+    # 2. 问 Mem0 (只搜物品记录分区，笔记和消耗流水不会挤占名额)
+    memory_list = search_memories(query, TYPE_ITEM)
+
+    # 提取所有相关的 item_id，并去重
+    # 我们只关心搜到了哪些"物品"，同一个物品命中多条记忆时取最高的相似度
     for mem in memory_list:
         print(f"🔍 DEBUG - 处理记忆项: {mem}")
         if isinstance(mem, dict):
             meta = mem.get("metadata", {})
-            print(f"🔍 DEBUG - 元数据: {meta}")
             if meta and "item_id" in meta:
-                found_item_ids.add(meta["item_id"])
-                print(f"🔍 DEBUG - 找到 item_id: {meta['item_id']}")
-
-    print(f"🔍 搜索 '{query}' 关联到的物品IDs: {found_item_ids}")
+                item_id = int(meta["item_id"])
+                score = to_similarity(mem.get("score"))
+                item_scores[item_id] = max(item_scores.get(item_id, 0), score)
+                print(f"🔍 DEBUG - 找到 item_id: {item_id} (相似度 {score:.3f})")
 
-    final_results = []
-
-    # 3. 遍历每个找到的物品，查它的全量库存
-    for item_id in found_item_ids:
-        # 先查物品基本信息 (名字)
-        item_obj = db.query(models.Item).filter(models.Item.id == item_id).first()
-        if not item_obj:
-            continue
+    print(f"🔍 搜索 '{query}' 关联到的物品IDs: {set(item_scores)}")
 
-        # 再查它在所有位置的分布
-        inv_list = crud.get_item_all_inventories(db, item_id)
+    return _inventory_results(db, item_scores, revisions)
 
-        # 构造聚合后的结果
-        # 格式： 苹果 -> [冰箱: 5个, 厨房: 3个]
-        locations_detail = []
-        total_qty = 0
 
-        for inv in inv_list:
-            qty = float(inv.quantity)
-            total_qty += qty
-            locations_detail.append(
-                {"location": inv.location_name, "quantity": qty, "unit": inv.unit}
-            )
+def _inventory_results(db: Session, item_scores: dict, revisions: dict = None):
+    """
+    按 item_id 批量查库存分布，组装搜索结果 (按匹配分数从高到低)
+    item_scores: {item_id: match_score}
+    revisions: 传入时记录每个物品的 revision (给搜索缓存校验用)
+    revision 和库存在同一条 SQL 里读出，是同一个快照
+    """
+    hydrated = crud.get_items_inventories(db, item_scores)
 
+    # 格式： 苹果 -> [冰箱: 5个, 厨房: 3个]
+    final_results = []
+    for item_id, score in sorted(item_scores.items(), key=lambda kv: -kv[1]):
+        entry = hydrated.get(item_id)
+        if entry is None:
+            continue
+        if revisions is not None:
+            revisions[item_id] = entry["revision"]
         final_results.append(
             {
-                "item_name": item_obj.name,
-                "total_quantity": total_qty,
-                "locations": locations_detail,  # 这是一个列表
-                "match_score": 0.9,  # 这里可以简化，或者取 Mem0 的最高分
+                "item_name": entry["item_name"],
+                "total_quantity": entry["total_quantity"],
+                "locations": entry["locations"],  # 这是一个列表
+                "match_score": round(score, 3),
             }
         )
-
-    return {"results": final_results}
+    return final_results
@@ -1,10 +1,27 @@
 # app/services/chat_service.py
 
+from sqlalchemy import func
 from sqlalchemy.orm import Session
+from typing import List, Optional
 from app import models
+import os
 import uuid
 import json
-from app.core.config import SYSTEM_PROMPT
+from app.services import llm_service, prompt_builder
+from app.services.token_counter import (
+    MESSAGE_OVERHEAD_TOKENS,
+    estimate_tokens,
+    estimate_message_tokens,
+)
+
+# 上下文窗口的 token 预算 (系统提示词 + 摘要 + 历史消息)
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", "3000"))
+# 每次从数据库往回翻多少条历史
+CONTEXT_PAGE_SIZE = 20
+# 每积累多少轮 (一问一答) 未摘要的对话，尝试做一次滚动摘要
+SUMMARY_EVERY_N_TURNS = int(os.getenv("SUMMARY_EVERY_N_TURNS", "5"))
+# 单次摘要最多折叠多少条消息 (老会话第一次摘要时分几次追上，避免 Prompt 过长)
+SUMMARY_MAX_FOLD = 40
 
 
 class ChatService:
@@ -44,16 +61,28 @@ class ChatService:
             content = json.dumps(content, ensure_ascii=False, default=str)
 
         msg = models.ChatMessage(
-            session_id=session_id, role=role, content=content, tool_call_id=tool_call_id
+            session_id=session_id,
+            role=role,
+            content=content,
+            tool_call_id=tool_call_id,
+            token_count=estimate_tokens(content),
         )
         self.db.add(msg)
         self.db.commit()
         return msg
 
-    def get_context_messages(self, session_id: str, limit: int = 10):
+    def get_context_messages(
+        self,
+        session_id: str,
+        limit: Optional[int] = None,
+        token_budget: Optional[int] = None,
+    ):
         """
         【核心逻辑】构建发给 LLM 的上下文
-        策略：摘要 + 最近 N 条
+        策略：摘要 + 在 token 预算内尽量多的最近消息
+        - token_budget: 默认 CONTEXT_TOKEN_BUDGET
+        - limit: 可选，额外限制最多带几条历史
+        最新的一条消息 (通常就是用户刚说的话) 无论多长都会带上
         """
         session = (
             self.db.query(models.Session)
@@ -61,30 +90,14 @@ class ChatService:
             .first()
         )
 
-        # 1. 取出最近 N 条记录
-        # 注意：倒序取最后10条，然后再正序排回来
-        recent_msgs = (
-            self.db.query(models.ChatMessage)
-            .filter(models.ChatMessage.session_id == session_id)
-            .order_by(models.ChatMessage.id.desc())
-            .limit(limit)
-            .all()
+        recent_msgs, remaining = self._select_recent_messages(
+            session, token_budget, limit
         )
 
         recent_msgs.reverse()  # 翻转为时间正序
 
-        context = []
-
-        # 2. 注入系统提示词 (System Prompt)
-        system_content = SYSTEM_PROMPT
-
-        # 3. 注入摘要 (如果有) - 这就是长期记忆！
-        if session.summary:
-            system_content += f"\n【前情提要】: {session.summary}"
-
-        context.append({"role": "system", "content": system_content})
-
-        # 4. 注入最近对话
+        # 注入最近对话
+        history = []
         for msg in recent_msgs:
             msg_dict = {"role": msg.role, "content": msg.content}
             if msg.tool_call_id:
@@ -96,18 +109,160 @@ class ChatService:
             # V1 简化：假设 assistant 只是纯回复，tool_calls 我们在下一轮 prompt 里可能没法完美复现
             # 但对于"记忆"来说，文本内容最重要。
 
-            context.append(msg_dict)
+            history.append(msg_dict)
 
-        print("Context Messages for LLM:\n", context)
+        # 系统提示词 + 摘要 (长期记忆) + 最近对话，按前缀稳定的顺序组装
+        context = prompt_builder.build_messages(session.summary, history)
+
+        print(
+            f"Context Messages for LLM ({len(recent_msgs)} 条历史, "
+            f"剩余预算 {remaining} tokens):\n",
+            context,
+        )
         return context
 
-    def update_summary(self, session_id: str):
+    def _prefix_tokens(self, session: models.Session) -> int:
+        """系统提示词 + 摘要占用的 token 数"""
+        return sum(
+            estimate_message_tokens(msg["content"])
+            for msg in prompt_builder.build_messages(session.summary, [])
+        )
+
+    def _select_recent_messages(
+        self,
+        session: models.Session,
+        token_budget: Optional[int] = None,
+        limit: Optional[int] = None,
+    ):
         """
-        (高级功能) 调用 LLM 生成摘要并更新 Session
-        可以在每 N 轮对话后触发
+        从最新往回翻，挑出装得进 token 预算的消息
+        已经进了摘要 (id <= 水位线) 的消息不再重复带上
+        返回 (消息列表 [新 -> 旧], 剩余预算)
         """
-        # 这里可以调用 llm_engine 生成摘要
-        pass
+        if token_budget is None:
+            token_budget = CONTEXT_TOKEN_BUDGET
+
+        remaining = token_budget - self._prefix_tokens(session)
+        watermark = session.summary_until_id or 0
+
+        recent_msgs = []
+        last_id = None
+        while limit is None or len(recent_msgs) < limit:
+            query = self.db.query(models.ChatMessage).filter(
+                models.ChatMessage.session_id == session.id,
+                models.ChatMessage.id > watermark,
+            )
+            if last_id is not None:
+                query = query.filter(models.ChatMessage.id < last_id)
+            page = (
+                query.order_by(models.ChatMessage.id.desc())
+                .limit(CONTEXT_PAGE_SIZE)
+                .all()
+            )
+            if not page:
+                break
+
+            full = False
+            for msg in page:
+                # 老数据没有 token_count，现场估算
+                cost = (
+                    msg.token_count or estimate_tokens(msg.content)
+                ) + MESSAGE_OVERHEAD_TOKENS
+                if recent_msgs and (
+                    cost > remaining or (limit is not None and len(recent_msgs) >= limit)
+                ):
+                    full = True
+                    break
+                recent_msgs.append(msg)
+                remaining -= cost
+
+            if full or len(page) < CONTEXT_PAGE_SIZE:
+                break
+            last_id = page[-1].id
+
+        return recent_msgs, remaining
+
+    def needs_summary(self, session_id: str) -> bool:
+        """水位线之后积累的消息是否已经够 N 轮，值得做一次摘要"""
+        session = (
+            self.db.query(models.Session)
+            .filter(models.Session.id == session_id)
+            .first()
+        )
+        if not session:
+            return False
+
+        pending = (
+            self.db.query(func.count(models.ChatMessage.id))
+            .filter(
+                models.ChatMessage.session_id == session_id,
+                models.ChatMessage.id > (session.summary_until_id or 0),
+            )
+            .scalar()
+        )
+        return pending >= SUMMARY_EVERY_N_TURNS * 2
+
+    def update_summary(self, session_id: str) -> bool:
+        """
+        滚动摘要：把已经滑出上下文窗口、但还没进摘要的消息合并进 Session.summary
+
+        以 summary_until_id 为水位线，同一批消息只会被摘要一次；
+        多个进程同时执行时，只有水位线没被别人推进过的那次写入生效
+        返回是否更新了摘要
+        """
+        session = (
+            self.db.query(models.Session)
+            .filter(models.Session.id == session_id)
+            .first()
+        )
+        if not session:
+            return False
+
+        watermark = session.summary_until_id or 0
+
+        # 1. 算出当前上下文窗口，窗口之前、水位线之后的消息就是要折叠的
+        window, _ = self._select_recent_messages(session)
+        if not window:
+            return False
+        window_start_id = window[-1].id
+
+        to_fold: List[models.ChatMessage] = (
+            self.db.query(models.ChatMessage)
+            .filter(
+                models.ChatMessage.session_id == session_id,
+                models.ChatMessage.id > watermark,
+                models.ChatMessage.id < window_start_id,
+            )
+            .order_by(models.ChatMessage.id.asc())
+            .limit(SUMMARY_MAX_FOLD)
+            .all()
+        )
+        if not to_fold:
+            return False
+
+        # 2. 调 LLM 合并摘要
+        new_summary = llm_service.summarize_conversation(
+            session.summary,
+            [{"role": msg.role, "content": msg.content} for msg in to_fold],
+        )
+
+        # 3. 条件更新：水位线没变才写入 (CAS)，保证幂等
+        updated = (
+            self.db.query(models.Session)
+            .filter(
+                models.Session.id == session_id,
+                func.coalesce(models.Session.summary_until_id, 0) == watermark,
+            )
+            .update(
+                {"summary": new_summary, "summary_until_id": to_fold[-1].id},
+                synchronize_session=False,
+            )
+        )
+        self.db.commit()
+
+        if updated:
+            print(f"📝 会话 {session_id} 摘要已更新，覆盖到消息 {to_fold[-1].id}")
+        return bool(updated)
 
     def ensure_session(self, session_id: str):
         """
@@ -0,0 +1,209 @@
+# app/services/fast_parser.py
+"""
+本地快速解析器 (规则版)
+大部分输入都是固定句式："买了3瓶可乐放冰箱"、"喝了1瓶可乐"、"苹果在哪"，
+这类句子用正则就能准确解析，不必每次都调用 LLM。
+
+parse() 返回带置信度的结构化结果，调用方只在置信度 >= FAST_PARSE_THRESHOLD 时直接使用，
+否则仍走 LLM。识别不了的一律返回 None (宁可漏判，不要误判)。
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from typing import Optional
+
+# 低于该置信度的结果交给 LLM 处理
+FAST_PARSE_THRESHOLD = float(os.getenv("FAST_PARSE_THRESHOLD", "0.9"))
+
+# 意图，与 llm_service.classify_intent 的分类保持一致
+INTENT_ADD = "ADD"
+INTENT_USE = "USE"
+INTENT_QUERY = "QUERY"
+
+_CN_DIGITS = {
+    "零": 0, "一": 1, "二": 2, "两": 2, "三": 3, "四": 4,
+    "五": 5, "六": 6, "七": 7, "八": 8, "九": 9,
+}  # fmt: skip
+
+UNITS = [
+    "公斤", "千克", "毫升", "个", "瓶", "箱", "袋", "包", "盒", "罐", "斤", "克",
+    "升", "支", "根", "块", "条", "张", "件", "双", "只", "本", "台", "卷", "板",
+    "桶", "听", "片", "颗", "粒", "把", "套", "份", "提", "打", "串", "捆", "盆",
+]  # fmt: skip
+
+_NUM = r"(?P<qty>\d+(?:\.\d+)?|[零一二两三四五六七八九十百半]+)"
+_UNIT = r"(?P<unit>" + "|".join(UNITS) + ")"
+_ITEM = r"(?P<name>[一-龥A-Za-z0-9]{1,15}?)"
+_LOC = r"(?P<loc>[一-龥A-Za-z0-9]{1,15}?)"
+_PREFIX = r"(?:我)?(?:刚刚|刚|今天|昨天|又)?"
+_TAIL = r"(?:了|啦|哈)?[。！!~～]*"
+
+_ADD_VERBS = r"(?:新买了|买了|买|购入了|囤了|带回了|收到了|到了)"
+_PUT_VERBS = r"(?:存放在|放在了|放在|放到了|放到|放进了|放进|放了|放|搁在|搁|存在|收在)"
+_USE_VERBS = r"(?:喝掉了|吃掉了|用掉了|扔掉了|喝了|吃了|用了|扔了|消耗了)"
+_QUERY_TAILS = (
+    r"(?:放哪了|放哪儿了|放在哪|在哪里|在哪儿|在哪|在什么地方|还有多少|还有几"
+    + _UNIT.replace("?P<unit>", "?:")
+    + r"|还有吗|还有没有|有多少)"
+)
+
+# 句式按优先级排列：越具体的越靠前
+_ADD_WITH_LOC = re.compile(
+    rf"{_PREFIX}{_ADD_VERBS}(?:{_NUM}{_UNIT})?{_ITEM}[，,]?{_PUT_VERBS}{_LOC}(?:里面|里|上面|上|下面|下)?{_TAIL}"
+)
+_ADD_NO_LOC = re.compile(rf"{_PREFIX}{_ADD_VERBS}(?:{_NUM}{_UNIT})?{_ITEM}{_TAIL}")
+_USE = re.compile(rf"{_PREFIX}{_USE_VERBS}(?:{_NUM}{_UNIT})?{_ITEM}{_TAIL}")
+_QUERY = re.compile(rf"{_ITEM}{_QUERY_TAILS}(?:呀|啊|呢|了)?[?？]*")
+_QUERY_FIND = re.compile(r"(?:帮我)?(?:找一下|找找|找)" + _ITEM + r"[?？。]*")
+
+# 出现这些内容说明句子不是简单句式 (多任务、指代、修正)，交给 LLM
+_REJECT_TEXT = re.compile(r"[；;]|然后|并且|而且|还买了|不是|错了|改成")
+# 录入 / 消耗句以语气词结尾是在提问或商量 ("买了3瓶可乐吗"、"喝了2瓶可乐吧")，不是在陈述
+# (查询句 "大米还有吗" 不受影响，它在查询句式里单独处理)
+_MODAL_TAIL = re.compile(r"[吗吧呢嘛没][?？。！!~～]*$")
+_REJECT_NAME = re.compile(r"[和与跟及、，,]|^(?:它|这个|那个|这些|那些|东西|啥|什么)$")
+# 物品名 / 位置里混进了动词、介词，说明句子后面还有别的成分 ("可乐给奶奶"、"苹果在厨房")，正则切分错位
+# 包 只在夹在中间时算动词 ("猪肉包饺子")，"面包"、"包子"、"书包" 不受影响
+_SUSPICIOUS_NAME = re.compile(r"放|买|喝|吃|用|扔|在|给|送|做|到|(?<=.)包..")
+# 物品名只是数量 + 单位 ("喝了三瓶")，或以单位 / 量词开头 ("用了个苹果"、"喝了点水"、"喝了一半可乐")：
+# 数量没切出来或者根本不是物品，交给 LLM 结合上下文理解
+_MEASURE_NAME = re.compile(
+    rf"^{_NUM}{_UNIT}$|^(?:{'|'.join(UNITS)}|点|半|些|几|一半|一点|一些|一口|口$)"
+)
+
+
+@dataclass
+class ParseResult:
+    intent: str  # ADD / USE / QUERY
+    name: str
+    quantity: Optional[float] = None
+    unit: Optional[str] = None
+    location: Optional[str] = None
+    confidence: float = 0.0
+
+    @property
+    def confident(self) -> bool:
+        return self.confidence >= FAST_PARSE_THRESHOLD
+
+    def to_item_info(self) -> dict:
+        """转成与 llm_service.extract_item_info 相同的结构"""
+        return {
+            "name": self.name,
+            "quantity": self.quantity if self.quantity is not None else 1,
+            "unit": self.unit or "个",
+            "location": self.location,
+            "category": None,
+        }
+
+
+def parse_chinese_number(text: str) -> Optional[float]:
+    """
+    解析数量："3"、"2.5"、"三"、"两"、"十二"、"二十"、"半"
+    只支持 1000 以内，解析不了返回 None
+    """
+    if re.fullmatch(r"\d+(?:\.\d+)?", text):
+        return float(text)
+    if text == "半":
+        return 0.5
+
+    total, current = 0, 0
+    for ch in text:
+        if ch in _CN_DIGITS:
+            current = _CN_DIGITS[ch]
+        elif ch == "十":
+            total += (current or 1) * 10
+            current = 0
+        elif ch == "百":
+            total += (current or 1) * 100
+            current = 0
+        else:
+            return None
+    total += current
+    return float(total) if total > 0 else None
+
+
+def _clean_name(name: Optional[str]) -> Optional[str]:
+    if not name:
+        return None
+    name = name.strip()
+    if _REJECT_NAME.search(name) or _SUSPICIOUS_NAME.search(name) or _MEASURE_NAME.search(name):
+        return None
+    return name
+
+
+def _quantity(match: re.Match) -> Optional[float]:
+    qty = match.groupdict().get("qty")
+    if not qty:
+        return None
+    return parse_chinese_number(qty)
+
+
+def parse(text: str) -> Optional[ParseResult]:
+    """
+    解析一句话，识别不了返回 None
+    """
+    text = (text or "").strip()
+    if not text or len(text) > 40 or _REJECT_TEXT.search(text):
+        return None
+    statement = not _MODAL_TAIL.search(text)
+
+    # --- 录入 (带位置) ---
+    match = statement and _ADD_WITH_LOC.fullmatch(text)
+    if match:
+        name = _clean_name(match.group("name"))
+        location = _clean_name(match.group("loc"))
+        qty = _quantity(match)
+        if name and location and (qty is not None or not match.group("qty")):
+            return ParseResult(
+                intent=INTENT_ADD,
+                name=name,
+                quantity=qty,
+                unit=match.group("unit"),
+                location=location,
+                # 数量单位齐全时最可靠
+                confidence=0.97 if qty is not None else 0.9,
+            )
+
+    # --- 录入 (不带位置) ---
+    match = statement and _ADD_NO_LOC.fullmatch(text)
+    if match:
+        name = _clean_name(match.group("name"))
+        qty = _quantity(match)
+        if name and qty is not None:
+            return ParseResult(
+                intent=INTENT_ADD,
+                name=name,
+                quantity=qty,
+                unit=match.group("unit"),
+                # 物品名一直吃到句尾，后面跟着的别的成分 ("可乐送人") 也会被算进名字，
+                # 只有名字够短时才有把握
+                confidence=0.9 if len(name) <= 4 else 0.8,
+            )
+        if name:
+            # "买了可乐"：没数量也没位置，信息太少，交给 LLM 结合上下文判断
+            return ParseResult(intent=INTENT_ADD, name=name, confidence=0.7)
+
+    # --- 消耗 ---
+    match = statement and _USE.fullmatch(text)
+    if match:
+        name = _clean_name(match.group("name"))
+        qty = _quantity(match)
+        if name and (qty is not None or not match.group("qty")):
+            return ParseResult(
+                intent=INTENT_USE,
+                name=name,
+                quantity=qty if qty is not None else 1,
+                unit=match.group("unit"),
+                # "吃了饭"、"喝了可乐"：没有数量时扣 1 只是猜测，交给 LLM 结合上下文判断
+                confidence=0.95 if qty is not None else 0.8,
+            )
+
+    # --- 查询 ---
+    match = _QUERY.fullmatch(text) or _QUERY_FIND.fullmatch(text)
+    if match:
+        name = _clean_name(match.group("name"))
+        if name:
+            return ParseResult(intent=INTENT_QUERY, name=name, confidence=0.95)
+
+    return None
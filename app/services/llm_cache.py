@@ -0,0 +1,190 @@
+# app/services/llm_cache.py
+"""
+LLM 结果缓存
+同一句话 (归一化后) + 同一版本的 Prompt + 同一个模型，结果直接复用，不再调用 DeepSeek
+
+后端可插拔 (环境变量 LLM_CACHE_BACKEND)：
+- memory: 进程内 LRU + TTL (默认)
+- sql:    存数据库 llm_cache 表 (MySQL / SQLite 都可以)，重启不丢、多 worker 共享
+- none:   关闭缓存
+"""
+
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+import unicodedata
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Callable, Optional
+
+from app.core.metrics import metrics
+
+LLM_CACHE_BACKEND = os.getenv("LLM_CACHE_BACKEND", "memory")
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", str(7 * 24 * 3600)))  # 秒
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", "2048"))
+
+
+def normalize_text(text: str) -> str:
+    """
+    归一化：全角转半角、去掉首尾空白、合并连续空白、英文转小写
+    "买了一箱牛奶放阳台 " 和 "买了一箱牛奶放阳台" 视为同一句
+    """
+    text = unicodedata.normalize("NFKC", text or "")
+    return re.sub(r"\s+", " ", text).strip().lower()
+
+
+class CacheBackend:
+    """缓存后端接口：存取的都是字符串"""
+
+    def get(self, key: str) -> Optional[str]:
+        raise NotImplementedError
+
+    def set(self, key: str, namespace: str, value: str, ttl: int):
+        raise NotImplementedError
+
+
+class MemoryCacheBackend(CacheBackend):
+    """进程内 LRU + TTL"""
+
+    def __init__(self, max_entries: int = LLM_CACHE_MAX_ENTRIES):
+        self.max_entries = max_entries
+        self._data: "OrderedDict[str, tuple]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[str]:
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at < time.time():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key: str, namespace: str, value: str, ttl: int):
+        with self._lock:
+            self._data[key] = (value, time.time() + ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+
+class SQLCacheBackend(CacheBackend):
+    """持久化到数据库 llm_cache 表"""
+
+    def get(self, key: str) -> Optional[str]:
+        from app import database, models
+
+        db = database.SessionLocal()
+        try:
+            entry = db.get(models.LLMCacheEntry, key)
+            if entry is None or entry.expires_at < datetime.now():
+                return None
+            return entry.value
+        finally:
+            db.close()
+
+    def set(self, key: str, namespace: str, value: str, ttl: int):
+        from app import database, models
+
+        db = database.SessionLocal()
+        try:
+            db.merge(
+                models.LLMCacheEntry(
+                    cache_key=key,
+                    namespace=namespace,
+                    value=value,
+                    expires_at=datetime.now() + timedelta(seconds=ttl),
+                )
+            )
+            db.commit()
+        finally:
+            db.close()
+
+
+class LLMCache:
+    def __init__(self, backend: Optional[CacheBackend], ttl: int = LLM_CACHE_TTL):
+        self.backend = backend
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(namespace: str, text: str, prompt_version: str, model: str) -> str:
+        raw = "\x1f".join([namespace, prompt_version, model, normalize_text(text)])
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+    def get_or_compute(
+        self,
+        namespace: str,
+        text: str,
+        prompt_version: str,
+        model: str,
+        compute: Callable[[], Any],
+        use_cache: bool = True,
+    ) -> Any:
+        """
+        命中缓存直接返回，否则调用 compute() 并写回缓存
+        - compute 抛异常时不缓存，异常原样抛出
+        - use_cache=False 时跳过读取，但仍然用新结果刷新缓存
+        """
+        if self.backend is None:
+            return compute()
+
+        key = self.make_key(namespace, text, prompt_version, model)
+
+        if use_cache:
+            try:
+                cached = self.backend.get(key)
+            except Exception as e:
+                print(f"⚠️ 读取 LLM 缓存失败: {e}")
+                cached = None
+            if cached is not None:
+                metrics.inc(f"llm_cache.{namespace}.hit")
+                # 外面包一层，保证 None (LLM 明确说无法提取) 也能被缓存
+                return json.loads(cached)["v"]
+            metrics.inc(f"llm_cache.{namespace}.miss")
+        else:
+            metrics.inc(f"llm_cache.{namespace}.bypass")
+
+        value = compute()
+
+        try:
+            self.backend.set(
+                key, namespace, json.dumps({"v": value}, ensure_ascii=False), self.ttl
+            )
+        except Exception as e:
+            print(f"⚠️ 写入 LLM 缓存失败: {e}")
+
+        return value
+
+    def stats(self, namespace: str) -> dict:
+        hits = metrics.get(f"llm_cache.{namespace}.hit")
+        misses = metrics.get(f"llm_cache.{namespace}.miss")
+        total = hits + misses
+        return {
+            "hits": hits,
+            "misses": misses,
+            "bypass": metrics.get(f"llm_cache.{namespace}.bypass"),
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+def _create_backend(name: str) -> Optional[CacheBackend]:
+    if name == "none":
+        return None
+    if name == "sql":
+        return SQLCacheBackend()
+    return MemoryCacheBackend()
+
+
+# 全局单例
+llm_cache = LLMCache(_create_backend(LLM_CACHE_BACKEND))
+
+
+def set_backend(backend: Optional[CacheBackend]):
+    """替换缓存后端 (传 None 关闭缓存)"""
+    llm_cache.backend = backend
@@ -0,0 +1,325 @@
+# app/services/llm_resilience.py
+"""
+LLM 调用的容错包装
+- 截止时间：每次调用 (含重试) 有总的 deadline，不会无限等待
+- 对冲请求：第一个请求超过历史 p95 耗时还没回来，就并行再发一个，谁先回来用谁
+- 重试：只对幂等调用、且是超时/限流/5xx 这类可恢复错误，带随机抖动退避
+- 熔断：连续失败达到阈值后直接快速失败，一段时间后放一个请求试探
+
+所有 chat.completions 调用都是只读的，默认按幂等处理
+"""
+
+import asyncio
+import os
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Any, Awaitable, Callable, Optional
+
+import openai
+
+from app.core.metrics import metrics
+from app.core.tool_registry import TOOL_MAX_WORKERS
+
+LLM_TIMEOUT = float(os.getenv("LLM_TIMEOUT", "30"))  # 单次调用总截止时间 (秒)
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "2"))
+LLM_HEDGE_ENABLED = os.getenv("LLM_HEDGE_ENABLED", "1") == "1"
+# 样本不足时的对冲延迟，以及对冲延迟的上下限
+LLM_HEDGE_DEFAULT_DELAY = float(os.getenv("LLM_HEDGE_DEFAULT_DELAY", "5"))
+LLM_HEDGE_MIN_DELAY = 0.5
+LLM_HEDGE_MIN_SAMPLES = 20
+LLM_BREAKER_THRESHOLD = int(os.getenv("LLM_BREAKER_THRESHOLD", "5"))
+LLM_BREAKER_RESET = float(os.getenv("LLM_BREAKER_RESET", "30"))  # 熔断后多久试探 (秒)
+RETRY_BASE_DELAY = 0.5
+# 同步调用线程池：每个工具线程最多同时占两个 (原请求 + 对冲)，再给接口线程留出余量
+LLM_POOL_SIZE = int(os.getenv("LLM_POOL_SIZE", str(max(32, TOOL_MAX_WORKERS * 2))))
+
+# 可恢复的错误：重试、并计入熔断
+RETRYABLE_ERRORS = (
+    TimeoutError,
+    asyncio.TimeoutError,
+    openai.APITimeoutError,
+    openai.APIConnectionError,
+    openai.RateLimitError,
+    openai.InternalServerError,
+)
+
+
+class CircuitOpenError(RuntimeError):
+    """熔断中，直接拒绝调用"""
+
+
+class QueueTimeoutError(RuntimeError):
+    """请求在线程池里排队到截止时间还没开始执行：是本进程忙不过来，不是 LLM 服务慢，不计入熔断"""
+
+
+class CircuitBreaker:
+    def __init__(
+        self,
+        failure_threshold: int = LLM_BREAKER_THRESHOLD,
+        reset_timeout: float = LLM_BREAKER_RESET,
+    ):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._probing = False
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half_open"
+            return "open"
+
+    def before_call(self) -> bool:
+        """
+        调用前检查：熔断中直接抛 CircuitOpenError；半开状态只放行一个试探请求
+        返回这次调用是不是试探请求 (试探请求结束时必须 record_success / record_failure / release_probe)
+        """
+        with self._lock:
+            if self._opened_at is None:
+                return False
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._probing:
+                metrics.inc("llm_resilience.circuit_rejected")
+                raise CircuitOpenError("LLM 服务暂时不可用 (熔断中)")
+            self._probing = True
+            return True
+
+    def release_probe(self):
+        """试探请求没有结果就结束了 (客户端断开、本地排队超时)：放开，让下一个请求重新试探"""
+        with self._lock:
+            self._probing = False
+
+    def record_success(self):
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._probing or self._failures >= self.failure_threshold:
+                if self._opened_at is None or self._probing:
+                    metrics.inc("llm_resilience.circuit_opened")
+                    print(f"⚠️ LLM 熔断打开 (连续失败 {self._failures} 次)")
+                self._opened_at = time.monotonic()
+                self._probing = False
+
+
+class ResilientCaller:
+    def __init__(
+        self,
+        breaker: CircuitBreaker,
+        timeout: float = LLM_TIMEOUT,
+        max_retries: int = LLM_MAX_RETRIES,
+        hedge_enabled: bool = LLM_HEDGE_ENABLED,
+    ):
+        self.breaker = breaker
+        self.timeout = timeout
+        self.max_retries = max_retries
+        self.hedge_enabled = hedge_enabled
+        # 同步调用的对冲需要并发，放在这个线程池里执行
+        self._executor = ThreadPoolExecutor(max_workers=LLM_POOL_SIZE, thread_name_prefix="llm")
+
+    def hedge_delay(self, endpoint: str) -> float:
+        """对冲延迟：取该 endpoint 最近成功调用耗时的 p95"""
+        p95 = metrics.percentile(
+            f"llm.{endpoint}.latency", 0.95, min_samples=LLM_HEDGE_MIN_SAMPLES
+        )
+        if p95 is None:
+            return LLM_HEDGE_DEFAULT_DELAY
+        return max(LLM_HEDGE_MIN_DELAY, p95)
+
+    @staticmethod
+    def _backoff(attempt: int) -> float:
+        # full jitter
+        return random.uniform(0, RETRY_BASE_DELAY * (2**attempt))
+
+    def record_error(self, endpoint: str, e: Exception) -> bool:
+        """记录一次失败，返回是否可重试"""
+        if isinstance(e, QueueTimeoutError):
+            metrics.inc(f"llm_resilience.{endpoint}.queue_timeouts")
+            self.breaker.release_probe()
+            return False
+        retryable = isinstance(e, RETRYABLE_ERRORS)
+        if retryable:
+            self.breaker.record_failure()
+        else:
+            # 400 这类请求本身的错误说明服务是通的，不算服务降级
+            self.breaker.record_success()
+        if isinstance(e, (TimeoutError, asyncio.TimeoutError, openai.APITimeoutError)):
+            metrics.inc(f"llm_resilience.{endpoint}.timeouts")
+        return retryable
+
+    # ==================== 同步 ====================
+
+    def call(
+        self,
+        endpoint: str,
+        fn: Callable[[float], Any],
+        idempotent: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """
+        执行同步调用
+        fn(timeout) 发起一次请求，timeout 是这次请求剩余可用的秒数
+        """
+        deadline = time.monotonic() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = self._attempt(endpoint, fn, deadline, hedge=idempotent)
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                retryable = self.record_error(endpoint, e)
+                sleep = self._backoff(attempt)
+                if (
+                    not idempotent
+                    or not retryable
+                    or attempt >= self.max_retries
+                    or time.monotonic() + sleep >= deadline
+                ):
+                    raise
+                attempt += 1
+                metrics.inc(f"llm_resilience.{endpoint}.retries")
+                print(f"🔁 LLM 调用失败，{sleep:.2f}s 后重试 ({attempt}): {e}")
+                time.sleep(sleep)
+
+    def _attempt(self, endpoint, fn, deadline, hedge):
+        started = []
+
+        def timed(submitted):
+            start = time.monotonic()
+            # 排队耗时单独统计，不算进 LLM 耗时 (对冲延迟按 LLM 耗时算)
+            metrics.observe(f"llm.{endpoint}.queue_wait", start - submitted)
+            if deadline - start <= 0:
+                # 排队排到了截止时间，调用方已经放弃，不再发请求
+                raise QueueTimeoutError(f"LLM 请求排队超时 ({endpoint})")
+            started.append(start)
+            # 客户端超时 = 剩余时间：调用方放弃后，请求也会在截止时间附近结束并释放线程
+            result = fn(deadline - start)
+            metrics.observe(f"llm.{endpoint}.latency", time.monotonic() - start)
+            return result
+
+        futures = {self._executor.submit(timed, time.monotonic()): False}
+        hedge_delay = self.hedge_delay(endpoint)
+
+        if hedge and self.hedge_enabled and time.monotonic() + hedge_delay < deadline:
+            done, _ = wait(futures, timeout=hedge_delay)
+            if not done:
+                metrics.inc(f"llm_resilience.{endpoint}.hedges_fired")
+                futures[self._executor.submit(timed, time.monotonic())] = True
+
+        last_error: Optional[BaseException] = None
+        pending = set(futures)
+        while pending:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            done, pending = wait(pending, timeout=remaining, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if futures[future]:
+                        metrics.inc(f"llm_resilience.{endpoint}.hedges_won")
+                    return future.result()
+                last_error = future.exception()
+
+        # 还在排队的直接取消；已经发出的请求无法中断，只能等它们自己按 timeout 结束
+        for future in pending:
+            future.cancel()
+        if last_error and not pending:
+            raise last_error
+        if not started:
+            raise QueueTimeoutError(f"LLM 请求排队超时 ({endpoint})")
+        raise TimeoutError(f"LLM 调用超时 ({endpoint})")
+
+    # ==================== 异步 ====================
+
+    async def acall(
+        self,
+        endpoint: str,
+        fn: Callable[[float], Awaitable[Any]],
+        idempotent: bool = True,
+        timeout: Optional[float] = None,
+    ) -> Any:
+        """call 的异步版本，fn(timeout) 返回 awaitable"""
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + (timeout or self.timeout)
+        attempt = 0
+        while True:
+            self.breaker.before_call()
+            try:
+                result = await self._aattempt(endpoint, fn, deadline, hedge=idempotent)
+                self.breaker.record_success()
+                return result
+            except Exception as e:
+                retryable = self.record_error(endpoint, e)
+                sleep = self._backoff(attempt)
+                if (
+                    not idempotent
+                    or not retryable
+                    or attempt >= self.max_retries
+                    or loop.time() + sleep >= deadline
+                ):
+                    raise
+                attempt += 1
+                metrics.inc(f"llm_resilience.{endpoint}.retries")
+                print(f"🔁 LLM 调用失败，{sleep:.2f}s 后重试 ({attempt}): {e}")
+                await asyncio.sleep(sleep)
+
+    async def _aattempt(self, endpoint, fn, deadline, hedge):
+        loop = asyncio.get_running_loop()
+
+        async def timed():
+            start = loop.time()
+            result = await fn(max(deadline - loop.time(), 0.1))
+            metrics.observe(f"llm.{endpoint}.latency", loop.time() - start)
+            return result
+
+        tasks = {asyncio.ensure_future(timed()): False}
+        hedge_delay = self.hedge_delay(endpoint)
+
+        try:
+            if hedge and self.hedge_enabled and loop.time() + hedge_delay < deadline:
+                done, _ = await asyncio.wait(tasks, timeout=hedge_delay)
+                if not done:
+                    metrics.inc(f"llm_resilience.{endpoint}.hedges_fired")
+                    tasks[asyncio.ensure_future(timed())] = True
+
+            last_error: Optional[BaseException] = None
+            pending = set(tasks)
+            while pending:
+                remaining = deadline - loop.time()
+                if remaining <= 0:
+                    break
+                done, pending = await asyncio.wait(
+                    pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        if tasks[task]:
+                            metrics.inc(f"llm_resilience.{endpoint}.hedges_won")
+                        return task.result()
+                    last_error = task.exception()
+
+            if last_error and not pending:
+                raise last_error
+            raise asyncio.TimeoutError(f"LLM 调用超时 ({endpoint})")
+        finally:
+            # 输掉的请求直接取消
+            for task in tasks:
+                if not task.done():
+                    task.cancel()
+
+
+# 全局单例：所有 DeepSeek 调用共用一个熔断器
+breaker = CircuitBreaker()
+resilient = ResilientCaller(breaker)
@@ -4,73 +4,292 @@ LLM服务模块
 使用统一的API配置管理DeepSeek LLM
 """
 
+import os
 import json
-from openai import OpenAI
+from openai import OpenAI, AsyncOpenAI
 from typing import List, Optional, Any, Dict
 from app.core.api_config import APIConfigs
+from app.core.metrics import metrics
+from app.services.llm_cache import llm_cache
+from app.services.llm_resilience import LLM_TIMEOUT, resilient
 
 # 使用统一配置初始化DeepSeek客户端
+# 重试由 llm_resilience 统一负责 (带截止时间、对冲和熔断)，关闭 SDK 自带的重试
 client_config = APIConfigs.get_deepseek_config()
-client = OpenAI(**client_config)
+client = OpenAI(**client_config, max_retries=0)
+# 异步客户端：供 async 路由使用，等待响应期间不占用线程
+async_client = AsyncOpenAI(**client_config, max_retries=0)
 
+# Prompt 版本号：修改对应 Prompt 后记得 +1，旧缓存自动失效
+CLASSIFY_INTENT_PROMPT_VERSION = "v2"
+EXTRACT_ITEM_PROMPT_VERSION = "v2"
+EXTRACT_ITEMS_BATCH_PROMPT_VERSION = "v2"
 
-def classify_intent(text: str):
+# 批量提取时每次 LLM 调用最多塞多少行 / 多少字，超出就切成多批
+BATCH_EXTRACT_MAX_LINES = int(os.getenv("BATCH_EXTRACT_MAX_LINES", "50"))
+BATCH_EXTRACT_MAX_CHARS = int(os.getenv("BATCH_EXTRACT_MAX_CHARS", "3000"))
+
+# 用过的 endpoint 标签 (用于汇总上下文缓存命中率)
+_usage_endpoints = set()
+
+
+def record_usage(endpoint: str, usage: Any):
     """
-    多意图识别分类
-    返回: QUERY, ADD, USE, CHAT
+    记录一次调用的 token 用量
+    DeepSeek 会在 usage 里返回 prompt_cache_hit_tokens / prompt_cache_miss_tokens，
+    用来衡量前缀缓存 (Context Caching) 的命中率
     """
-    prompt = f"""
-    你是一个智能管家。请分析用户的自然语言指令，严格返回以下 4 个单词中的一个：
+    if usage is None:
+        return
+    _usage_endpoints.add(endpoint)
+    metrics.inc(f"llm.{endpoint}.calls")
+    metrics.inc(f"llm.{endpoint}.prompt_tokens", getattr(usage, "prompt_tokens", 0) or 0)
+    metrics.inc(
+        f"llm.{endpoint}.prompt_cache_hit_tokens",
+        getattr(usage, "prompt_cache_hit_tokens", 0) or 0,
+    )
+    metrics.inc(
+        f"llm.{endpoint}.prompt_cache_miss_tokens",
+        getattr(usage, "prompt_cache_miss_tokens", 0) or 0,
+    )
+
+
+def prompt_cache_stats() -> Dict[str, dict]:
+    """按 endpoint 汇总前缀缓存命中率"""
+    stats = {}
+    for endpoint in sorted(_usage_endpoints):
+        hit = metrics.get(f"llm.{endpoint}.prompt_cache_hit_tokens")
+        miss = metrics.get(f"llm.{endpoint}.prompt_cache_miss_tokens")
+        stats[endpoint] = {
+            "calls": metrics.get(f"llm.{endpoint}.calls"),
+            "prompt_tokens": metrics.get(f"llm.{endpoint}.prompt_tokens"),
+            "cache_hit_tokens": hit,
+            "cache_miss_tokens": miss,
+            "hit_rate": hit / (hit + miss) if hit + miss else 0.0,
+        }
+    return stats
+
+
+def _complete(endpoint: str, **params) -> Any:
+    """同步调用 chat.completions (带截止时间/对冲/重试/熔断) 并记录用量"""
+    response = resilient.call(
+        endpoint,
+        lambda timeout: client.chat.completions.create(**params, timeout=timeout),
+    )
+    record_usage(endpoint, response.usage)
+    return response
+
 
-    1. QUERY - 用户在询问位置、数量、或者寻找物品。 (e.g. "在哪?", "还有没?", "找一下X")
-    2. ADD   - 用户在录入新物品，或者归位物品。 (e.g. "买了X", "把X放Y了", "新到了X")
-    3. USE   - 用户在消耗、使用、扔掉物品。 (e.g. "喝了X", "用了X", "X过期扔了")
-    4. CHAT  - 纯闲聊、打招呼、感谢，没有涉及具体物品操作。 (e.g. "你好", "谢谢", "笨蛋")
+# ==================== 固定的指令 Prompt ====================
+# 指令放 system 消息、用户输入放 user 消息，保证每次请求的前缀逐字节一致，
+# 才能命中 DeepSeek 的上下文缓存
 
-    用户输入: "{text}"
+CLASSIFY_INTENT_PROMPT = """
+你是一个智能管家。请分析用户的自然语言指令，严格返回以下 4 个单词中的一个：
+
+1. QUERY - 用户在询问位置、数量、或者寻找物品。 (e.g. "在哪?", "还有没?", "找一下X")
+2. ADD   - 用户在录入新物品，或者归位物品。 (e.g. "买了X", "把X放Y了", "新到了X")
+3. USE   - 用户在消耗、使用、扔掉物品。 (e.g. "喝了X", "用了X", "X过期扔了")
+4. CHAT  - 纯闲聊、打招呼、感谢，没有涉及具体物品操作。 (e.g. "你好", "谢谢", "笨蛋")
+
+用户输入在下一条消息中。只返回分类单词，不要标点。
+"""
+
+EXTRACT_ITEM_PROMPT = """
+从用户输入中提取物品信息。返回 JSON:
+{
+    "name": "物品名",
+    "quantity": 数字,
+    "unit": "单位",
+    "location": "位置",
+    "category": "分类"
+}
+用户输入在下一条消息中。如果无法提取，返回 null。
+"""
+
+EXTRACT_ITEMS_BATCH_PROMPT = """
+用户会发来编了号的多行文本 (例如购物小票)，每行最多描述一种物品。
+逐行提取物品信息，返回 JSON:
+{
+    "items": [
+        {
+            "line": 行号,
+            "name": "物品名",
+            "quantity": 数字,
+            "unit": "单位",
+            "location": "位置",
+            "category": "分类"
+        }
+    ]
+}
+无法提取物品的行不要输出。
+"""
+
+SUMMARIZE_PROMPT = """
+你在帮家庭管家整理对话记忆。请把用户消息中的【已有摘要】和【新增对话】合并成一段新的摘要。
+要求：
+1. 保留物品名称、数量、位置、用户偏好等关键事实，以及还没办完的事。
+2. 去掉寒暄和重复内容，不要编造。
+3. 不超过 300 字，直接输出摘要正文。
+"""
 
-    只返回分类单词，不要标点。
+
+def classify_intent(text: str, use_cache: bool = True):
+    """
+    多意图识别分类
+    返回: QUERY, ADD, USE, CHAT
+    use_cache=False 时强制重新调用 LLM
     """
     try:
-        response = client.chat.completions.create(
-            model=APIConfigs.DEEPSEEK.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,  # 低温度，保证分类准确
+        return llm_cache.get_or_compute(
+            "classify_intent",
+            text,
+            CLASSIFY_INTENT_PROMPT_VERSION,
+            APIConfigs.DEEPSEEK.model,
+            lambda: _classify_intent_llm(text),
+            use_cache=use_cache,
         )
-        return response.choices[0].message.content.strip().upper()
-    except:
+    except Exception as e:
+        print(f"⚠️ 意图识别失败: {e}")
         return "CHAT"  # 默认兜底为闲聊，比较安全
 
 
-def extract_item_info(user_text: str):
+def _classify_intent_llm(text: str) -> str:
+    response = _complete(
+        "classify_intent",
+        model=APIConfigs.DEEPSEEK.model,
+        messages=[
+            {"role": "system", "content": CLASSIFY_INTENT_PROMPT},
+            {"role": "user", "content": text},
+        ],
+        temperature=0.1,  # 低温度，保证分类准确
+    )
+    return response.choices[0].message.content.strip().upper()
+
+
+def extract_item_info(user_text: str, use_cache: bool = True):
     """
     从文本中提取物品信息
     返回: {"name": "...", "quantity": ..., "unit": "...", "location": "...", "category": "..."}
-    """
-    prompt = f"""
-    从文本中提取物品信息。返回 JSON:
-    {{
-        "name": "物品名",
-        "quantity": 数字,
-        "unit": "单位",
-        "location": "位置",
-        "category": "分类"
-    }}
-    用户输入: "{user_text}"
-    如果无法提取，返回 null。
+    use_cache=False 时强制重新调用 LLM
     """
     try:
-        response = client.chat.completions.create(
-            model=APIConfigs.DEEPSEEK.model,
-            messages=[{"role": "user", "content": prompt}],
-            temperature=0.1,
-            response_format={"type": "json_object"},
+        return llm_cache.get_or_compute(
+            "extract_item_info",
+            user_text,
+            EXTRACT_ITEM_PROMPT_VERSION,
+            APIConfigs.DEEPSEEK.model,
+            lambda: _extract_item_info_llm(user_text),
+            use_cache=use_cache,
         )
-        return json.loads(response.choices[0].message.content)
-    except:
+    except Exception as e:
+        print(f"⚠️ 物品信息提取失败: {e}")
         return None
 
 
+def _extract_item_info_llm(user_text: str):
+    response = _complete(
+        "extract_item_info",
+        model=APIConfigs.DEEPSEEK.model,
+        messages=[
+            {"role": "system", "content": EXTRACT_ITEM_PROMPT},
+            {"role": "user", "content": user_text},
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+    )
+    return json.loads(response.choices[0].message.content)
+
+
+def chunk_lines(
+    lines: List[str],
+    max_lines: int = BATCH_EXTRACT_MAX_LINES,
+    max_chars: int = BATCH_EXTRACT_MAX_CHARS,
+) -> List[List[str]]:
+    """把多行文本切成若干批，每批行数和总字数都不超过上限"""
+    chunks, current, size = [], [], 0
+    for line in lines:
+        if current and (len(current) >= max_lines or size + len(line) > max_chars):
+            chunks.append(current)
+            current, size = [], 0
+        current.append(line)
+        size += len(line)
+    if current:
+        chunks.append(current)
+    return chunks
+
+
+def extract_items_batch(lines: List[str], use_cache: bool = True) -> List[Optional[dict]]:
+    """
+    批量提取物品信息：一次 LLM 调用处理一批行 (例如一整张购物小票)
+    返回与 lines 等长的列表，每个元素的结构同 extract_item_info，无法提取的行为 None
+    """
+    results: List[Optional[dict]] = []
+    for chunk in chunk_lines(lines):
+        try:
+            extracted = llm_cache.get_or_compute(
+                "extract_items_batch",
+                "\n".join(chunk),
+                EXTRACT_ITEMS_BATCH_PROMPT_VERSION,
+                APIConfigs.DEEPSEEK.model,
+                lambda: _extract_items_batch_llm(chunk),
+                use_cache=use_cache,
+            )
+        except Exception as e:
+            print(f"⚠️ 批量提取失败: {e}")
+            extracted = [None] * len(chunk)
+        results.extend(extracted)
+    return results
+
+
+def _extract_items_batch_llm(lines: List[str]) -> List[Optional[dict]]:
+    numbered = "\n".join(f"{i}. {line}" for i, line in enumerate(lines))
+    response = _complete(
+        "extract_items_batch",
+        model=APIConfigs.DEEPSEEK.model,
+        messages=[
+            {"role": "system", "content": EXTRACT_ITEMS_BATCH_PROMPT},
+            {"role": "user", "content": numbered},
+        ],
+        temperature=0.1,
+        response_format={"type": "json_object"},
+    )
+    data = json.loads(response.choices[0].message.content) or {}
+
+    # 按行号放回原位，LLM 漏掉或编造的行号都忽略
+    results: List[Optional[dict]] = [None] * len(lines)
+    for item in data.get("items") or []:
+        line_no = item.pop("line", None)
+        if isinstance(line_no, int) and 0 <= line_no < len(lines) and item.get("name"):
+            results[line_no] = item
+    return results
+
+
+def summarize_conversation(previous_summary: Optional[str], messages: List[Dict]) -> str:
+    """
+    滚动摘要：把旧摘要和新滑出上下文窗口的消息合并成一段新摘要
+    messages: [{"role": "...", "content": "..."}]
+    """
+    transcript = "\n".join(
+        f"{'用户' if msg['role'] == 'user' else '管家'}: {msg['content']}"
+        for msg in messages
+        if msg.get("content")
+    )
+    user_content = (
+        f"【已有摘要】\n{previous_summary or '无'}\n\n【新增对话】\n{transcript}"
+    )
+    response = _complete(
+        "summarize",
+        model=APIConfigs.DEEPSEEK.model,
+        messages=[
+            {"role": "system", "content": SUMMARIZE_PROMPT},
+            {"role": "user", "content": user_content},
+        ],
+        temperature=0.1,
+    )
+    return response.choices[0].message.content.strip()
+
+
 def generate_natural_response(user_text: str, action_type: str, data: Any):
     """
     生成自然语言回复
@@ -102,7 +321,8 @@ def generate_natural_response(user_text: str, action_type: str, data: Any):
     print("User Content for LLM:\n", user_content)
 
     try:
-        response = client.chat.completions.create(
+        response = _complete(
+            "natural_response",
             model=APIConfigs.DEEPSEEK.model,
             messages=[
                 {"role": "system", "content": system_prompt},
@@ -111,33 +331,45 @@ def generate_natural_response(user_text: str, action_type: str, data: Any):
             temperature=0.7,
         )
         return response.choices[0].message.content
-    except:
+    except Exception as e:
+        print(f"⚠️ 生成回复失败: {e}")
         return "好的，处理完了。"
 
 
-def chat(messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) -> Any:
+def _build_chat_params(
+    messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None
+) -> Dict[str, Any]:
+    """构造 chat 接口的请求参数 (同步/异步共用)"""
+    params = {
+        "model": APIConfigs.DEEPSEEK.model,
+        "messages": messages,
+        "temperature": 0.1,
+    }
+
+    # 只有当传入工具时，才添加 tools 参数
+    if tools:
+        params["tools"] = tools
+        params["tool_choice"] = "auto"
+
+    return params
+
+
+def chat(
+    messages: List[Dict[str, str]],
+    tools: Optional[List[Dict]] = None,
+    endpoint: str = "chat",
+) -> Any:
     """
     统一的对话接口
 
     :param messages: 对话历史 [{"role": "user", "content": "..."}]
     :param tools: 工具定义 (JSON Schema 列表)
+    :param endpoint: 用量统计的标签
     :return: LLM 的响应消息对象 (包含 content 和 tool_calls)
     """
     try:
-        # 构造参数字典
-        params = {
-            "model": APIConfigs.DEEPSEEK.model,
-            "messages": messages,
-            "temperature": 0.1,
-        }
-
-        # 只有当传入工具时，才添加 tools 参数
-        if tools:
-            params["tools"] = tools
-            params["tool_choice"] = "auto"
-
         # 调用大模型
-        response = client.chat.completions.create(**params)
+        response = _complete(endpoint, **_build_chat_params(messages, tools))
 
         # 返回 message 对象 (包含 content, tool_calls 等)
         return response.choices[0].message
@@ -145,3 +377,102 @@ def chat(messages: List[Dict[str, str]], tools: Optional[List[Dict]] = None) ->
     except Exception as e:
         print(f"❌ LLM 调用失败: {str(e)}")
         raise e
+
+
+async def achat(
+    messages: List[Dict[str, str]],
+    tools: Optional[List[Dict]] = None,
+    endpoint: str = "chat",
+) -> Any:
+    """
+    chat 的异步版本 (基于 AsyncOpenAI)
+    参数和返回值与 chat 完全一致
+    """
+    try:
+        params = _build_chat_params(messages, tools)
+        response = await resilient.acall(
+            endpoint,
+            lambda timeout: async_client.chat.completions.create(
+                **params, timeout=timeout
+            ),
+        )
+        record_usage(endpoint, response.usage)
+        return response.choices[0].message
+
+    except Exception as e:
+        print(f"❌ LLM 调用失败: {str(e)}")
+        raise e
+
+
+async def achat_stream(
+    messages: List[Dict[str, str]],
+    tools: Optional[List[Dict]] = None,
+    endpoint: str = "chat_stream",
+):
+    """
+    流式对话接口 (异步生成器)
+
+    逐段 yield ("token", 文本片段)，最后 yield ("message", 完整消息)
+    完整消息是 dict 格式，包含拼接好的 content 和 tool_calls，可直接追加进 messages
+    """
+    # 流式输出无法对冲和重试 (已经推给用户的 token 收不回来)，只做熔断和超时
+    probe = resilient.breaker.before_call()
+    settled = False
+    try:
+        stream = await async_client.chat.completions.create(
+            **_build_chat_params(messages, tools),
+            stream=True,
+            # 最后一个 chunk 带上 usage，用于统计缓存命中
+            stream_options={"include_usage": True},
+            timeout=LLM_TIMEOUT,
+        )
+
+        content_parts = []
+        tool_calls = {}  # index -> 拼接中的 tool_call
+
+        async for chunk in stream:
+            if getattr(chunk, "usage", None):
+                record_usage(endpoint, chunk.usage)
+            if not chunk.choices:
+                continue
+            delta = chunk.choices[0].delta
+
+            if delta.content:
+                content_parts.append(delta.content)
+                yield "token", delta.content
+
+            # tool_calls 是按 index 分片下发的，需要自己拼起来
+            for tc in delta.tool_calls or []:
+                slot = tool_calls.setdefault(
+                    tc.index,
+                    {
+                        "id": None,
+                        "type": "function",
+                        "function": {"name": "", "arguments": ""},
+                    },
+                )
+                if tc.id:
+                    slot["id"] = tc.id
+                if tc.function:
+                    if tc.function.name:
+                        slot["function"]["name"] += tc.function.name
+                    if tc.function.arguments:
+                        slot["function"]["arguments"] += tc.function.arguments
+
+        message = {"role": "assistant", "content": "".join(content_parts) or None}
+        if tool_calls:
+            message["tool_calls"] = [tool_calls[i] for i in sorted(tool_calls)]
+        resilient.breaker.record_success()
+        settled = True
+        yield "message", message
+
+    except Exception as e:
+        settled = True
+        print(f"❌ LLM 流式调用失败: {str(e)}")
+        resilient.record_error(endpoint, e)
+        raise e
+    finally:
+        # SSE 客户端断开时生成器收到 GeneratorExit / CancelledError (不是 Exception)，
+        # 上面两个分支都不会执行；试探请求必须放开，否则熔断器一直拒绝后续调用
+        if probe and not settled:
+            resilient.breaker.release_probe()
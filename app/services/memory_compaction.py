@@ -0,0 +1,212 @@
+# app/services/memory_compaction.py
+"""
+消耗流水的压缩与保留
+
+每次 consume_item 都会追加一条 "消耗记录" 记忆，时间长了向量库里全是几乎一样的流水，
+检索变慢、存储变大。这个任务把超过保留期的流水按 物品 + 月份 汇总成一条记忆：
+    "2026-09 用了 12 瓶 可乐 (共 8 次)"
+然后删除原始流水
+
+- 汇总记忆的向量 ID 由 (user_id, 物品, 月份, 单位) 确定性生成，同一个月后续再压缩会合并进同一条
+- 可重复执行：汇总记忆里记下最近一次合并的原始 ID，中途失败重跑时不会重复计数
+- 返回压缩前后的集合大小，/debug/metrics 里可以看到最近一次的结果
+
+用法 (建议每天跑一次，例如 cron):
+    python -m app.services.memory_compaction [--days 30]
+"""
+
+import argparse
+import hashlib
+import os
+import re
+import time
+from collections import defaultdict
+from datetime import datetime, timedelta
+from typing import Optional
+
+from app.core.config import m
+from app.core.metrics import metrics
+from app.services import memory_writer
+
+# 超过多少天的消耗流水会被压缩
+CONSUMPTION_RETENTION_DAYS = int(os.getenv("CONSUMPTION_RETENTION_DAYS", "30"))
+# 一次最多读取的流水条数
+COMPACTION_SCAN_LIMIT = int(os.getenv("COMPACTION_SCAN_LIMIT", "100000"))
+
+# 旧流水没有结构化字段，只能从文本里解析: "[2026-09-01 08:00:00] 消耗记录: 用了 2 个 可乐"
+_LOG_PATTERN = re.compile(
+    r"\[(?P<time>\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2})\]\s*消耗记录:\s*用了\s*"
+    r"(?P<quantity>[\d.]+)\s*(?P<unit>\S+)\s+(?P<name>.+)$"
+)
+_TIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+# 最近一次压缩的结果 (stats 使用)
+_last_run: Optional[dict] = None
+
+
+def collection_size() -> Optional[int]:
+    """向量库里的记忆总条数 (拿不到时返回 None)"""
+    collection = getattr(m.vector_store, "collection", None)
+    if collection is not None and hasattr(collection, "count"):
+        return collection.count()
+    info = m.vector_store.col_info()
+    return info.get("count") if isinstance(info, dict) else None
+
+
+def aggregate_id(user_id: str, item_name: str, period: str, unit: str) -> str:
+    return memory_writer.memory_id_for(f"consumption:{user_id}:{item_name}:{period}:{unit}")
+
+
+def parse_log(payload: dict) -> Optional[dict]:
+    """
+    一条消耗流水 -> {"item_name", "quantity", "unit", "time"}
+    优先用结构化字段，旧数据从文本解析；解析不了返回 None (保留原样)
+    """
+    if payload.get("consumed_at") and payload.get("item_name") and payload.get("quantity") is not None:
+        try:
+            return {
+                "item_name": payload["item_name"],
+                "quantity": float(payload["quantity"]),
+                "unit": payload.get("unit") or "个",
+                "time": datetime.strptime(payload["consumed_at"], _TIME_FORMAT),
+            }
+        except ValueError:
+            pass
+
+    match = _LOG_PATTERN.match((payload.get("data") or "").strip())
+    if match is None:
+        return None
+    return {
+        "item_name": payload.get("item_name") or match["name"].strip(),
+        "quantity": float(match["quantity"]),
+        "unit": match["unit"],
+        "time": datetime.strptime(match["time"], _TIME_FORMAT),
+    }
+
+
+def _list_consumption(user_id: str):
+    found = m.vector_store.list(
+        {"user_id": user_id, "type": memory_writer.TYPE_CONSUMPTION}, COMPACTION_SCAN_LIMIT
+    )
+    if found and isinstance(found[0], list):
+        found = found[0]
+    return found
+
+
+def _get(vector_id: str):
+    try:
+        return m.vector_store.get(vector_id)
+    except Exception:
+        # Chroma 查不到时会抛异常
+        return None
+
+
+def _write_aggregate(user_id: str, item_name: str, period: str, unit: str, logs: list):
+    """把一组原始流水合并进 (物品, 月份, 单位) 的汇总记忆"""
+    vector_id = aggregate_id(user_id, item_name, period, unit)
+    existing = _get(vector_id)
+    payload = dict(existing.payload) if existing is not None else {}
+
+    # 上次合并到一半失败：这些原始流水已经计入汇总，只需要删除
+    merged = set(filter(None, (payload.get("last_merged_ids") or "").split(",")))
+    fresh = [log for log in logs if log["id"] not in merged]
+
+    quantity = float(payload.get("quantity", 0)) + sum(log["quantity"] for log in fresh)
+    count = int(payload.get("count", 0)) + len(fresh)
+    text = f"{period} 用了 {quantity:g} {unit} {item_name} (共 {count} 次)"
+
+    now = datetime.now().isoformat()
+    payload.update(
+        {
+            "data": text,
+            "hash": hashlib.md5(text.encode()).hexdigest(),
+            # 按时间排序时汇总记忆排在这个月的位置
+            "created_at": f"{period}-01T00:00:00",
+            "updated_at": now,
+            "user_id": user_id,
+            "type": memory_writer.TYPE_CONSUMPTION,
+            "aggregate": True,
+            "item_name": item_name,
+            "period": period,
+            "quantity": quantity,
+            "unit": unit,
+            "count": count,
+            "last_merged_ids": ",".join(log["id"] for log in logs),
+        }
+    )
+    vector = m.embedding_model.embed(text, "add")
+    memory_writer.upsert_vectors([vector_id], [vector], [payload])
+
+
+def compact(days: int = CONSUMPTION_RETENTION_DAYS, user_id: str = "user_1") -> dict:
+    """
+    把 days 天之前的消耗流水按 物品 + 月份 汇总，删除原始流水
+    返回 {"size_before", "size_after", "compacted", "aggregates", "skipped", "seconds"}
+    """
+    global _last_run
+    start = time.perf_counter()
+    size_before = collection_size()
+    cutoff = datetime.now() - timedelta(days=days)
+
+    groups = defaultdict(list)
+    skipped = 0
+    for mem in _list_consumption(user_id):
+        payload = mem.payload or {}
+        if payload.get("aggregate"):
+            continue
+        log = parse_log(payload)
+        if log is None:
+            skipped += 1
+            continue
+        if log["time"] >= cutoff:
+            continue
+        log["id"] = mem.id
+        # 单位不同的不能相加 ("2 瓶" 和 "1 箱")，分开汇总
+        groups[(log["item_name"], log["time"].strftime("%Y-%m"), log["unit"])].append(log)
+
+    compacted = 0
+    for (item_name, period, unit), logs in groups.items():
+        # 先写汇总再删原始流水：中途失败时重跑，last_merged_ids 保证不重复计数
+        _write_aggregate(user_id, item_name, period, unit, logs)
+        for log in logs:
+            m.vector_store.delete(vector_id=log["id"])
+        compacted += len(logs)
+
+    metrics.inc("memory_compaction.compacted", compacted)
+    _last_run = {
+        "size_before": size_before,
+        "size_after": collection_size(),
+        "compacted": compacted,
+        "aggregates": len(groups),
+        "skipped": skipped,
+        "seconds": time.perf_counter() - start,
+        "finished_at": datetime.now().isoformat(),
+    }
+    print(
+        f"🗜️ 消耗流水压缩：{compacted} 条 -> {len(groups)} 条汇总，"
+        f"集合大小 {_last_run['size_before']} -> {_last_run['size_after']}"
+    )
+    return _last_run
+
+
+def stats() -> dict:
+    """当前集合大小 + 最近一次压缩的结果"""
+    try:
+        size = collection_size()
+    except Exception as e:
+        print(f"⚠️ 读取向量库大小失败: {e}")
+        size = None
+    return {
+        "collection_size": size,
+        "retention_days": CONSUMPTION_RETENTION_DAYS,
+        "compacted_total": metrics.get("memory_compaction.compacted"),
+        "last_run": _last_run,
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="压缩旧的消耗流水记忆")
+    parser.add_argument("--days", type=int, default=CONSUMPTION_RETENTION_DAYS)
+    parser.add_argument("--user", default="user_1")
+    args = parser.parse_args()
+    compact(days=args.days, user_id=args.user)
@@ -0,0 +1,367 @@
+# app/services/memory_outbox.py
+"""
+Mem0 写入发件箱 (Outbox)
+m.add 内部要做一次 LLM 事实提取 + Embedding，动辄几秒，不能放在请求里同步等待。
+
+- enqueue(): 在业务事务里插入一行 memory_outbox，和库存变更一起提交 (要么都成功，要么都没有)
+- 后台 worker 线程批量领取 pending 行写入 Mem0，失败按指数退避重试，超过次数标记 failed
+- 领取用 SELECT ... FOR UPDATE SKIP LOCKED + 租约，多个 worker / 多个进程可以同时跑
+- 每行只生效一次：
+  raw 模式的向量 ID 由 outbox_id 确定性生成，重试只会覆盖同一条；
+  infer 模式把 outbox_id 写进 Mem0 metadata，重新领取的行先查 Mem0 里有没有，有就直接标记完成
+"""
+
+import json
+import os
+import random
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import List, Optional
+
+from sqlalchemy import and_, event, func, or_
+from sqlalchemy.orm import Session
+
+from app import database, models
+from app.core.config import m
+from app.core.metrics import metrics
+from app.services import memory_writer
+from app.services.memory_writer import MODE_INFER, MODE_RAW
+
+# 应用进程内启动的 worker 数，设为 0 时改用独立进程: python -m app.services.memory_outbox
+OUTBOX_WORKERS = int(os.getenv("OUTBOX_WORKERS", "2"))
+OUTBOX_BATCH_SIZE = int(os.getenv("OUTBOX_BATCH_SIZE", "10"))
+OUTBOX_POLL_INTERVAL = float(os.getenv("OUTBOX_POLL_INTERVAL", "2"))  # 秒，空闲时的轮询间隔
+OUTBOX_LEASE_SECONDS = int(os.getenv("OUTBOX_LEASE_SECONDS", "120"))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv("OUTBOX_MAX_ATTEMPTS", "8"))
+OUTBOX_RETRY_BASE = float(os.getenv("OUTBOX_RETRY_BASE", "2"))  # 秒，第 n 次失败后等待 base * 2^(n-1)
+OUTBOX_RETRY_MAX = float(os.getenv("OUTBOX_RETRY_MAX", "600"))
+OUTBOX_RETENTION_DAYS = int(os.getenv("OUTBOX_RETENTION_DAYS", "7"))  # done 行保留天数
+
+STATUS_PENDING = "pending"
+STATUS_PROCESSING = "processing"
+STATUS_DONE = "done"
+STATUS_FAILED = "failed"
+
+# 有新行提交时叫醒空闲的 worker，不用等到下一次轮询
+_wakeup = threading.Event()
+# session.info 里的键：是否已挂上提交 / 回滚监听、本事务登记了几条
+_LISTENING_KEY = "memory_outbox.listening"
+_PENDING_KEY = "memory_outbox.pending"
+_stop = threading.Event()
+_threads: List[threading.Thread] = []
+
+
+# --- 写入端 ---
+
+
+def enqueue(
+    db: Session,
+    text: str,
+    metadata: Optional[dict] = None,
+    user_id: str = "user_1",
+    mode: str = MODE_INFER,
+):
+    """
+    在当前事务里登记一条待写入 Mem0 的记忆 (不提交，由调用方和业务数据一起 commit)
+    mode: infer (自由文本，走 Mem0 的 LLM 提取) / raw (结构化记录，直接写向量)
+    """
+    memory_writer.check_type(metadata)
+    row = models.MemoryOutbox(
+        user_id=user_id,
+        text=text,
+        metadata_json=json.dumps(metadata or {}, ensure_ascii=False),
+        mode=mode,
+        status=STATUS_PENDING,
+    )
+    db.add(row)
+    # 事务提交后再叫醒 worker，避免 worker 抢在提交前查询扑空
+    # 每个会话只挂一次监听，本事务登记的条数记在 session.info 里，回滚时清零
+    if not db.info.get(_LISTENING_KEY):
+        event.listen(db, "after_commit", _on_commit)
+        event.listen(db, "after_rollback", _on_rollback)
+        db.info[_LISTENING_KEY] = True
+    db.info[_PENDING_KEY] = db.info.get(_PENDING_KEY, 0) + 1
+    return row
+
+
+def _on_commit(session):
+    count = session.info.pop(_PENDING_KEY, 0)
+    if count:
+        metrics.inc("outbox.enqueued", count)
+        _wakeup.set()
+
+
+def _on_rollback(session):
+    # 回滚掉的行不存在了，不用叫醒 worker
+    session.info.pop(_PENDING_KEY, None)
+
+
+# --- 消费端 ---
+
+
+def _backoff(attempts: int) -> float:
+    """第 attempts 次失败后的等待秒数 (带抖动)"""
+    delay = min(OUTBOX_RETRY_MAX, OUTBOX_RETRY_BASE * (2 ** (attempts - 1)))
+    return delay * random.uniform(0.5, 1.0)
+
+
+def claim_batch(worker_id: str, limit: int = OUTBOX_BATCH_SIZE) -> List[dict]:
+    """
+    领取一批待处理的行：pending 且到了可执行时间，或者 processing 但租约已过期 (worker 挂了)
+    SKIP LOCKED 让并发的 worker 各自拿到不同的行
+    """
+    db = database.SessionLocal()
+    try:
+        now = datetime.now()
+        Outbox = models.MemoryOutbox
+        rows = (
+            db.query(Outbox)
+            .filter(
+                or_(
+                    and_(Outbox.status == STATUS_PENDING, Outbox.available_at <= now),
+                    and_(Outbox.status == STATUS_PROCESSING, Outbox.locked_until < now),
+                )
+            )
+            .order_by(Outbox.id)
+            .limit(limit)
+            .with_for_update(skip_locked=True)
+            .all()
+        )
+
+        claimed = []
+        for row in rows:
+            row.status = STATUS_PROCESSING
+            row.locked_by = worker_id
+            row.locked_until = now + timedelta(seconds=OUTBOX_LEASE_SECONDS)
+            row.attempts += 1
+            claimed.append(
+                {
+                    "id": row.id,
+                    "user_id": row.user_id,
+                    "text": row.text,
+                    "metadata": json.loads(row.metadata_json or "{}"),
+                    "mode": row.mode or MODE_INFER,
+                    "attempts": row.attempts,
+                    "created_at": row.created_at,
+                }
+            )
+        db.commit()
+        return claimed
+    except Exception:
+        db.rollback()
+        raise
+    finally:
+        db.close()
+
+
+def _already_written(outbox_id: int) -> bool:
+    """Mem0 里是否已经有这条 outbox 写入的记忆 (上一次写成功了但没来得及标记完成)"""
+    try:
+        # 第二个参数在不同 Mem0 版本里叫 limit / top_k，按位置传
+        found = m.vector_store.list({"outbox_id": outbox_id}, 1)
+    except Exception as e:
+        print(f"⚠️ 查询 Mem0 去重失败，按未写入处理: {e}")
+        return False
+    # 不同向量库返回 [[...]] 或 [...]
+    if found and isinstance(found[0], list):
+        found = found[0]
+    return bool(found)
+
+
+def process_entry(entry: dict):
+    """把一行写进 Mem0，异常直接抛给调用方处理"""
+    metadata = dict(entry["metadata"], outbox_id=entry["id"])
+    if entry["mode"] == MODE_RAW:
+        # 确定性 ID，重复执行就是覆盖，不需要先查
+        memory_writer.write_memory(
+            entry["text"],
+            entry["user_id"],
+            metadata,
+            mode=MODE_RAW,
+            memory_id=memory_writer.memory_id_for(f"outbox:{entry['id']}"),
+        )
+        return
+
+    if entry["attempts"] > 1 and _already_written(entry["id"]):
+        metrics.inc("outbox.deduplicated")
+        return
+    memory_writer.write_memory(entry["text"], entry["user_id"], metadata, mode=MODE_INFER)
+
+
+def _mark_done(worker_id: str, ids: List[int]):
+    """
+    批量标记完成。只更新仍由自己持有的行：
+    租约过期被别人接手的行交给对方处理 (对方会通过 outbox_id 去重)
+    """
+    if not ids:
+        return
+    db = database.SessionLocal()
+    try:
+        Outbox = models.MemoryOutbox
+        db.query(Outbox).filter(
+            Outbox.id.in_(ids),
+            Outbox.locked_by == worker_id,
+            Outbox.status == STATUS_PROCESSING,
+        ).update(
+            {
+                Outbox.status: STATUS_DONE,
+                Outbox.processed_at: datetime.now(),
+                Outbox.locked_by: None,
+                Outbox.locked_until: None,
+                Outbox.last_error: None,
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def _mark_failed(worker_id: str, entry: dict, error: Exception):
+    """失败：还有重试次数就退避后放回 pending，否则标记 failed"""
+    db = database.SessionLocal()
+    try:
+        Outbox = models.MemoryOutbox
+        if entry["attempts"] >= OUTBOX_MAX_ATTEMPTS:
+            status, available_at = STATUS_FAILED, datetime.now()
+            metrics.inc("outbox.failed")
+        else:
+            status = STATUS_PENDING
+            available_at = datetime.now() + timedelta(seconds=_backoff(entry["attempts"]))
+            metrics.inc("outbox.retried")
+        db.query(Outbox).filter(
+            Outbox.id == entry["id"], Outbox.locked_by == worker_id
+        ).update(
+            {
+                Outbox.status: status,
+                Outbox.available_at: available_at,
+                Outbox.locked_by: None,
+                Outbox.locked_until: None,
+                Outbox.last_error: str(error)[:2000],
+            },
+            synchronize_session=False,
+        )
+        db.commit()
+    finally:
+        db.close()
+
+
+def run_once(worker_id: str) -> int:
+    """领取并处理一批，返回处理的行数"""
+    entries = claim_batch(worker_id)
+    done = []
+    for entry in entries:
+        start = time.perf_counter()
+        try:
+            process_entry(entry)
+        except Exception as e:
+            print(f"⚠️ Outbox #{entry['id']} 写入 Mem0 失败 (第 {entry['attempts']} 次): {e}")
+            _mark_failed(worker_id, entry, e)
+            continue
+        metrics.observe("outbox.write", time.perf_counter() - start)
+        metrics.observe("outbox.lag", (datetime.now() - entry["created_at"]).total_seconds())
+        metrics.inc("outbox.done")
+        done.append(entry["id"])
+    _mark_done(worker_id, done)
+    return len(entries)
+
+
+def purge_done(days: int = OUTBOX_RETENTION_DAYS) -> int:
+    """删除已完成超过 days 天的行"""
+    db = database.SessionLocal()
+    try:
+        Outbox = models.MemoryOutbox
+        deleted = (
+            db.query(Outbox)
+            .filter(
+                Outbox.status == STATUS_DONE,
+                Outbox.processed_at < datetime.now() - timedelta(days=days),
+            )
+            .delete(synchronize_session=False)
+        )
+        db.commit()
+        return deleted
+    finally:
+        db.close()
+
+
+def _worker_loop(worker_id: str, purge: bool):
+    print(f"📮 Outbox worker {worker_id} 启动")
+    last_purge = 0.0
+    while not _stop.is_set():
+        try:
+            processed = run_once(worker_id)
+        except Exception as e:
+            print(f"⚠️ Outbox worker {worker_id} 出错: {e}")
+            processed = 0
+
+        if purge and time.time() - last_purge > 3600:
+            try:
+                purge_done()
+            except Exception as e:
+                print(f"⚠️ 清理 Outbox 失败: {e}")
+            last_purge = time.time()
+
+        # 这一批是满的说明还有积压，马上继续；否则等新提交或轮询
+        if processed < OUTBOX_BATCH_SIZE:
+            _wakeup.wait(OUTBOX_POLL_INTERVAL)
+            _wakeup.clear()
+    print(f"📮 Outbox worker {worker_id} 退出")
+
+
+def start_workers(count: int = OUTBOX_WORKERS):
+    """启动后台 worker 线程 (应用启动时调用)"""
+    if count <= 0 or _threads:
+        return
+    _stop.clear()
+    prefix = uuid.uuid4().hex[:8]  # 区分不同进程
+    for i in range(count):
+        thread = threading.Thread(
+            target=_worker_loop,
+            args=(f"{prefix}-{i}", i == 0),
+            name=f"outbox-worker-{i}",
+            daemon=True,
+        )
+        thread.start()
+        _threads.append(thread)
+
+
+def stop_workers(timeout: float = 10):
+    """通知 worker 退出，等待当前批次处理完 (应用关闭时调用)"""
+    _stop.set()
+    _wakeup.set()
+    for thread in _threads:
+        thread.join(timeout)
+    _threads.clear()
+
+
+def stats() -> dict:
+    """各状态的行数 + 处理指标"""
+    db = database.SessionLocal()
+    try:
+        Outbox = models.MemoryOutbox
+        counts = dict(
+            db.query(Outbox.status, func.count(Outbox.id)).group_by(Outbox.status).all()
+        )
+    finally:
+        db.close()
+    return {
+        "workers": len(_threads),
+        "rows": counts,
+        "done": metrics.get("outbox.done"),
+        "retried": metrics.get("outbox.retried"),
+        "failed": metrics.get("outbox.failed"),
+        "deduplicated": metrics.get("outbox.deduplicated"),
+    }
+
+
+if __name__ == "__main__":
+    # 独立进程运行 worker
+    start_workers(max(OUTBOX_WORKERS, 1))
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        stop_workers()
@@ -0,0 +1,119 @@
+# app/services/memory_writer.py
+"""
+Mem0 写入的两条路径
+- infer: m.add，Mem0 先用 LLM 提取事实、和已有记忆比对去重，再写向量库 (适合用户随手记的笔记)
+- raw:   已经是结构化的最终事实 (库存录入记录、消耗流水)，只算 Embedding 直接写向量库，
+         省掉每条一次的 DeepSeek 调用
+
+raw 写入的 payload 与 Mem0 自己写入的格式一致 (data / hash / created_at / user_id + metadata)，
+m.search / m.get_all 照常能查到；不写 Mem0 的 history 表
+"""
+
+import hashlib
+import time
+import uuid
+from datetime import datetime, timezone
+from typing import Optional
+
+from app.core.api_config import APIConfigs
+from app.core.config import m
+from app.core.metrics import metrics
+
+MODE_INFER = "infer"
+MODE_RAW = "raw"
+
+# 记忆类型 (metadata.type)，每条记忆必须带上，检索时按类型分区过滤
+TYPE_ITEM = "item"  # 物品录入记录 (带 item_id)
+TYPE_NOTE = "note"  # 自由文本笔记
+TYPE_CONSUMPTION = "consumption"  # 消耗流水
+MEMORY_TYPES = (TYPE_ITEM, TYPE_NOTE, TYPE_CONSUMPTION)
+
+# raw 写入的向量 ID 由 outbox 行号确定性生成，重试时覆盖同一条，不会重复
+_MEMORY_ID_NAMESPACE = uuid.UUID("6f1c3b1e-2a4d-4c55-9a57-7d0f5b1e8c21")
+
+
+def memory_id_for(key: str) -> str:
+    return str(uuid.uuid5(_MEMORY_ID_NAMESPACE, key))
+
+
+def to_similarity(score) -> float:
+    """
+    向量库返回的 score -> 相似度 (越大越相似，0~1)
+    - local: 本身就是余弦相似度
+    - chroma: Mem0 建的集合用默认的 L2 距离 (平方)，向量已归一化时 相似度 = 1 - d/2
+    """
+    if score is None:
+        return 0.0
+    if APIConfigs.VECTOR_STORE_PROVIDER == "local":
+        return max(0.0, float(score))
+    return max(0.0, 1.0 - float(score) / 2)
+
+
+def check_type(metadata: Optional[dict]):
+    """写入前校验记忆类型，没有类型的记忆会在分区检索时被漏掉"""
+    memory_type = (metadata or {}).get("type")
+    if memory_type not in MEMORY_TYPES:
+        raise ValueError(f"记忆缺少有效的 type (应为 {MEMORY_TYPES} 之一): {memory_type}")
+
+
+def add_raw(text: str, user_id: str, metadata: Optional[dict] = None, memory_id: Optional[str] = None) -> str:
+    """只做 Embedding，直接插入向量库，返回记忆 ID"""
+    memory_id = memory_id or str(uuid.uuid4())
+    payload = dict(metadata or {})
+    payload["data"] = text
+    payload["hash"] = hashlib.md5(text.encode()).hexdigest()
+    payload.setdefault("created_at", datetime.now(timezone.utc).isoformat())
+    payload["updated_at"] = payload["created_at"]
+    payload["user_id"] = user_id
+
+    vector = m.embedding_model.embed(text, "add")
+    m.vector_store.insert(vectors=[vector], ids=[memory_id], payloads=[payload])
+    return memory_id
+
+
+def upsert_vectors(ids, vectors, payloads):
+    """按 ID 覆盖写入 (同一个 ID 重复写只保留最新一条)"""
+    collection = getattr(m.vector_store, "collection", None)
+    if collection is not None and hasattr(collection, "upsert"):
+        # Mem0 的 Chroma insert 用的是 add，已存在的 ID 会被忽略，这里直接 upsert
+        collection.upsert(ids=list(ids), embeddings=[list(v) for v in vectors], metadatas=list(payloads))
+    else:
+        m.vector_store.insert(vectors=vectors, ids=list(ids), payloads=list(payloads))
+
+
+def write_memory(
+    text: str,
+    user_id: str,
+    metadata: Optional[dict] = None,
+    mode: str = MODE_INFER,
+    memory_id: Optional[str] = None,
+):
+    """按 mode 写入一条记忆，记录各路径的耗时"""
+    start = time.perf_counter()
+    if mode == MODE_RAW:
+        add_raw(text, user_id, metadata, memory_id)
+        # 每条 raw 写入省掉一次 Mem0 的事实提取 LLM 调用
+        metrics.inc("memory.llm_calls_saved")
+    else:
+        m.add(text, user_id=user_id, metadata=metadata)
+    metrics.observe(f"memory.write.{mode}", time.perf_counter() - start)
+
+
+def backfill_memory_types(user_id: str = "user_1", limit: int = 100000) -> int:
+    """
+    给分区之前写入的旧记忆补上 type：带 item_id 的算 item，其余算 note
+    (旧的消耗流水本来就带 type=consumption)，返回更新的条数
+    """
+    found = m.vector_store.list({"user_id": user_id}, limit)
+    if found and isinstance(found[0], list):
+        found = found[0]
+
+    updated = 0
+    for mem in found:
+        payload = dict(mem.payload or {})
+        if payload.get("type") in MEMORY_TYPES:
+            continue
+        payload["type"] = TYPE_ITEM if "item_id" in payload else TYPE_NOTE
+        m.vector_store.update(vector_id=mem.id, payload=payload)
+        updated += 1
+    return updated
@@ -0,0 +1,26 @@
+# app/services/prompt_builder.py
+"""
+Prompt 组装
+DeepSeek 会缓存逐字节相同的请求前缀 (命中部分按缓存价计费，首 token 也更快)，
+所以发给 LLM 的内容按 "稳定 -> 易变" 的顺序排列：
+
+1. 系统提示词 SYSTEM_PROMPT (所有请求相同)
+2. 工具 Schema (registry.get_schemas() 冻结后的固定结构，通过 tools 参数发送)
+3. 会话摘要 (每个会话不同，单独一条 system 消息，不再拼进系统提示词)
+4. 历史消息
+"""
+
+from typing import List, Optional
+
+from app.core.config import SYSTEM_PROMPT
+
+SUMMARY_PREFIX = "【前情提要】: "
+
+
+def build_messages(summary: Optional[str], history: List[dict]) -> List[dict]:
+    """按固定顺序组装上下文消息"""
+    messages = [{"role": "system", "content": SYSTEM_PROMPT}]
+    if summary:
+        messages.append({"role": "system", "content": SUMMARY_PREFIX + summary})
+    messages.extend(history)
+    return messages
@@ -0,0 +1,174 @@
+# app/services/reindex.py
+"""
+从 MySQL 重建向量库里的物品记忆 (以数据库为准)
+
+Chroma 被清空、换了 Embedding 模型/维度，或者旧记忆没有 item_id (/debug/memories 显示 "未关联") 时，
+跑一遍就能把每个物品的当前状态重新写进向量库：
+- 按 (items.updated_at, items.id) 键集分页读取，每批一条 SQL 读物品 + 一条 SQL 读库存
+- 每批合并成一次批量 Embedding (CachedEmbedder.embed_batch)
+- 向量 ID 由 item_id 确定性生成，重复跑只会覆盖，不会产生重复记忆
+- 每批处理完把最后一行的 (updated_at, id) 记进 reindex_checkpoints，中断后从断点继续；
+  下次运行只处理之后有变动的物品 (crud.touch_items 会刷新 updated_at)
+
+用法:
+    python -m app.services.reindex [--full] [--batch-size 100]
+"""
+
+import argparse
+import hashlib
+import os
+import time
+from datetime import datetime, timedelta, timezone
+
+from sqlalchemy import and_, func, or_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.config import m
+from app.core.metrics import metrics
+from app.database import SessionLocal
+from app.services import memory_writer
+
+REINDEX_JOB = "items"
+REINDEX_BATCH_SIZE = int(os.getenv("REINDEX_BATCH_SIZE", "100"))
+# 只处理这么多秒之前变动的行：updated_at 只精确到秒，同一秒内稍后提交的行可能排在断点前面而被漏掉
+REINDEX_SAFETY_LAG = int(os.getenv("REINDEX_SAFETY_LAG", "2"))
+MEM0_USER_ID = "user_1"
+
+
+def item_memory_id(item_id: int) -> str:
+    """物品记忆的向量 ID (确定性)"""
+    return memory_writer.memory_id_for(f"item:{item_id}")
+
+
+def render_item(item, records) -> str:
+    """物品 + 库存 -> 记忆文本，例如 "牛奶 (饮品)：冰箱 3 盒、阳台 1 箱" """
+    name = f"{item.name} ({item.category})" if item.category else item.name
+    stock = [
+        f"{location_name} {float(quantity):g} {unit or '个'}"
+        for location_name, quantity, unit in records
+        if quantity and quantity > 0
+    ]
+    if not stock:
+        return f"{name}：已经用完了"
+    return f"{name}：" + "、".join(stock)
+
+
+def _load_checkpoint(db: Session, job: str) -> models.ReindexCheckpoint:
+    checkpoint = db.get(models.ReindexCheckpoint, job)
+    if checkpoint is None:
+        checkpoint = models.ReindexCheckpoint(job=job, last_item_id=0, rows_done=0)
+        db.add(checkpoint)
+        db.commit()
+    return checkpoint
+
+
+def _next_batch(db: Session, checkpoint, cutoff, batch_size: int):
+    """键集分页：(updated_at, id) 严格大于断点，且早于 cutoff"""
+    Item = models.Item
+    query = db.query(Item).filter(Item.updated_at < cutoff)
+    if checkpoint.last_updated_at is not None:
+        query = query.filter(
+            or_(
+                Item.updated_at > checkpoint.last_updated_at,
+                and_(
+                    Item.updated_at == checkpoint.last_updated_at,
+                    Item.id > checkpoint.last_item_id,
+                ),
+            )
+        )
+    return query.order_by(Item.updated_at, Item.id).limit(batch_size).all()
+
+
+def _stock_by_item(db: Session, item_ids):
+    """一条 SQL 读出这批物品的全部库存: {item_id: [(位置名, 数量, 单位)]}"""
+    rows = (
+        db.query(
+            models.Inventory.item_id,
+            models.Location.name,
+            models.Inventory.quantity,
+            models.Inventory.unit,
+        )
+        .join(models.Location, models.Inventory.location_id == models.Location.id)
+        .filter(models.Inventory.item_id.in_(item_ids))
+        .order_by(models.Inventory.item_id, models.Location.name)
+        .all()
+    )
+    stock = {}
+    for item_id, location_name, quantity, unit in rows:
+        stock.setdefault(item_id, []).append((location_name, quantity, unit))
+    return stock
+
+
+def index_batch(db: Session, items) -> int:
+    """把一批物品写进向量库，返回写入条数"""
+    stock = _stock_by_item(db, [item.id for item in items])
+    texts = [render_item(item, stock.get(item.id, [])) for item in items]
+    vectors = m.embedding_model.embed_batch(texts, "add")
+
+    now = datetime.now(timezone.utc).isoformat()
+    payloads = [
+        {
+            "data": text,
+            "hash": hashlib.md5(text.encode()).hexdigest(),
+            "created_at": now,
+            "updated_at": now,
+            "user_id": MEM0_USER_ID,
+            "type": memory_writer.TYPE_ITEM,
+            "item_id": item.id,
+            "source": "reindex",
+        }
+        for item, text in zip(items, texts)
+    ]
+    memory_writer.upsert_vectors([item_memory_id(item.id) for item in items], vectors, payloads)
+    return len(items)
+
+
+def run(full: bool = False, batch_size: int = REINDEX_BATCH_SIZE, job: str = REINDEX_JOB) -> dict:
+    """
+    增量重建；full=True 时清掉断点从头开始
+    返回 {"indexed": 本次写入条数, "batches": 批数, "seconds": 耗时}
+    """
+    db = SessionLocal()
+    start = time.perf_counter()
+    indexed = batches = 0
+    try:
+        checkpoint = _load_checkpoint(db, job)
+        if full:
+            checkpoint.last_updated_at = None
+            checkpoint.last_item_id = 0
+            db.commit()
+
+        # 以数据库时钟为准，避免应用服务器和 MySQL 时区/时钟不一致
+        cutoff = db.query(func.now()).scalar() - timedelta(seconds=REINDEX_SAFETY_LAG)
+        while True:
+            items = _next_batch(db, checkpoint, cutoff, batch_size)
+            if not items:
+                break
+            indexed += index_batch(db, items)
+            batches += 1
+
+            # 向量写成功之后才推进断点：中断时最多重做一批 (覆盖写入，结果一样)
+            checkpoint.last_updated_at = items[-1].updated_at
+            checkpoint.last_item_id = items[-1].id
+            checkpoint.rows_done += len(items)
+            db.commit()
+            metrics.inc("reindex.items", len(items))
+            print(f"🔁 已重建 {indexed} 个物品 (断点 {checkpoint.last_updated_at} / #{checkpoint.last_item_id})")
+
+        checkpoint.finished_at = datetime.now()
+        db.commit()
+    finally:
+        db.close()
+
+    seconds = time.perf_counter() - start
+    print(f"✅ 重建完成：{indexed} 个物品，{batches} 批，耗时 {seconds:.1f}s")
+    return {"indexed": indexed, "batches": batches, "seconds": seconds}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="从 MySQL 重建向量库里的物品记忆")
+    parser.add_argument("--full", action="store_true", help="忽略断点，全部重建")
+    parser.add_argument("--batch-size", type=int, default=REINDEX_BATCH_SIZE)
+    args = parser.parse_args()
+    run(full=args.full, batch_size=args.batch_size)
@@ -0,0 +1,117 @@
+# app/services/search_cache.py
+"""
+搜索结果缓存 (business.logic_search_item)
+聊天里同一个 "X在哪" 几分钟内常常会被再问一遍，结果直接复用，不再走 Mem0 + MySQL
+
+缓存本身是进程内的 LRU，正确性靠数据库里的版本号保证，多个 worker 各自缓存也不会读到旧数据：
+- 每条结果记下涉及物品的 items.revision (库存变动时由 crud.touch_items 自增)
+- 以及当时的物品目录代数 MAX(items.id) (新物品可能让原来搜不到的词能搜到了)
+- 命中时用一条 SQL 查出这些物品当前的 revision 和 MAX(id)，有任何变化就作废
+
+Mem0 新写入的记忆也可能改变语义搜索结果，这部分靠 TTL 兜底
+"""
+
+import json
+import os
+from typing import Callable
+
+from sqlalchemy import func, or_
+from sqlalchemy.orm import Session
+
+from app import models
+from app.core.metrics import metrics
+from app.services.llm_cache import MemoryCacheBackend, normalize_text
+
+SEARCH_CACHE_ENABLED = os.getenv("SEARCH_CACHE_ENABLED", "1") == "1"
+SEARCH_CACHE_TTL = int(os.getenv("SEARCH_CACHE_TTL", "600"))  # 秒
+SEARCH_CACHE_MAX_ENTRIES = int(os.getenv("SEARCH_CACHE_MAX_ENTRIES", "1024"))
+
+
+def _catalog_max_id(db: Session, user_id: int):
+    return (
+        db.query(func.max(models.Item.id))
+        .filter(models.Item.user_id == user_id)
+        .scalar_subquery()
+    )
+
+
+class SearchCache:
+    def __init__(self, max_entries: int = SEARCH_CACHE_MAX_ENTRIES, ttl: int = SEARCH_CACHE_TTL):
+        self.backend = MemoryCacheBackend(max_entries)
+        self.ttl = ttl
+
+    @staticmethod
+    def make_key(user_id: int, query: str) -> str:
+        return f"{user_id}\x1f{normalize_text(query)}"
+
+    @staticmethod
+    def snapshot(db: Session, user_id: int, item_ids=()) -> dict:
+        """
+        一条 SQL 读出 物品目录代数 + 指定物品的 revision
+        返回 {"catalog": MAX(id), "revisions": {item_id: revision}}
+        """
+        Item = models.Item
+        rows = (
+            db.query(Item.id, Item.revision)
+            .filter(or_(Item.id.in_(list(item_ids)), Item.id == _catalog_max_id(db, user_id)))
+            .all()
+        )
+        # MAX(id) 那一行一定是返回结果里 id 最大的
+        catalog = max((row.id for row in rows), default=0)
+        item_ids = set(item_ids)
+        return {
+            "catalog": catalog,
+            "revisions": {str(row.id): row.revision for row in rows if row.id in item_ids},
+        }
+
+    def get_or_compute(
+        self, db: Session, user_id: int, query: str, compute: Callable[[dict], list]
+    ) -> list:
+        """
+        命中且仍然有效时直接返回，否则调用 compute(revisions) 并写回缓存
+        compute 需要把结果里每个物品 *读库存之前* 读到的 revision 填进 revisions
+        (先读版本号再读数据：数据若在中间被改，缓存的版本号是旧的，下次校验会作废，不会反过来)
+        """
+        if not SEARCH_CACHE_ENABLED:
+            return compute({})
+
+        key = self.make_key(user_id, query)
+        cached = self.backend.get(key)
+        if cached is not None:
+            entry = json.loads(cached)
+            current = self.snapshot(db, user_id, [int(i) for i in entry["revisions"]])
+            if current == {"catalog": entry["catalog"], "revisions": entry["revisions"]}:
+                metrics.inc("search_cache.hit")
+                return entry["results"]
+            metrics.inc("search_cache.stale")
+        else:
+            metrics.inc("search_cache.miss")
+
+        # 目录代数同样要在计算之前读
+        catalog = self.snapshot(db, user_id)["catalog"]
+        revisions = {}
+        results = compute(revisions)
+        entry = {
+            "catalog": catalog,
+            "revisions": {str(k): v for k, v in revisions.items()},
+            "results": results,
+        }
+        self.backend.set(key, "search", json.dumps(entry, ensure_ascii=False), self.ttl)
+        return results
+
+    def stats(self) -> dict:
+        hits = metrics.get("search_cache.hit")
+        stale = metrics.get("search_cache.stale")
+        misses = metrics.get("search_cache.miss")
+        total = hits + stale + misses
+        return {
+            "enabled": SEARCH_CACHE_ENABLED,
+            "hits": hits,
+            "stale": stale,
+            "misses": misses,
+            "hit_rate": hits / total if total else 0.0,
+        }
+
+
+# 全局单例
+search_cache = SearchCache()
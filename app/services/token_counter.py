@@ -0,0 +1,31 @@
+# app/services/token_counter.py
+"""
+Token 数估算
+不引入额外的分词器依赖，按 DeepSeek 官方给出的换算比例估算：
+1 个中文字符 ≈ 0.6 token，1 个英文字符 / 数字 / 符号 ≈ 0.3 token
+"""
+
+import math
+import re
+
+CJK_TOKENS_PER_CHAR = 0.6
+OTHER_TOKENS_PER_CHAR = 0.3
+
+# 每条消息除正文外的固定开销 (role、分隔符等)
+MESSAGE_OVERHEAD_TOKENS = 4
+
+_CJK = re.compile(r"[　-〿㐀-䶿一-鿿＀-￯]")
+
+
+def estimate_tokens(text: str) -> int:
+    """估算一段文本的 token 数 (向上取整)"""
+    if not text:
+        return 0
+    cjk = len(_CJK.findall(text))
+    other = len(text) - cjk
+    return math.ceil(cjk * CJK_TOKENS_PER_CHAR + other * OTHER_TOKENS_PER_CHAR)
+
+
+def estimate_message_tokens(content: str) -> int:
+    """估算一条消息占用的 token 数 (含固定开销)"""
+    return estimate_tokens(content) + MESSAGE_OVERHEAD_TOKENS
@@ -1,9 +1,10 @@
 from app.core.tool_registry import registry
-from app.services import business
+from app.services import business, memory_outbox
+from app.services.memory_writer import MODE_RAW, TYPE_CONSUMPTION
 from app import crud
 from sqlalchemy.orm import Session
 from datetime import datetime
-from app.core.config import m
+from app.tools.reply_templates import render_record
 
 
 @registry.register(
@@ -16,6 +17,7 @@ from app.core.config import m
         },
         "required": ["user_text"],
     },
+    response_template=render_record,
 )
 def tool_record(user_text: str, db: Session, **kwargs):
     # 调用业务层
@@ -34,31 +36,43 @@ def tool_record(user_text: str, db: Session, **kwargs):
         },
         "required": ["item_name"],
     },
+    response_template="好的，{message}",
 )
 def tool_consume(item_name: str, db: Session, quantity: float = 1, **kwargs):
     """
     消耗物品工具
     1. 调用数据库扣减库存
-    2. 在 Mem0 记录行为日志
+    2. 在 Mem0 记录行为日志 (登记到 outbox，与扣减同一个事务提交)
     """
     print(f"🔧 正在执行消耗: {item_name} - {quantity}")
 
     # 1. 执行数据库扣减
-    result = crud.reduce_inventory(db, item_name, quantity)
+    result = crud.reduce_inventory(db, item_name, quantity, commit=False)
 
     # 2. 记录到 Mem0 (行为日志)
     # 这条记录不关联 item_id，只作为一条"事情发生了"的流水账
     # 这样以后问"我什么时候喝了可乐"，Mem0 能搜到
     if result["status"] in ["success", "warning"]:
         timestamp = datetime.now().strftime("%Y-%m-%d %H:%M:%S")
-        log_text = f"[{timestamp}] 消耗记录: 用了 {quantity} 个 {item_name}"
+        unit = result.get("unit") or "个"
+        log_text = f"[{timestamp}] 消耗记录: 用了 {float(quantity):g} {unit} {item_name}"
 
-        m.add(
+        # 流水账是确定的事实，不需要 Mem0 再做 LLM 提取
+        # 数量 / 单位 / 时间单独存一份，压缩任务 (memory_compaction.py) 按它们汇总
+        memory_outbox.enqueue(
+            db,
             log_text,
-            user_id="user_1",
-            metadata={"type": "consumption", "item_name": item_name},
+            metadata={
+                "type": TYPE_CONSUMPTION,
+                "item_name": item_name,
+                "quantity": float(quantity),
+                "unit": unit,
+                "consumed_at": timestamp,
+            },
+            mode=MODE_RAW,
         )
 
+    db.commit()
     return result
 
 
@@ -79,6 +93,7 @@ def tool_consume(item_name: str, db: Session, quantity: float = 1, **kwargs):
         },
         "required": ["item_name", "new_location"],
     },
+    response_template="好的，{message}",
 )
 def tool_update_location(item_name: str, new_location: str, db: Session, **kwargs):
     print(f"🔧 移动物品: {item_name} -> {new_location}")
@@ -0,0 +1,84 @@
+# app/tools/reply_templates.py
+"""
+工具的回复模板
+结果足够简单时直接拼出给用户的回复，省掉第二轮 LLM 调用
+模板函数签名: (result, args) -> str，返回 None 表示交给 LLM
+"""
+
+
+def format_quantity(quantity) -> str:
+    """5.00 -> "5"，2.50 -> "2.5" """
+    return f"{float(quantity):g}"
+
+
+def render_record(result: dict, args: dict):
+    """record_new_item：录入成功"""
+    if result.get("warning"):
+        return None
+
+    record = result.get("db_record")
+    if result.get("mode") == "inventory_mode" and record:
+        return (
+            f"好的，记下了～{record['location']}里现在有 "
+            f"{format_quantity(record['quantity'])} {record.get('unit') or '个'}"
+            f"{record['item']}。"
+        )
+    # 纯记忆模式：原话已经存进记忆
+    return "好的，我记住了～"
+
+
+def render_search(result: dict, args: dict):
+    """search_item：汇报位置和数量"""
+    items = result.get("results")
+    if not items:
+        return f"家里好像没有找到「{args.get('query')}」的记录，要不要先录入一下？"
+
+    lines = []
+    for item in items:
+        locations = item.get("locations") or []
+        if not locations:
+            lines.append(f"{item['item_name']} 已经用完了，记得补货哦。")
+            continue
+        unit = locations[0].get("unit") or "个"
+        detail = "、".join(
+            f"{loc['location']} {format_quantity(loc['quantity'])} {loc.get('unit') or unit}"
+            for loc in locations
+        )
+        total = format_quantity(item["total_quantity"])
+        if float(item["total_quantity"]) <= 0:
+            lines.append(f"{item['item_name']} 已经用完了（{detail}），记得补货哦。")
+        elif len(locations) == 1:
+            lines.append(f"{item['item_name']} 在{detail}。")
+        else:
+            lines.append(f"{item['item_name']}：{detail}，一共 {total} {unit}。")
+    return "\n".join(lines)
+
+
+def render_consumption_history(result: dict, args: dict):
+    """consumption_history：列出最近几次消耗"""
+    records = result.get("records")
+    if not records:
+        return f"还没有「{args.get('query')}」的消耗记录。"
+    # 语义搜索可能带出不相干的记录，条数多时交给 LLM 挑选
+    if len(records) > 3:
+        return None
+    return "\n".join(
+        f"{(record.get('time') or '')[:10]} {record['text']}".strip() for record in records
+    )
+
+
+def render_location_contents(result: dict, args: dict):
+    """list_location_contents：按子位置分组列出物品"""
+    location = args.get("location")
+    if not result.get("exists"):
+        return f"没有找到叫「{location}」的位置。"
+    records = result.get("records")
+    if not records:
+        return f"{location}里目前没有东西。"
+
+    groups = {}
+    for record in records:
+        groups.setdefault(record["location"], []).append(
+            f"{record['item']} {format_quantity(record['quantity'])} {record.get('unit') or '个'}"
+        )
+    return "\n".join(f"{name}：{'、'.join(items)}" for name, items in groups.items())
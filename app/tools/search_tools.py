@@ -2,6 +2,11 @@ from app.core.tool_registry import registry
 from app.services import business
 from app import crud
 from sqlalchemy.orm import Session
+from app.tools.reply_templates import (
+    render_consumption_history,
+    render_location_contents,
+    render_search,
+)
 
 
 @registry.register(
@@ -12,11 +17,41 @@ from sqlalchemy.orm import Session
         "properties": {"query": {"type": "string", "description": "搜索关键词"}},
         "required": ["query"],
     },
+    response_template=render_search,
 )
 def tool_search(query: str, db: Session, **kwargs):
     return business.logic_search_item(query=query, db=db)
 
 
+@registry.register(
+    name="consumption_history",
+    description="【消耗记录】当用户问某东西上次什么时候用的、最近用了多少时使用。",
+    parameters={
+        "type": "object",
+        "properties": {"query": {"type": "string", "description": "物品名称"}},
+        "required": ["query"],
+    },
+    response_template=render_consumption_history,
+)
+def tool_consumption_history(query: str, **kwargs):
+    return business.logic_consumption_history(query=query)
+
+
+@registry.register(
+    name="list_location_contents",
+    description="【位置清单】当用户问某个位置里有什么东西时使用 (包括里面的柜子、抽屉等子位置)，例如“厨房里都有啥”。",
+    parameters={
+        "type": "object",
+        "properties": {"location": {"type": "string", "description": "位置名称，例如 厨房"}},
+        "required": ["location"],
+    },
+    response_template=render_location_contents,
+)
+def tool_location_contents(location: str, db: Session, **kwargs):
+    records = crud.get_subtree_inventory(db, location_name=location.strip())
+    return {"location": location, "exists": records is not None, "records": records or []}
+
+
 # @registry.register(
 #     name="get_inventory_report",
 #     description="【全局报表】当用户想看全家库存汇总、各分类统计时使用。",
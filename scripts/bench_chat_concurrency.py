@@ -0,0 +1,119 @@
+# scripts/bench_chat_concurrency.py
+"""
+压测：同步 llm_service.chat (线程池) vs 异步 llm_service.achat
+
+在本地起一个假的 OpenAI 兼容接口 (固定延迟)，模拟 DeepSeek 的慢响应，
+比较不同并发数下两条路径的吞吐。
+同步路径使用 40 个线程，对应 Starlette 默认线程池的容量。
+
+用法:
+    python scripts/bench_chat_concurrency.py --latency 1.0 --concurrency 10 100 1000
+"""
+
+import argparse
+import asyncio
+import os
+import socket
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import uvicorn
+from fastapi import FastAPI
+
+# 假的 LLM 服务地址需要在导入 llm_service 之前写进环境变量
+_sock = socket.socket()
+_sock.bind(("127.0.0.1", 0))
+FAKE_PORT = _sock.getsockname()[1]
+_sock.close()
+
+os.environ["DEEPSEEK_BASE_URL"] = f"http://127.0.0.1:{FAKE_PORT}"
+os.environ.setdefault("DEEPSEEK_API_KEY", "bench")
+os.environ.setdefault("QWEN_API_KEY", "bench")
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import llm_service  # noqa: E402
+
+STARLETTE_THREADPOOL_SIZE = 40
+fake_app = FastAPI()
+FAKE_LATENCY = 1.0
+
+
+@fake_app.post("/chat/completions")
+async def fake_completion():
+    await asyncio.sleep(FAKE_LATENCY)
+    return {
+        "id": "bench",
+        "object": "chat.completion",
+        "created": int(time.time()),
+        "model": "deepseek-chat",
+        "choices": [
+            {
+                "index": 0,
+                "finish_reason": "stop",
+                "message": {"role": "assistant", "content": "好的"},
+            }
+        ],
+        "usage": {"prompt_tokens": 10, "completion_tokens": 2, "total_tokens": 12},
+    }
+
+
+def start_fake_llm():
+    config = uvicorn.Config(
+        fake_app, host="127.0.0.1", port=FAKE_PORT, log_level="warning"
+    )
+    server = uvicorn.Server(config)
+    threading.Thread(target=server.run, daemon=True).start()
+    while not server.started:
+        time.sleep(0.05)
+    return server
+
+
+MESSAGES = [{"role": "user", "content": "牛奶在哪"}]
+
+
+def run_sync(concurrency: int) -> float:
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=STARLETTE_THREADPOOL_SIZE) as pool:
+        list(pool.map(lambda _: llm_service.chat(MESSAGES), range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_async(concurrency: int) -> float:
+    start = time.perf_counter()
+    await asyncio.gather(*(llm_service.achat(MESSAGES) for _ in range(concurrency)))
+    return time.perf_counter() - start
+
+
+async def run_all(levels):
+    # AsyncOpenAI 的连接池绑定事件循环，所有轮次在同一个循环里跑
+    for n in levels:
+        sync_cost = await asyncio.to_thread(run_sync, n)
+        async_cost = await run_async(n)
+        print(
+            f"{n:>6} | {sync_cost:>9.2f}s | {n / sync_cost:>10.1f} | "
+            f"{async_cost:>9.2f}s | {n / async_cost:>11.1f}"
+        )
+
+
+def main():
+    global FAKE_LATENCY
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--latency", type=float, default=1.0, help="假 LLM 的响应延迟(秒)")
+    parser.add_argument(
+        "--concurrency", type=int, nargs="+", default=[10, 40, 100, 400, 1000]
+    )
+    args = parser.parse_args()
+    FAKE_LATENCY = args.latency
+
+    start_fake_llm()
+    print(f"假 LLM 延迟 {FAKE_LATENCY}s, 同步线程池 {STARLETTE_THREADPOOL_SIZE} 线程\n")
+    print(f"{'并发':>6} | {'sync 耗时':>10} | {'sync req/s':>10} | {'async 耗时':>10} | {'async req/s':>11}")
+    print("-" * 62)
+
+    asyncio.run(run_all(args.concurrency))
+
+
+if __name__ == "__main__":
+    main()
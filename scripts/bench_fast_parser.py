@@ -0,0 +1,74 @@
+# scripts/bench_fast_parser.py
+"""
+本地快速解析器的覆盖率 / 准确率 / 耗时测试
+
+语料: scripts/fast_parser_corpus.tsv (每行: 期望意图<TAB>句子)
+期望意图为 LLM 的句子应当被解析器放弃 (返回 None 或低置信度)
+
+用法:
+    python scripts/bench_fast_parser.py [--corpus path] [--rounds 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.services import fast_parser  # noqa: E402
+
+DEFAULT_CORPUS = os.path.join(os.path.dirname(__file__), "fast_parser_corpus.tsv")
+
+
+def load_corpus(path):
+    corpus = []
+    with open(path, encoding="utf-8") as f:
+        for line in f:
+            line = line.rstrip("\n")
+            if not line or line.startswith("#"):
+                continue
+            expected, text = line.split("\t", 1)
+            corpus.append((expected, text))
+    return corpus
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--corpus", default=DEFAULT_CORPUS)
+    parser.add_argument("--rounds", type=int, default=2000, help="耗时测试的循环次数")
+    args = parser.parse_args()
+
+    corpus = load_corpus(args.corpus)
+
+    covered, correct, wrong = 0, 0, []
+    for expected, text in corpus:
+        result = fast_parser.parse(text)
+        intent = result.intent if result and result.confident else "LLM"
+        if intent != "LLM":
+            covered += 1
+        if intent == expected:
+            correct += 1
+        else:
+            wrong.append((text, expected, intent, result))
+
+    start = time.perf_counter()
+    for _ in range(args.rounds):
+        for _, text in corpus:
+            fast_parser.parse(text)
+    cost = time.perf_counter() - start
+    per_parse_us = cost / (args.rounds * len(corpus)) * 1e6
+
+    print(f"语料条数: {len(corpus)}  (阈值 {fast_parser.FAST_PARSE_THRESHOLD})")
+    print(f"本地命中: {covered} ({covered / len(corpus):.0%})，其余交给 LLM")
+    print(f"判断正确: {correct} ({correct / len(corpus):.0%})")
+    print(f"平均耗时: {per_parse_us:.1f} µs / 句")
+
+    if wrong:
+        print("\n不一致的句子:")
+        for text, expected, intent, result in wrong:
+            print(f"  {text!r}: 期望 {expected}, 实际 {intent} -> {result}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+# scripts/bench_memory_write.py
+"""
+Mem0 两种写入路径的对比：infer (m.add，LLM 提取 + 去重) vs raw (只做 Embedding 直接写向量)
+
+使用真实配置的 Mem0 (需要 .env 里的 DeepSeek / 千问 Key 和向量库)，
+写入到单独的 user_id (默认 bench_user)，结束后删除。
+统计每种路径的单条耗时 (p50 / p95) 和 Mem0 内部的 LLM 调用次数。
+
+用法:
+    python scripts/bench_memory_write.py [--count 20] [--user bench_user]
+"""
+
+import argparse
+import os
+import sys
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.config import m  # noqa: E402
+from app.services import memory_writer  # noqa: E402
+
+SAMPLES = [
+    "消耗记录: 用了 1 瓶 可乐",
+    "买了 3 袋 牛奶 放在 冰箱",
+    "消耗记录: 用了 2 个 鸡蛋",
+    "买了 1 箱 矿泉水 放在 阳台",
+    "消耗记录: 用了 1 包 纸巾",
+]
+
+
+def count_llm_calls():
+    """包一层 Mem0 的 LLM，统计调用次数"""
+    counter = {"calls": 0}
+    original = m.llm.generate_response
+
+    def wrapped(*args, **kwargs):
+        counter["calls"] += 1
+        return original(*args, **kwargs)
+
+    m.llm.generate_response = wrapped
+    return counter
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    return samples[len(samples) // 2], samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+
+
+def run(mode, count, user_id, counter):
+    counter["calls"] = 0
+    samples = []
+    for i in range(count):
+        # 每条加上序号和时间，避免命中 Embedding 缓存
+        text = f"[{datetime.now():%Y-%m-%d %H:%M:%S}] #{i} {SAMPLES[i % len(SAMPLES)]}"
+        start = time.perf_counter()
+        memory_writer.write_memory(text, user_id, {"type": "bench"}, mode=mode)
+        samples.append(time.perf_counter() - start)
+    p50, p95 = percentiles(samples)
+    print(
+        f"{mode:<6} {count} 条 | 单条 p50 {p50 * 1000:8.1f}ms p95 {p95 * 1000:8.1f}ms"
+        f" | LLM 调用 {counter['calls']} 次 ({counter['calls'] / count:.2f}/条)"
+    )
+    return p50, counter["calls"]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--count", type=int, default=20)
+    parser.add_argument("--user", default="bench_user")
+    args = parser.parse_args()
+
+    counter = count_llm_calls()
+    try:
+        infer_p50, infer_calls = run(memory_writer.MODE_INFER, args.count, args.user, counter)
+        raw_p50, raw_calls = run(memory_writer.MODE_RAW, args.count, args.user, counter)
+        print(
+            f"\nraw 相比 infer：单条耗时降低 {(1 - raw_p50 / infer_p50) * 100:.0f}%，"
+            f"LLM 调用减少 {infer_calls - raw_calls} 次"
+        )
+    finally:
+        m.delete_all(user_id=args.user)
+
+
+if __name__ == "__main__":
+    main()
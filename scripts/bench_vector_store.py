@@ -0,0 +1,188 @@
+# scripts/bench_vector_store.py
+"""
+进程内向量库 (LocalVectorStore) 与 Chroma 的检索耗时对比
+
+随机生成归一化向量 + 模拟 Mem0 的 payload (user_id / type / item_id)，分别测：
+- 写入吞吐
+- 不带过滤 / 带 user_id + type 过滤的 top-5 检索耗时 (p50 / p95)
+- 精确检索的召回率基准 (IVF 近似检索时对比精确结果)
+
+Chroma 部分需要安装 chromadb：
+- 不传 --chroma-host 时使用嵌入式 Chroma (本地目录)
+- 传 --chroma-host/--chroma-port 时连 chromadb 服务端 (与线上部署一致，包含网络往返)
+
+用法:
+    python scripts/bench_vector_store.py [--sizes 1000,100000,1000000] [--dims 1024] [--queries 200]
+                                         [--ivf] [--chroma] [--chroma-host localhost --chroma-port 8001]
+
+注意：1M x 1024 维 float32 约 4GB，内存 / 磁盘不够时用 --dims 256
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.vector_store import LocalVectorStore  # noqa: E402
+
+INSERT_BATCH = 10000
+FILTERS = {"user_id": "user_1", "type": "item"}
+
+
+def make_data(n, dims, seed=0):
+    rng = np.random.default_rng(seed)
+    vectors = rng.standard_normal((n, dims), dtype=np.float32)
+    vectors /= np.linalg.norm(vectors, axis=1, keepdims=True)
+    payloads = [
+        {
+            "user_id": "user_1" if i % 4 else "user_2",
+            "type": ("item", "note", "consumption")[i % 3],
+            "item_id": i % 500,
+            "data": f"memory {i}",
+        }
+        for i in range(n)
+    ]
+    ids = [f"vec-{i}" for i in range(n)]
+    return vectors, payloads, ids
+
+
+def percentiles(samples):
+    samples = sorted(samples)
+    p50 = samples[len(samples) // 2]
+    p95 = samples[min(len(samples) - 1, int(len(samples) * 0.95))]
+    return p50 * 1000, p95 * 1000
+
+
+def time_queries(search, queries):
+    samples = []
+    results = []
+    for q in queries:
+        start = time.perf_counter()
+        results.append(search(q))
+        samples.append(time.perf_counter() - start)
+    return percentiles(samples), results
+
+
+def bench_local(n, dims, vectors, payloads, ids, queries, ivf):
+    path = tempfile.mkdtemp(prefix="bench_local_")
+    try:
+        store = LocalVectorStore(collection_name="bench", path=path, embedding_model_dims=dims)
+        start = time.perf_counter()
+        for i in range(0, n, INSERT_BATCH):
+            store.insert(
+                vectors[i : i + INSERT_BATCH],
+                payloads[i : i + INSERT_BATCH],
+                ids[i : i + INSERT_BATCH],
+            )
+        insert_s = time.perf_counter() - start
+
+        (p50, p95), exact = time_queries(lambda q: store.search("", q, top_k=5), queries)
+        (fp50, fp95), _ = time_queries(
+            lambda q: store.search("", q, top_k=5, filters=FILTERS), queries
+        )
+        print(f"  local   insert {n / insert_s:>10.0f}/s | top5 p50 {p50:7.2f}ms p95 {p95:7.2f}ms"
+              f" | filtered p50 {fp50:7.2f}ms p95 {fp95:7.2f}ms")
+
+        if ivf:
+            from app.core import vector_store
+
+            start = time.perf_counter()
+            store.build_ivf()
+            build_s = time.perf_counter() - start
+            # 让 IVF 在这个规模上生效
+            vector_store.LOCAL_VECTOR_IVF_MIN = min(vector_store.LOCAL_VECTOR_IVF_MIN, n - 1)
+            (p50, p95), approx = time_queries(lambda q: store.search("", q, top_k=5), queries)
+            recall1 = np.mean([bool(a) and a[0].id == e[0].id for a, e in zip(approx, exact)])
+            recall5 = np.mean(
+                [
+                    len({r.id for r in a} & {r.id for r in e}) / max(len(e), 1)
+                    for a, e in zip(approx, exact)
+                ]
+            )
+            print(f"  local+ivf build {build_s:6.1f}s      | top5 p50 {p50:7.2f}ms p95 {p95:7.2f}ms"
+                  f" | recall@1 {recall1:.3f} recall@5 {recall5:.3f}")
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+
+def bench_chroma(n, dims, vectors, payloads, ids, queries, host, port):
+    import chromadb
+
+    path = None
+    if host:
+        client = chromadb.HttpClient(host=host, port=port)
+        label = "chroma(http)"
+    else:
+        path = tempfile.mkdtemp(prefix="bench_chroma_")
+        client = chromadb.PersistentClient(path=path)
+        label = "chroma(embedded)"
+    try:
+        name = f"bench_{n}"
+        try:
+            client.delete_collection(name)
+        except Exception:
+            pass
+        col = client.create_collection(name, metadata={"hnsw:space": "cosine"})
+        batch = min(INSERT_BATCH, client.get_max_batch_size())
+        start = time.perf_counter()
+        for i in range(0, n, batch):
+            col.add(
+                ids=ids[i : i + batch],
+                embeddings=vectors[i : i + batch].tolist(),
+                metadatas=payloads[i : i + batch],
+            )
+        insert_s = time.perf_counter() - start
+
+        where = {"$and": [{k: v} for k, v in FILTERS.items()]}
+        (p50, p95), _ = time_queries(
+            lambda q: col.query(query_embeddings=[q.tolist()], n_results=5), queries
+        )
+        (fp50, fp95), _ = time_queries(
+            lambda q: col.query(query_embeddings=[q.tolist()], n_results=5, where=where),
+            queries,
+        )
+        print(f"  {label:<7} insert {n / insert_s:>10.0f}/s | top5 p50 {p50:7.2f}ms p95 {p95:7.2f}ms"
+              f" | filtered p50 {fp50:7.2f}ms p95 {fp95:7.2f}ms")
+        client.delete_collection(name)
+    finally:
+        if path:
+            shutil.rmtree(path, ignore_errors=True)
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", default="1000,100000,1000000")
+    parser.add_argument("--dims", type=int, default=1024)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--ivf", action="store_true", help="额外测试 IVF 近似检索")
+    parser.add_argument("--chroma", action="store_true", help="同时测试 Chroma")
+    parser.add_argument("--chroma-host", default=None)
+    parser.add_argument("--chroma-port", type=int, default=8000)
+    args = parser.parse_args()
+
+    for n in [int(s) for s in args.sizes.split(",")]:
+        print(f"\n=== {n} vectors x {args.dims} dims ===")
+        vectors, payloads, ids = make_data(n, args.dims)
+        rng = np.random.default_rng(42)
+        # 查询向量取库里向量加噪声，更接近真实的 "相似问题"
+        queries = vectors[rng.integers(0, n, args.queries)] + 0.1 * rng.standard_normal(
+            (args.queries, args.dims), dtype=np.float32
+        )
+
+        bench_local(n, args.dims, vectors, payloads, ids, queries, args.ivf)
+        if args.chroma or args.chroma_host:
+            try:
+                bench_chroma(n, args.dims, vectors, payloads, ids, queries,
+                             args.chroma_host, args.chroma_port)
+            except ImportError:
+                print("  chroma  未安装 chromadb，跳过")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+# scripts/stress_vector_store.py
+"""
+多进程共用进程内向量库 (LocalVectorStore) 的压测：几个进程同时插入 / 删除同一个目录，检查没有写坏
+
+模拟 API 多 worker + outbox / reindex / compaction 命令行进程同时写向量库，结束后校验:
+- 启动时就打开、全程没有重启的实例能看到其它进程的全部写入
+- 新打开的实例回放日志后，每个 id 的向量都是自己写进去的那条 (没有两个进程写进同一行)
+- 一个实例压缩后，其它实例自动重新加载，继续写入也能被别人读到
+
+用法:
+    python scripts/stress_vector_store.py --processes 4 --inserts 700
+"""
+
+import argparse
+import os
+import shutil
+import sys
+import tempfile
+from multiprocessing import Process
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from app.core.vector_store import LocalVectorStore  # noqa: E402
+
+DIMS = 16
+
+
+def parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--processes", type=int, default=4, help="并发写入的进程数")
+    parser.add_argument("--inserts", type=int, default=700, help="每个进程插入的向量数")
+    return parser.parse_args()
+
+
+def vector_of(i: int) -> np.ndarray:
+    return np.random.default_rng(i).standard_normal(DIMS)
+
+
+def deleted(i: int) -> bool:
+    """每个进程插入第 7k 条时删掉前一条"""
+    return (i + 1) % 7 == 0
+
+
+def writer(path: str, worker: int, inserts: int):
+    store = LocalVectorStore("stress", path, DIMS)
+    start = worker * 1_000_000
+    for i in range(start, start + inserts):
+        store.insert([vector_of(i)], [{"user_id": "stress", "n": i}], [f"id{i}"])
+        if deleted(i - 1) and i - 1 >= start:
+            store.delete(f"id{i - 1}")
+
+
+def check(store: LocalVectorStore, processes: int, inserts: int) -> int:
+    """返回不对的 id 数"""
+    bad = 0
+    for worker in range(processes):
+        start = worker * 1_000_000
+        for i in range(start, start + inserts):
+            hit = store.get(f"id{i}")
+            if deleted(i) and i + 1 < start + inserts:
+                bad += hit is not None
+                continue
+            results = store.search(None, vector_of(i), limit=1, filters={"user_id": "stress"})
+            bad += not (results and results[0].id == f"id{i}" and abs(results[0].score - 1) < 1e-5)
+    return bad
+
+
+def main():
+    args = parse_args()
+    path = tempfile.mkdtemp(prefix="stress_vectors_")
+    try:
+        long_lived = LocalVectorStore("stress", path, DIMS)
+        workers = [
+            Process(target=writer, args=(path, w, args.inserts)) for w in range(args.processes)
+        ]
+        for p in workers:
+            p.start()
+        for p in workers:
+            p.join()
+
+        fresh = LocalVectorStore("stress", path, DIMS)
+        fresh.compact()
+        long_lived.insert([vector_of(999_999_999)], [{"user_id": "stress"}], ["after-compact"])
+        reopened = LocalVectorStore("stress", path, DIMS)
+
+        checks = {
+            "常驻实例看到了其它进程的全部写入": check(long_lived, args.processes, args.inserts) == 0,
+            "新实例回放日志后每个向量都正确": check(fresh, args.processes, args.inserts) == 0,
+            "压缩后其它实例继续写入可见": reopened.get("after-compact") is not None,
+        }
+    finally:
+        shutil.rmtree(path, ignore_errors=True)
+
+    for name, ok in checks.items():
+        print(f"{'✅' if ok else '❌'} {name}")
+    if not all(checks.values()):
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()